@@ -6,10 +6,13 @@ import urllib.parse
 import datetime
 from mson import mson
 import bson
+from bson.raw_bson import RawBSONDocument
 
 import re
+import time
 import traceback
 import sys
+import types
 
 
 #  See stackoverflow.com for this.  Excellent.
@@ -18,6 +21,342 @@ class MultiThreadedHTTPServer(ThreadingMixIn, HTTPServer):
     pass
 
 
+#  Threaded engine with a fixed number of worker threads instead of one
+#  per connection (wargs maxWorkers/maxQueue).  Accepted connections wait
+#  for a worker; once maxQueue of them are waiting (0:  as soon as every
+#  worker is busy) the next is turned away with a 503 from the error
+#  handler.  Turning away means reading the request, and a slow client
+#  must not hold up accept() for everyone else, so that is left to a
+#  thread of its own which answers each as its request arrives; when even
+#  it is backed up the connection is simply closed.  A keep-alive
+#  connection does not hold a worker between requests either:  it waits
+#  on a selector of its own (park()) and is queued again when its next
+#  request arrives, regardless of maxQueue since it was already
+#  admitted.  Each connection's handler can see how it got here via the
+#  thread-local poolInfo (shed = True|False, queueMillis = time spent in
+#  the queue).
+class PooledHTTPServer(HTTPServer):
+    shedTimeout = 1.0  # secs we'll wait on a client we are turning away
+    shedQueue = 64     # connections waiting to be turned away
+
+    def __init__(self, server_address, handlerClass, maxWorkers, maxQueue):
+        import threading
+
+        if maxWorkers < 1 or maxQueue < 0:
+            raise ValueError("maxWorkers must be at least 1 and maxQueue at least 0")
+
+        HTTPServer.__init__(self, server_address, handlerClass)
+
+        self.maxWorkers = maxWorkers
+        self.maxQueue = maxQueue
+        self.poolInfo = threading.local()
+        self.startWorkers()
+
+    def startWorkers(self):
+        import queue
+        import threading
+
+        #  requests is not bounded itself:  queued counts the connections
+        #  in it and idle the workers waiting on it, under lock
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.idle = 0
+        self.requests = queue.Queue()
+        self.turnedAway = queue.Queue(self.shedQueue)
+        self.idlers = queue.Queue()
+
+        self.workers = []
+        for n in range(0, self.maxWorkers):
+            t = threading.Thread(target=self.work, name="WebF-worker-%d" % n, daemon=True)
+            t.start()
+            self.workers.append(t)
+        self.shedder = threading.Thread(target=self.shedding, name="WebF-shed", daemon=True)
+        self.shedder.start()
+        self.idler = threading.Thread(target=self.idling, name="WebF-idle", daemon=True)
+        self.idler.start()
+
+    #  Threads do not survive fork(); a worker process (WebF.go with
+    #  workers) starts its own.
+    def forked(self):
+        self.startWorkers()
+
+    def process_request(self, request, client_address):
+        import queue
+        import time
+
+        with self.lock:
+            admit = self.queued < self.idle + self.maxQueue
+            if admit:
+                self.queued += 1
+        if admit:
+            self.requests.put((request, client_address, time.monotonic(), None))
+            return
+
+        try:
+            self.turnedAway.put_nowait((request, client_address))
+        except queue.Full:
+            self.shutdown_request(request)
+
+    #  Turned away connections are answered as their requests arrive;
+    #  one that has sent nothing within shedTimeout is just closed
+    def shedding(self):
+        import queue
+        import selectors
+        import time
+
+        waiting = selectors.DefaultSelector()
+        while True:
+            pending = waiting.get_map()
+            try:
+                item = self.turnedAway.get_nowait() if len(pending) > 0 else self.turnedAway.get()
+            except queue.Empty:
+                item = False
+            if item is None:
+                break
+            if item is not False and len(pending) < self.shedQueue:
+                (request, client_address) = item
+                waiting.register(request, selectors.EVENT_READ, (client_address, time.monotonic() + self.shedTimeout))
+            elif item is not False:
+                self.shutdown_request(item[0])
+
+            for (key, events) in waiting.select(timeout=0.05 if item is False else 0):
+                waiting.unregister(key.fileobj)
+                self.shed(key.fileobj, key.data[0])
+            now = time.monotonic()
+            for key in [key for key in waiting.get_map().values() if key.data[1] < now]:
+                waiting.unregister(key.fileobj)
+                self.shutdown_request(key.fileobj)
+
+    def shed(self, request, client_address):
+        self.poolInfo.shed = True
+        self.poolInfo.queueMillis = 0
+        try:
+            request.settimeout(self.shedTimeout)
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    #  Called by a keep-alive handler done with its request, instead of
+    #  waiting for the next one on this worker.  The connection is left
+    #  open and goes to idling() once the handler has returned.
+    def park(self, handler, timeout):
+        import time
+        self.poolInfo.parked = (handler, time.monotonic() + timeout)
+
+    #  Parked connections are queued for a worker when they turn readable
+    #  (the next request, or the client closing); one still idle at its
+    #  deadline is closed
+    def idling(self):
+        import queue
+        import selectors
+        import time
+
+        waiting = selectors.DefaultSelector()
+        while True:
+            try:
+                item = self.idlers.get_nowait() if len(waiting.get_map()) > 0 else self.idlers.get()
+            except queue.Empty:
+                item = False
+            if item is None:
+                break
+            if item is not False:
+                waiting.register(item[0].connection, selectors.EVENT_READ, item)
+
+            for (key, events) in waiting.select(timeout=0.05 if item is False else 0):
+                waiting.unregister(key.fileobj)
+                handler = key.data[0]
+                with self.lock:
+                    self.queued += 1
+                self.requests.put((handler.request, handler.client_address, time.monotonic(), handler))
+            now = time.monotonic()
+            for key in [key for key in waiting.get_map().values() if key.data[1] < now]:
+                waiting.unregister(key.fileobj)
+                self.closeIdle(key.data[0])
+
+        for key in list(waiting.get_map().values()):
+            self.closeIdle(key.data[0])
+
+    def closeIdle(self, handler):
+        try:
+            handler.resume(True)
+        except Exception:
+            pass
+        finally:
+            self.shutdown_request(handler.request)
+
+    def work(self):
+        import time
+
+        while True:
+            with self.lock:
+                self.idle += 1
+            item = self.requests.get()
+            with self.lock:
+                self.idle -= 1
+                if item is not None:
+                    self.queued -= 1
+            if item is None:
+                break
+            (request, client_address, tq, handler) = item
+
+            self.poolInfo.shed = False
+            self.poolInfo.queueMillis = (time.monotonic() - tq) * 1000.0
+            self.poolInfo.parked = None
+            try:
+                if handler is None:
+                    self.finish_request(request, client_address)
+                else:
+                    handler.resume()
+            except Exception:
+                self.poolInfo.parked = None
+                self.handle_error(request, client_address)
+            finally:
+                if self.poolInfo.parked is not None:
+                    self.idlers.put(self.poolInfo.parked)
+                else:
+                    self.shutdown_request(request)
+
+    #  Connections already queued are served before the workers stop;
+    #  the shed thread finishes turning away the rest on its own, and
+    #  parked keep-alive connections are closed
+    def server_close(self):
+        import queue
+
+        HTTPServer.server_close(self)
+        for t in self.workers:
+            self.requests.put(None)
+        for t in self.workers:
+            t.join()
+        try:
+            self.turnedAway.put_nowait(None)
+        except queue.Full:
+            pass
+        self.idlers.put(None)
+
+
+#  Engine used when wargs "engine" is "asyncio".  It quacks enough like
+#  MultiThreadedHTTPServer (socket, server_address, parent, serve_forever,
+#  shutdown) for WebF to treat them the same.  Each connection is handled
+#  by a WebF.asyncHTTPHandler on the event loop; plain (sync) function
+#  handlers and other user callbacks run on a thread pool executor.
+class AsyncHTTPServer:
+    def __init__(self, server_address, handlerClass, executorThreads=None):
+        import socket
+
+        self.handlerClass = handlerClass
+        self.executorThreads = executorThreads
+        self.socket = socket.create_server(server_address)
+        self.server_address = self.socket.getsockname()[:2]
+        self.sslContext = None   # set by WebF for https
+        self.loop = None
+        self.executor = None
+        self.aserver = None
+        self.active = set()      # connection tasks in progress
+
+    def serve_forever(self):
+        import asyncio
+        try:
+            asyncio.run(self.serveAsync())
+        except asyncio.CancelledError:
+            pass   # shutdown()
+
+    async def serveAsync(self):
+        import asyncio
+        import concurrent.futures
+
+        self.loop = asyncio.get_running_loop()
+        self.executor = concurrent.futures.ThreadPoolExecutor(self.executorThreads)
+        try:
+            self.aserver = await asyncio.start_server(self.handleConnection, sock=self.socket, ssl=self.sslContext)
+            async with self.aserver:
+                try:
+                    await self.aserver.serve_forever()
+                except asyncio.CancelledError:
+                    pass   # shutdown(); let the calls in progress finish
+            if len(self.active) > 0:
+                await asyncio.wait(list(self.active))
+        finally:
+            self.executor.shutdown(wait=False)
+
+    async def handleConnection(self, reader, writer):
+        import asyncio
+
+        task = asyncio.current_task()
+        self.active.add(task)
+        try:
+            await self.handlerClass(self, reader, writer).handleAsync()
+        except Exception:
+            traceback.print_exc()
+        finally:
+            self.active.discard(task)
+            writer.close()
+
+    def shutdown(self):
+        if self.loop is not None and self.aserver is not None:
+            self.loop.call_soon_threadsafe(self.aserver.close)
+
+
+#  File-like wrappers that let code running on an executor thread use an
+#  asyncio stream as rfile/wfile.  Writes are queued onto the loop in
+#  order and drained every highWater bytes (and upon flush()), with the
+#  drain coroutine function given (default: the StreamWriter's own).
+class BlockingReader:
+    def __init__(self, reader, loop):
+        self.reader = reader
+        self.loop = loop
+
+    def wait(self, coro):
+        import asyncio
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def read(self, n=-1):
+        import asyncio
+        if n is None or n < 0:
+            return self.wait(self.reader.read(-1))
+        try:
+            return self.wait(self.reader.readexactly(n))
+        except asyncio.IncompleteReadError as e:
+            return e.partial
+
+    def readline(self, limit=-1):
+        if limit is None or limit < 0:
+            return self.wait(self.reader.readline())
+        return self.wait(self.readlineUpTo(limit))
+
+    async def readlineUpTo(self, limit):
+        line = bytearray()
+        while len(line) < limit and not line.endswith(b'\n'):
+            c = await self.reader.read(1)
+            if not c:
+                break
+            line += c
+        return bytes(line)
+
+
+class BlockingWriter:
+    def __init__(self, writer, loop, highWater=65536, drain=None):
+        self.writer = writer
+        self.loop = loop
+        self.highWater = highWater
+        self.drain = drain if drain is not None else writer.drain
+        self.pending = 0
+
+    def write(self, material):
+        material = bytes(material)
+        self.loop.call_soon_threadsafe(self.writer.write, material)
+        self.pending += len(material)
+        if self.pending >= self.highWater:
+            self.flush()
+        return len(material)
+
+    def flush(self):
+        import asyncio
+        self.pending = 0
+        asyncio.run_coroutine_threadsafe(self.drain(), self.loop).result()
+
+
 class WebF:
 
     helpFuncName = "__help"
@@ -33,18 +372,2042 @@ class WebF:
            return (200, None, None, True)
 
         def next(self):
-            for fname in self.parent.fmap:
+            for fname in list(self.parent.fmap):
                 if False == fname.startswith('__'):
-                    (href,context) = self.parent.fmap[fname]
-                    hh = href(context)
-                    hdoc = hh.help()
-                    hdoc['funcname'] = fname
-                    yield hdoc
+                    spec = self.parent.fspecs.get(fname)
+                    if spec is None:
+                        continue  # deregistered while we were looping
+                    if spec.dynamic:
+                        (href,context) = self.parent.fmap[fname]
+                        hdoc = href(context).help()
+                        hdoc['funcname'] = fname
+                        yield hdoc
+                    else:
+                        # Compiled (and pre-encoded) at registration
+                        yield spec.helpDoc
 
         def end(self):
             pass
 
 
+    metricsFuncName = "__metrics"
+
+    #  One doc, WebF.callMetrics.snapshot(); as json etc. or, for
+    #  Accept: text/plain (as Prometheus asks for it), as Prometheus text.
+    class internalMetrics:
+        def __init__(self, context):
+            self.parent = context['parent']
+
+        def help(self):
+            return {}
+
+        def codecs(self):
+            return {'text/plain': WebF.promWriter}
+
+        def start(self, cmd, hdrs, args, rfile):
+           doc = self.parent.metrics.snapshot()
+           if self.parent.worker is not None:
+               doc['worker'] = self.parent.worker
+           if self.parent.logs is not None:
+               doc['log'] = self.parent.logs.stats()
+           return (200, None, [doc], False)
+
+
+
+    #  Path-segment trie over the registered function names.  Each node
+    #  is a tuple (funcname or None, {segment: node}).  A new trie is
+    #  built from scratch on every register/deregister and swapped in
+    #  as a single reference assignment so in-flight lookups on other
+    #  threads always see a complete table.
+    class routeTable:
+        def __init__(self, names=()):
+            self.root = (None, {})
+            for name in names:
+                self.add(name)
+
+        def add(self, name):
+            node = self.root
+            for seg in name.split('/'):
+                kids = node[1]
+                if seg not in kids:
+                    kids[seg] = (None, {})
+                node = kids[seg]
+
+            # Rebuild the leaf with the name attached; tuples are immutable
+            kids[seg] = (name, node[1])
+
+        def match(self, path):
+            #  Return (funcname, restful) where restful is the remainder
+            #  of the path after the longest matching function name, or
+            #  (None, None) if nothing matches.
+            segs = path.split('/')
+            node = self.root
+            func = None
+            depth = 0
+
+            for i,seg in enumerate(segs):
+                node = node[1].get(seg)
+                if node is None:
+                    break
+                if node[0] is not None:
+                    func = node[0]
+                    depth = i + 1
+
+            if func is None:
+                return (None, None)
+
+            restful = '/'.join(segs[depth:])
+            if restful == "":
+                restful = None
+
+            return (func, restful)
+
+
+
+    #  A doc that carries one or more ready-made encodings of itself,
+    #  keyed by writer format ('json', 'ejson', 'bson').  The writers
+    #  send a matching encoding as-is and otherwise encode the doc as
+    #  usual.  next() can yield material it already has in hand with
+    #     WebF.encodedDoc.wrap('json', b'{"a":1}')
+    #  in which case the doc itself is only decoded if some other format
+    #  was negotiated.
+    class encodedDoc:
+        def __init__(self, doc, fmts=(), encoded=None):
+            self.doc = doc
+            self.enc = dict(encoded) if encoded is not None else {}
+            for fmt in fmts:
+                self.enc[fmt] = WebF.encodedDoc.encode(doc, fmt)
+
+        @staticmethod
+        def wrap(fmt, material):
+            if fmt not in ('json', 'ejson', 'bson'):
+                raise ValueError("unknown encoded format %s" % fmt)
+            if not isinstance(material, bytes):
+                material = bytes(material)   # memoryview, bytearray:  a copy of our own
+            if fmt != 'bson' and not material.endswith(b"\n"):
+                material = material + b"\n"   # json writers delimit with it
+            return WebF.encodedDoc(None, encoded={fmt: material})
+
+        @staticmethod
+        def encode(doc, fmt):
+            if fmt == 'bson':
+                return bson.BSON.encode(doc)
+
+            return mson.encode(doc, mson.MONGO if fmt == 'ejson' else mson.PURE)
+
+        def get(self, fmt):
+            return self.enc.get(fmt)
+
+        def asDoc(self):
+            if self.doc is None:
+                if 'bson' in self.enc:
+                    self.doc = bson.decode(self.enc['bson'])
+                elif 'ejson' in self.enc:
+                    self.doc = mson.parse(bytes(self.enc['ejson']).decode('utf-8'), mson.MONGO)
+                elif 'json' in self.enc:
+                    self.doc = mson.parse(bytes(self.enc['json']).decode('utf-8'), mson.PURE)
+            return self.doc
+
+
+
+    #  The help() of a function compiled once at registration:  the
+    #  required args, expected type name per declared arg, compression and
+    #  cache settings, and the help doc pre-encoded for each output
+    #  format.  Encoding it means a help doc that json or BSON cannot take
+    #  (a set, say) raises in registerFunction() rather than when help is
+    #  asked for.  If help() returns "dynamicHelp":True, nothing is cached
+    #  and help() is called (and compiled) upon every call as before.  Use
+    #  invalidateHelp() to recompile after a function's help changes.
+    class funcSpec:
+        # class -> arg type name as used in help(); anything else is
+        # just the class name (int, dict, datetime, ...).  Read only.
+        typeNames = types.MappingProxyType({
+            str: "string",
+            float: "double",
+            list: "array"
+            })
+
+        def __init__(self, funcHelp, fname=None):
+            self.dynamic = funcHelp.get('dynamicHelp', False) == True
+            self.allowUnknownArgs = funcHelp.get('allowUnknownArgs', False)
+            self.hasArgs = 'args' in funcHelp
+            self.compress = funcHelp.get('compress')   # None: server default
+            self.compressMinBytes = funcHelp.get('compressMinBytes')
+
+            self.reusable = funcHelp.get('reusable', False) == True
+            self.poolSize = funcHelp.get('poolSize')
+            self.poolTimeout = funcHelp.get('poolTimeout', 30)
+
+            self.rateLimit = WebF.rateLimiter.limit(funcHelp.get('rateLimit'))
+
+            # "cache": {"ttl": secs, "maxBytes": n}
+            self.cacheTTL = None
+            self.cacheBytes = None
+            cache = funcHelp.get('cache')
+            if cache is not None and cache is not False:
+                if 'ttl' not in cache:
+                    raise ValueError("help() cache needs a ttl")
+                self.cacheTTL = cache['ttl']
+                self.cacheBytes = int(cache['maxBytes']) if 'maxBytes' in cache else 1024*1024
+
+            # "cursor": {"every": docs, "ttl": secs, "pageSize": docs} or True
+            self.cursorEvery = None
+            self.cursorTTL = None
+            self.cursorPage = None
+            cursor = funcHelp.get('cursor')
+            if cursor is not None and cursor is not False:
+                if cursor is True:
+                    cursor = {}
+                if self.reusable or self.cacheTTL is not None:
+                    raise ValueError("help() cursor cannot be combined with reusable or cache")
+                self.cursorEvery = int(cursor['every']) if 'every' in cursor else 1000
+                self.cursorTTL = cursor['ttl'] if 'ttl' in cursor else 300
+                self.cursorPage = int(cursor['pageSize']) if 'pageSize' in cursor else None
+
+            self.argOrder = []   # (name, req, argtype) in declared order
+            self.declared = set()
+
+            for hargs in funcHelp.get('args', []):
+                self.argOrder.append((hargs['name'], hargs['req'] == "Y", hargs['type']))
+                self.declared.add(hargs['name'])
+
+            self.helpDoc = None
+            if fname is not None and not self.dynamic:
+                hdoc = dict(funcHelp)
+                hdoc['funcname'] = fname
+                self.helpDoc = WebF.encodedDoc(hdoc, ('json','ejson','bson'))
+
+        @staticmethod
+        def typeName(argval):
+            cls = argval.__class__
+            ss = WebF.funcSpec.typeNames.get(cls)
+            if ss is None:
+                ss = cls.__name__
+                if ss == 'Decimal':
+                    ss = "decimal"
+            return ss
+
+        def check(self, webArgs):
+            argerrs = []
+
+            for (name, req, argtype) in self.argOrder:
+                if name not in webArgs:
+                    if req:
+                        argerrs.append({
+                            "errcode":1,
+                            "msg":"req arg not found",
+                            "data":name})
+
+                elif argtype != "any":
+                    # exists: but is it the right type?
+                    ss = WebF.funcSpec.typeName(webArgs[name])
+                    if ss != argtype:
+                        argerrs.append({
+                            "errcode":2,
+                            "msg":"arg has wrong type",
+                            "data": {
+                                "arg": name,
+                                "expected": argtype,
+                                "found": ss
+                                }})
+
+            # Now go the other way:  Check webargs:
+            if self.hasArgs and self.allowUnknownArgs == False:
+                for warg in webArgs:
+                    if warg != '_' and warg not in self.declared:
+                        argerrs.append({
+                            "errcode":2,
+                            "msg":"unknown arg",
+                            "data": {
+                                "arg": warg
+                                }})
+
+            return argerrs
+
+
+
+    #  Instances of a function class that declared "reusable":True in
+    #  help(), kept for call after call instead of constructing one per
+    #  call.  An instance serves one call at a time; acquire() hands out
+    #  an idle one or constructs another, waiting (up to "poolTimeout" in
+    #  help()) for one to come back if maxSize ("poolSize" in help()) are
+    #  already out.  reserve() is the same wait for the asyncio engine,
+    #  on the event loop instead of on a thread.  release() calls the
+    #  instance's reset() (if any) and puts it back; close() calls
+    #  close() (if any) on each instance as it becomes idle.
+    class handlerPool:
+        def __init__(self, hname, context, maxSize=None, first=None):
+            import collections
+            import threading
+
+            self.hname = hname
+            self.context = context
+            self.maxSize = maxSize
+            self.cond = threading.Condition()
+            self.waiters = collections.deque()  # (loop, future) of reserve() calls waiting
+            self.idle = [first] if first is not None else []
+            self.size = len(self.idle)  # instances idle or out
+            self.created = self.size
+            self.acquired = 0
+            self.waits = 0
+            self.waitMillis = 0.0
+            self.maxWaitMillis = 0.0
+            self.closed = False
+
+        #  Under the lock:  an idle instance, True for room to construct
+        #  another (see make()), or None if maxSize are out
+        def take(self):
+            if len(self.idle) > 0:
+                self.acquired += 1
+                return self.idle.pop()
+            if self.maxSize is None or self.size < self.maxSize:
+                self.acquired += 1
+                self.size += 1
+                self.created += 1
+                return True
+            return None
+
+        #  Under the lock:  count a wait that began at t0; returns millis
+        def waited(self, t0):
+            import time
+
+            waited = (time.monotonic() - t0) * 1000.0
+            self.waits += 1
+            self.waitMillis += waited
+            self.maxWaitMillis = max(self.maxWaitMillis, waited)
+            return waited
+
+        #  Returns (instance, millis spent waiting for it); instance is
+        #  None if none came free within timeout secs (None: no limit)
+        def acquire(self, timeout=None):
+            import time
+
+            waited = 0.0
+            with self.cond:
+                item = self.take()
+                if item is None and timeout != 0:
+                    t0 = time.monotonic()
+                    while item is None:
+                        left = None if timeout is None else t0 + timeout - time.monotonic()
+                        if left is not None and left <= 0:
+                            break
+                        self.cond.wait(left)
+                        item = self.take()
+                    waited = self.waited(t0)
+
+            if item is None:
+                return (None, waited)
+            return (self.make(item), waited)
+
+        #  The instance for what take() gave
+        def make(self, item):
+            if item is not True:
+                return item
+            try:
+                return self.hname(self.context)
+            except:
+                self.discard(None)
+                raise
+
+        #  Coroutine:  acquire() without holding a thread, for the asyncio
+        #  engine.  Returns (what take() gave, or None if nothing came free
+        #  within timeout secs, millis waited); the caller make()s it.
+        async def reserve(self, timeout=None):
+            import asyncio
+            import time
+
+            loop = asyncio.get_running_loop()
+            t0 = time.monotonic()
+            while True:
+                with self.cond:
+                    item = self.take()
+                    left = None if timeout is None else t0 + timeout - time.monotonic()
+                    if item is not None or (left is not None and left <= 0):
+                        break
+                    fut = loop.create_future()
+                    self.waiters.append((loop, fut))
+                try:
+                    await asyncio.wait_for(fut, left)
+                except (TimeoutError, asyncio.TimeoutError):
+                    pass
+                except asyncio.CancelledError:
+                    # A wake meant for this call goes to the next one
+                    with self.cond:
+                        if fut.done() and not fut.cancelled():
+                            self.wake()
+                    raise
+                finally:
+                    with self.cond:
+                        if (loop, fut) in self.waiters:
+                            self.waiters.remove((loop, fut))
+
+            with self.cond:
+                waited = self.waited(t0)
+            return (item, waited)
+
+        #  Under the lock:  something came free; tell a thread and a
+        #  reserve() (whichever take()s it first has it)
+        def wake(self):
+            self.cond.notify()
+            if len(self.waiters) > 0:
+                (loop, fut) = self.waiters.popleft()
+                loop.call_soon_threadsafe(WebF.handlerPool.settle, fut)
+
+        @staticmethod
+        def settle(fut):
+            if not fut.done():
+                fut.set_result(None)
+
+        def release(self, handler):
+            mmm = getattr(handler, "reset", None)
+            if callable(mmm):
+                try:
+                    mmm()
+                except Exception:
+                    traceback.print_exc()
+                    self.discard(handler)
+                    return
+
+            with self.cond:
+                if not self.closed:
+                    self.idle.append(handler)
+                    self.wake()
+                    return
+            self.discard(handler)
+
+        #  Forget an instance that will not be coming back
+        def discard(self, handler):
+            with self.cond:
+                self.size -= 1
+                self.wake()
+            if handler is not None:
+                WebF.handlerPool.closeOne(handler)
+
+        @staticmethod
+        def closeOne(handler):
+            mmm = getattr(handler, "close", None)
+            if callable(mmm):
+                try:
+                    mmm()
+                except Exception:
+                    traceback.print_exc()
+
+        def close(self):
+            with self.cond:
+                self.closed = True
+                idle = self.idle
+                self.idle = []
+                self.size -= len(idle)
+            for handler in idle:
+                WebF.handlerPool.closeOne(handler)
+
+        def stats(self):
+            with self.cond:
+                return {"size": self.size, "idle": len(self.idle), "maxSize": self.maxSize,
+                        "created": self.created, "acquired": self.acquired, "waits": self.waits,
+                        "waitMillis": self.waitMillis, "maxWaitMillis": self.maxWaitMillis}
+
+
+
+    #  Token buckets, one per key (e.g. client and function):  a bucket
+    #  holds up to burst tokens, gains rate tokens per second, and a call
+    #  takes one.  Keys are spread over stripes, each with its own lock
+    #  and table, so concurrent checks rarely wait on each other.  Each
+    #  table is kept in order of use; a stripe that fills up forgets its
+    #  least recently used bucket, so memory stays bounded at about
+    #  maxKeys buckets.  The bucket of a key not seen for a while has
+    #  most likely refilled, which is the same as never having seen it.
+    class rateLimiter:
+        stripes = 16
+
+        #  A limit as given in wargs or help():  calls per second, or
+        #  {"rate": calls per second, "burst": calls}.  Returns (rate, burst).
+        @staticmethod
+        def limit(spec):
+            if spec is None or spec is False:
+                return None
+            if isinstance(spec, dict):
+                rate = float(spec['rate'])
+                burst = float(spec['burst']) if 'burst' in spec else max(rate, 1.0)
+            else:
+                rate = float(spec)
+                burst = max(rate, 1.0)
+            if rate <= 0 or burst < 1:
+                raise ValueError("bad rate limit %s" % spec)
+            return (rate, burst)
+
+        def __init__(self, maxKeys=100000):
+            import collections
+            import threading
+
+            self.maxPerStripe = max(1, maxKeys // WebF.rateLimiter.stripes)
+            self.tables = [(collections.OrderedDict(), threading.Lock()) for n in range(0, WebF.rateLimiter.stripes)]   # LRU first
+
+        #  Take a token for key; returns 0 if there was one, otherwise
+        #  the seconds until there will be.
+        def take(self, key, limit):
+            import time
+
+            (rate, burst) = limit
+            (table, lock) = self.tables[hash(key) % WebF.rateLimiter.stripes]
+            now = time.monotonic()
+
+            with lock:
+                bucket = table.get(key)
+                if bucket is None:
+                    if len(table) >= self.maxPerStripe:
+                        table.popitem(last=False)
+                    bucket = [burst, now]  # tokens, when
+                    table[key] = bucket
+                else:
+                    table.move_to_end(key)
+                    bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                    bucket[1] = now
+
+                if bucket[0] >= 1:
+                    bucket[0] -= 1
+                    return 0
+                return (1 - bucket[0]) / rate
+
+        def size(self):
+            return sum([len(table) for (table, lock) in self.tables])
+
+        #  The answer to a call that has to wait secs:  (429, err, hdrs)
+        @staticmethod
+        def refuse(wait):
+            import math
+
+            err = {
+                'errcode': 9,
+                'msg': "call rate limit exceeded"
+                }
+            return (429, err, {'Retry-After': str(int(math.ceil(wait)))})
+
+
+
+    #  Checks every call goes through, in order, before anything else is
+    #  done for it (no args parsed, no function instance constructed).
+    #  A stage is called as
+    #
+    #     stage(caller, command, path, headers, context)
+    #
+    #  with caller as handed to authenticate() and path as requested
+    #  (query string and all), and returns None to pass the call on, or
+    #  (respCode, err) or (respCode, err, hdrs) to have the error handler
+    #  answer it with err, adding hdrs to the response headers.  The
+    #  built-in checks are stages too, always there and first unless a
+    #  stage is registered before one of them:  "shed" (maxQueue),
+    #  "rateLimit" (rateLimit and clientRateLimit), and "headers"
+    #  (matchHeader, with the patterns compiled here).  The chain is a
+    #  tuple replaced upon register/deregister so calls just walk it.
+    class middleware:
+        builtins = ("shed", "rateLimit", "headers")
+
+        def __init__(self, parent, matchHeader=None):
+            self.stages = (
+                ("shed", WebF.middleware.shed, parent),
+                ("rateLimit", WebF.middleware.rateLimit, parent),
+                ("headers", WebF.middleware.headers, WebF.middleware.compileHeaders(matchHeader))
+                )
+
+        def add(self, name, stage, context, before=None):
+            stages = [ss for ss in self.stages]
+            names = [ss[0] for ss in stages]
+
+            if name in names and before is None:
+                stages[names.index(name)] = (name, stage, context)
+            else:
+                if name in names:
+                    del stages[names.index(name)]
+                    names.remove(name)
+                if before is None:
+                    stages.append((name, stage, context))
+                elif before in names:
+                    stages.insert(names.index(before), (name, stage, context))
+                else:
+                    raise ValueError("no middleware stage %s" % before)
+
+            self.stages = tuple(stages)
+
+        def remove(self, name):
+            if name in WebF.middleware.builtins:
+                raise ValueError("middleware stage %s is built in" % name)
+            self.stages = tuple([ss for ss in self.stages if ss[0] != name])
+
+        def names(self):
+            return [ss[0] for ss in self.stages]
+
+        #  matchHeader as (hdrname, (compiled regexp, ...)) pairs, or None
+        @staticmethod
+        def compileHeaders(matchHeader):
+            if matchHeader is None:
+                return None
+            return tuple([(hdrname, tuple([re.compile(rr) for rr in matchHeader[hdrname]]))
+                          for hdrname in matchHeader])
+
+        #  PooledHTTPServer queue was full
+        @staticmethod
+        def shed(caller, command, path, headers, xx):
+            poolInfo = getattr(xx.httpd, "poolInfo", None)
+            if poolInfo is not None and getattr(poolInfo, "shed", False) is True:
+                err = {
+                    'errcode': 12,
+                    'msg': "server busy"
+                    }
+                return (503, err)
+            return None
+
+        #  Server-wide limits:  all calls, and per client IP.  The
+        #  function's own limit from help() is checked once the caller
+        #  is authenticated.
+        @staticmethod
+        def rateLimit(caller, command, path, headers, xx):
+            wait = 0
+            if xx.rate_limit is not None:
+                wait = xx.rateLimiter.take(None, xx.rate_limit)
+            if wait == 0 and xx.client_rate_limit is not None:
+                wait = xx.rateLimiter.take(caller['ip'], xx.client_rate_limit)
+
+            if wait > 0:
+                return WebF.rateLimiter.refuse(wait)
+            return None
+
+        #  Each header must match one of its patterns; the first one
+        #  that does not is the error.
+        @staticmethod
+        def headers(caller, command, path, headers, rules):
+            if rules is None:
+                return None
+            for (hdrname, patterns) in rules:
+                item = headers[hdrname] if hdrname in headers else ""
+                for rr in patterns:
+                    if rr.search(item) is not None:
+                        break
+                else:
+                    err = {
+                        'errcode': 11,
+                        'msg': "header %s value is invalid" % hdrname
+                        }
+                    return (400, err)
+            return None
+
+
+
+    #  The rfile handed to start() on a keep-alive connection, and for
+    #  chunked uploads on any connection.  Reads stop at the end of the
+    #  request body (Content-Length) so a handler can never eat into the
+    #  next request; remaining is what is left unread, or None if the body
+    #  length is unknown.  Transfer-Encoding: chunked is decoded here, so
+    #  handlers see just the body; eof is True once the last chunk is in.
+    class bodyReader:
+        maxDrain = 1024*1024   # more unread than this: just close
+
+        @staticmethod
+        def isChunked(hdrs):
+            te = hdrs['Transfer-Encoding'] if 'Transfer-Encoding' in hdrs else None
+            return te is not None and te.split(',')[-1].strip().lower() == "chunked"
+
+        def __init__(self, rfile, hdrs):
+            self.rfile = rfile
+            self.remaining = 0
+            self.chunked = WebF.bodyReader.isChunked(hdrs)
+            self.chunkLeft = 0      # unread bytes of the current chunk
+            self.pending = bytearray()   # decoded but not yet read
+            self.chunks = 0
+            self.eof = False
+            if 'Transfer-Encoding' in hdrs:
+                self.remaining = None
+            elif 'Content-Length' in hdrs:
+                self.remaining = int(hdrs['Content-Length'])
+
+        def nextChunk(self):
+            if self.chunks > 0:
+                self.rfile.readline(3)   # CRLF that ends the previous chunk
+            line = self.rfile.readline(1024)
+            if not line:
+                raise WebF.badBody("upload ended without the last chunk")
+            try:
+                size = int(line.split(b';')[0].strip(), 16)
+            except ValueError:
+                raise WebF.badBody("bad chunk size %r" % line[0:32])
+            if size < 0:
+                raise WebF.badBody("bad chunk size %r" % line[0:32])
+            self.chunks += 1
+            if size == 0:
+                while self.rfile.readline(65537) not in (b'\r\n', b'\n', b''):
+                    pass   # trailers; nobody asked
+                self.eof = True
+            self.chunkLeft = size
+
+        #  Decode (up to 64K) more of a chunked body into pending; False
+        #  if there is no more.
+        def fill(self):
+            while self.chunkLeft == 0 and not self.eof:
+                self.nextChunk()
+            if self.eof:
+                return False
+            data = self.rfile.read(min(self.chunkLeft, 65536))
+            if not data:
+                raise WebF.badBody("upload ended in the middle of a chunk")
+            self.chunkLeft -= len(data)
+            self.pending += data
+            return True
+
+        def take(self, n):
+            data = bytes(self.pending[:n])
+            del self.pending[:n]
+            return data
+
+        def read(self, n=-1):
+            if self.chunked:
+                while (n is None or n < 0 or len(self.pending) < n) and self.fill():
+                    pass
+                return self.take(len(self.pending) if n is None or n < 0 else n)
+
+            if self.remaining is None:
+                return self.rfile.read(n)
+            if n is None or n < 0 or n > self.remaining:
+                n = self.remaining
+            data = self.rfile.read(n)
+            self.remaining -= len(data)
+            return data
+
+        def readline(self, limit=-1):
+            if self.chunked:
+                unlimited = limit is None or limit < 0
+                scanned = 0
+                while True:
+                    nl = self.pending.find(b'\n', scanned)
+                    if nl >= 0:
+                        n = nl + 1
+                        break
+                    scanned = len(self.pending)
+                    if (not unlimited and scanned >= limit) or not self.fill():
+                        n = scanned
+                        break
+                return self.take(n if unlimited else min(n, limit))
+
+            if self.remaining is None:
+                return self.rfile.readline(limit)
+            if limit is None or limit < 0 or limit > self.remaining:
+                limit = self.remaining
+            data = self.rfile.readline(limit)
+            self.remaining -= len(data)
+            return data
+
+
+
+    #  Docs from a request body, one at a time, so start() can take in an
+    #  upload of any size in bounded memory:
+    #     for doc in WebF.docReader(rfile, hdrs):
+    #  The format goes by Content-Type:  application/bson is concatenated
+    #  BSON docs; application/x-ndjson (or json with a boundary) is one
+    #  JSON doc per line; anything else is one JSON doc, or an array of
+    #  them, which is taken apart as it is read.  JSON is parsed like args
+    #  (EJSON conventions).  No one doc may be bigger than maxDocBytes
+    #  (the BSON limit by default).  With batch=N, lists of up to N docs
+    #  are returned instead, e.g. for insert_many().  count is the number
+    #  of docs read so far.  A body that cannot be read raises
+    #  WebF.badBody.
+    class docReader:
+        maxDocBytes = 16*1024*1024
+
+        space = re.compile(r'[ \t\n\r]*')
+
+        def __init__(self, rfile, hdrs, batch=None, maxDocBytes=None):
+            if not isinstance(rfile, WebF.bodyReader):
+                rfile = WebF.bodyReader(rfile, hdrs)  # never read past the body
+            self.rfile = rfile
+            self.batch = batch
+            self.count = 0
+            if maxDocBytes is not None:
+                self.maxDocBytes = maxDocBytes
+
+            ctype = hdrs['Content-Type'] if 'Content-Type' in hdrs else ""
+            gg = [ x.strip().lower() for x in ctype.split(';')]
+            self.mime = gg[0]
+            self.lines = self.mime in ('application/x-ndjson', 'application/jsonl') or \
+                         (self.mime == 'application/json' and len([x for x in gg[1:] if x.startswith('boundary=')]) > 0)
+
+        def parse(self, material):
+            try:
+                return mson.parse(bytes(material).decode('utf-8'), mson.MONGO)
+            except ValueError as e:    # includes JSONDecodeError, UnicodeDecodeError
+                raise WebF.badBody("doc %d: %s" % (self.count + 1, e))
+
+        def docs(self):
+            if self.mime == 'application/bson':
+                try:
+                    for doc in bson.decode_file_iter(self.rfile):
+                        yield doc
+                except bson.errors.InvalidBSON as e:
+                    raise WebF.badBody("doc %d: %s" % (self.count + 1, e))
+
+            elif self.lines:
+                while True:
+                    line = self.rfile.readline(self.maxDocBytes + 1)
+                    if not line:
+                        break
+                    if len(line) > self.maxDocBytes:
+                        raise WebF.badBody("doc %d is bigger than %d bytes" % (self.count + 1, self.maxDocBytes))
+                    if line.strip() == b"":
+                        continue
+                    yield self.parse(line)
+
+            else:
+                body = bytearray()
+                while len(body.strip()) == 0:
+                    more = self.rfile.read(65536)
+                    if not more:
+                        return
+                    body += more
+                if body.lstrip()[0:1] == b'[':
+                    for doc in self.items(body):
+                        yield doc
+                else:
+                    while True:
+                        if len(body) > self.maxDocBytes:
+                            raise WebF.badBody("doc is bigger than %d bytes" % self.maxDocBytes)
+                        more = self.rfile.read(65536)
+                        if not more:
+                            break
+                        body += more
+                    yield self.parse(body)
+
+        #  The items of the JSON array that buf starts, each parsed as soon
+        #  as it is all in; only the text from the current one on is held.
+        #  A parse error near the end of the text read so far may just
+        #  mean the rest of the doc has not been read yet.
+        def items(self, buf):
+            import codecs
+            import json
+
+            utf8 = codecs.getincrementaldecoder('utf-8')()
+            try:
+                text = utf8.decode(bytes(buf))
+            except ValueError as e:
+                raise WebF.badBody(str(e))
+            pos = text.index('[') + 1
+            expect = "first"    # doc or ], "doc", or "sep" (, or ])
+            eof = False
+            while True:
+                pos = self.space.match(text, pos).end()
+                if pos < len(text):
+                    c = text[pos]
+                    if expect == "sep" or (expect == "first" and c == ']'):
+                        if c == ']':
+                            pos += 1
+                            break
+                        if c != ',' or expect == "first":
+                            raise WebF.badBody("expected , or ] after doc %d" % self.count)
+                        expect = "doc"
+                        pos += 1
+                        continue
+
+                    try:
+                        (doc, end) = mson.parseAt(text, pos, mson.MONGO)
+                    except json.JSONDecodeError as e:
+                        if eof or (e.pos < len(text) - 10 and not e.msg.startswith("Unterminated string")):
+                            raise WebF.badBody("doc %d: %s" % (self.count + 1, e.msg))
+                        end = None
+                    #  A number may go on in what is not read yet
+                    if end is not None and (eof or (end < len(text) - 10 or not text[end - 1].isdigit())):
+                        if end - pos > self.maxDocBytes:
+                            raise WebF.badBody("doc %d is bigger than %d bytes" % (self.count + 1, self.maxDocBytes))
+                        pos = end
+                        expect = "sep"
+                        yield doc
+                        continue
+
+                elif eof:
+                    raise WebF.badBody("body ended in the middle of a JSON array")
+
+                #  Need more; by at least as much as we have, so a big doc
+                #  is not parsed over and over
+                if len(text) - pos > self.maxDocBytes:
+                    raise WebF.badBody("doc %d is bigger than %d bytes" % (self.count + 1, self.maxDocBytes))
+                more = self.rfile.read(max(65536, len(text) - pos))
+                eof = not more
+                try:
+                    text = text[pos:] + utf8.decode(more, final=eof)
+                except ValueError as e:
+                    raise WebF.badBody(str(e))
+                pos = 0
+
+            #  Nothing but whitespace may follow the array
+            rest = text[pos:].encode('utf-8')
+            while rest.strip() == b"":
+                rest = self.rfile.read(65536)
+                if not rest:
+                    return
+            raise WebF.badBody("more after the JSON array")
+
+        def __iter__(self):
+            if self.batch is None:
+                for doc in self.docs():
+                    self.count += 1
+                    yield doc
+            else:
+                docs = []
+                for doc in self.docs():
+                    self.count += 1
+                    docs.append(doc)
+                    if len(docs) == self.batch:
+                        yield docs
+                        docs = []
+                if len(docs) > 0:
+                    yield docs
+
+
+
+    #  Incremental Content-Encoding for response bodies.  compress() takes
+    #  whatever a writer flushes and returns it compressed AND flushed so
+    #  the client can decode it as it arrives; finish() returns the tail
+    #  of the stream.  gzip and deflate are always there; br and zstd are
+    #  offered if the brotli and zstandard modules are installed.
+    class compressor:
+        order = ("zstd", "br", "gzip", "deflate")   # preferred first
+        installed = None
+
+        @staticmethod
+        def available():
+            if WebF.compressor.installed is None:
+                codings = []
+                for coding in WebF.compressor.order:
+                    try:
+                        if coding == "br":
+                            import brotli
+                        elif coding == "zstd":
+                            import zstandard
+                        codings.append(coding)
+                    except ImportError:
+                        pass
+                WebF.compressor.installed = codings
+            return WebF.compressor.installed
+
+        def __init__(self, coding, level=None):
+            self.coding = coding
+
+            if coding == "gzip" or coding == "deflate":
+                import zlib
+                self.zz = zlib.compressobj(level if level is not None else 6, zlib.DEFLATED,
+                                           31 if coding == "gzip" else 15)
+                self.feed = self.zz.compress
+                self.syncFlush = lambda: self.zz.flush(zlib.Z_SYNC_FLUSH)
+                self.finish = self.zz.flush
+
+            elif coding == "br":
+                import brotli
+                self.zz = brotli.Compressor(quality=level if level is not None else 5)
+                self.feed = self.zz.process
+                self.syncFlush = self.zz.flush
+                self.finish = self.zz.finish
+
+            elif coding == "zstd":
+                import zstandard
+                self.zz = zstandard.ZstdCompressor(level=level if level is not None else 3).compressobj()
+                self.feed = self.zz.compress
+                self.syncFlush = lambda: self.zz.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+                self.finish = self.zz.flush
+
+            else:
+                raise ValueError("unknown content coding %s" % coding)
+
+        def compress(self, material):
+            return self.feed(material) + self.syncFlush()
+
+
+
+
+    #  Encoded response bodies of functions that declare "cache" in help(),
+    #  keyed by (function, args, output format).  Entries live for the
+    #  function's ttl; the least recently used are evicted to keep each
+    #  function within its maxBytes and everything within the server's
+    #  cacheBytes.  Bodies are stored as encoded but not compressed; a
+    #  compressed variant is made (and kept with the entry) the first
+    #  time a client asks for one.
+    class responseCache:
+        class entry:
+            def __init__(self, key, func, fmt, hdrs, body, ttl):
+                import hashlib
+                import time
+
+                self.key = key
+                self.func = func
+                self.fmt = fmt
+                self.hdrs = hdrs
+                self.body = body
+                self.expires = time.monotonic() + ttl
+                self.size = 0   # as accounted in the cache
+                self.variants = {}
+                self.etag = hashlib.blake2b(body, digest_size=12).hexdigest()
+
+            def tag(self, coding):
+                return '"%s"' % self.etag if coding is None else '"%s-%s"' % (self.etag, coding)
+
+        def __init__(self, maxBytes):
+            import collections
+            import threading
+
+            self.maxBytes = maxBytes
+            self.size = 0
+            self.entries = collections.OrderedDict()   # LRU first
+            self.funcBytes = {}
+            self.lock = threading.Lock()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+        @staticmethod
+        def canon(item):
+            if isinstance(item, dict):
+                return dict([(k, WebF.responseCache.canon(item[k])) for k in sorted(item)])
+            if isinstance(item, list):
+                return [WebF.responseCache.canon(x) for x in item]
+            return item
+
+        @staticmethod
+        def key(func, args, negotiated):
+            (mime, writerClass, params) = negotiated
+            return (func,
+                    mson.encode(WebF.responseCache.canon(args), mson.MONGO),
+                    mime, tuple(sorted(params.items())))
+
+        def get(self, key):
+            import time
+
+            with self.lock:
+                ee = self.entries.get(key)
+                if ee is not None and ee.expires <= time.monotonic():
+                    self.drop(ee)
+                    self.evictions += 1
+                    ee = None
+                if ee is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                    self.entries.move_to_end(key)
+                return ee
+
+        #  Store a body; returns the entry even if it is too big to keep
+        def put(self, key, fmt, hdrs, body, ttl, budget):
+            ee = WebF.responseCache.entry(key, key[0], fmt, hdrs, body, ttl)
+            if len(body) > min(budget, self.maxBytes):
+                return ee
+
+            with self.lock:
+                old = self.entries.get(key)
+                if old is not None:
+                    self.drop(old)
+                self.entries[key] = ee
+                self.grow(ee, len(body), budget)
+            return ee
+
+        #  body of an entry compressed with coding
+        def variant(self, ee, coding, level, budget):
+            material = ee.variants.get(coding)
+            if material is None:
+                zz = WebF.compressor(coding, level)
+                material = zz.compress(ee.body) + zz.finish()
+                with self.lock:
+                    if self.entries.get(ee.key) is ee and coding not in ee.variants:
+                        ee.variants[coding] = material
+                        self.grow(ee, len(material), budget)
+            return material
+
+        def grow(self, ee, nbytes, budget):
+            ee.size += nbytes
+            self.size += nbytes
+            self.funcBytes[ee.func] = self.funcBytes.get(ee.func, 0) + nbytes
+
+            while self.funcBytes[ee.func] > budget:
+                for victim in self.entries.values():
+                    if victim.func == ee.func:
+                        break
+                else:
+                    break   # nothing of this function's left to drop
+                self.drop(victim)
+                self.evictions += 1
+            while self.size > self.maxBytes:
+                self.drop(next(iter(self.entries.values())))
+                self.evictions += 1
+
+        def drop(self, ee):
+            del self.entries[ee.key]
+            self.size -= ee.size
+            self.funcBytes[ee.func] -= ee.size
+
+        def clear(self, func=None):
+            with self.lock:
+                for ee in [x for x in self.entries.values() if func is None or x.func == func]:
+                    self.drop(ee)
+
+        def stats(self):
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "entries": len(self.entries), "bytes": self.size}
+
+
+
+    #  What authentication said, keyed by (function, fingerprint):  the
+    #  fingerprint is what the function's authKey() (or the key function
+    #  given to registerAuthentication) made of the credentials.  The
+    #  function is always part of the key, as the server-wide handler is
+    #  handed the function instance and may allow one and deny another.
+    #  Successes live ttl secs, failures negativeTTL; at most maxEntries
+    #  are kept, the least recently used are evicted.
+    class authCache:
+        def __init__(self, maxEntries, ttl, negativeTTL):
+            import collections
+            import threading
+
+            self.maxEntries = maxEntries
+            self.ttl = ttl
+            self.negativeTTL = negativeTTL
+            self.entries = collections.OrderedDict()   # LRU first; key -> (expires, result)
+            self.lock = threading.Lock()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+        #  The (ok, user[, data]) stored for key, or None
+        def get(self, key):
+            import time
+
+            with self.lock:
+                ee = self.entries.get(key)
+                if ee is not None and ee[0] <= time.monotonic():
+                    del self.entries[key]
+                    ee = None
+                if ee is None:
+                    self.misses += 1
+                    return None
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return ee[1]
+
+        def put(self, key, result):
+            import time
+
+            ttl = self.ttl if result[0] != False else self.negativeTTL
+            if ttl <= 0:
+                return
+            with self.lock:
+                self.entries.pop(key, None)
+                self.entries[key] = (time.monotonic() + ttl, result)
+                while len(self.entries) > self.maxEntries:
+                    self.entries.popitem(last=False)
+                    self.evictions += 1
+
+        #  Forget one fingerprint (for every function), one function's
+        #  entries, or everything
+        def clear(self, fingerprint=None, func=None):
+            with self.lock:
+                if fingerprint is None and func is None:
+                    self.entries.clear()
+                    return
+                for key in [k for k in self.entries
+                            if (fingerprint is None or k[1] == fingerprint) and (func is None or k[0] == func)]:
+                    del self.entries[key]
+
+        def stats(self):
+            with self.lock:
+                nn = self.hits + self.misses
+                return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                        "entries": len(self.entries), "hitRate": round(self.hits / nn, 4) if nn > 0 else None}
+
+
+
+    #  Streams of functions that declare "cursor" in help() can be taken up
+    #  again where they left off.  Tokens carry the function, args, user,
+    #  and the position from the function's position(), signed with the
+    #  server's secret so they cannot be made up.  A stream that is cut off
+    #  after sending a token, or that fills its page, is parked here:  the
+    #  suspended generator, its function instance, and the docs sent since
+    #  each of the last two tokens (to be sent again), for the function's
+    #  ttl.  Entries are taken by cursor id and token seq; at most
+    #  maxEntries are kept, the oldest are evicted first.  Once anything is
+    #  parked, a thread looks for expired streams every sweepSecs.  Expired
+    #  and evicted streams are closed like abandoned calls:  gen.close(),
+    #  then abort() or end().  go() with more than one worker turns off
+    #  parking, as the call with the token may go to any worker:  every
+    #  token is then taken up with the function's resume().
+    class cursorTable:
+        sweepSecs = 5.0
+
+        class entry:
+            def __init__(self, cursor, marks, docs, gen, handler, reply, ttl):
+                import time
+
+                self.cid = cursor['c']
+                self.func = cursor['f']
+                self.top = cursor['s']
+                self.marks = marks     # token seq -> index of the first doc after it
+                self.docs = docs
+                self.gen = gen
+                self.handler = handler
+                self.reply = reply     # (respCode, addtl_hdrs) from start()
+                self.replay = None
+                self.expires = time.monotonic() + ttl
+
+        def __init__(self, maxEntries, secret=None):
+            import collections
+            import os
+            import threading
+
+            if isinstance(secret, str):
+                secret = secret.encode('utf-8')
+            self.secret = secret if secret is not None else os.urandom(32)
+            self.maxEntries = maxEntries
+            self.entries = collections.OrderedDict()   # oldest first
+            self.lock = threading.Lock()
+            self.parking = True
+            self.pid = None
+            self.parked = 0
+            self.resumed = 0
+            self.expired = 0
+            self.evictions = 0
+
+        @staticmethod
+        def newId():
+            import secrets
+            return secrets.token_hex(8)
+
+        def sign(self, body):
+            import hashlib
+            return hashlib.blake2b(body, key=self.secret, digest_size=16).digest()
+
+        def token(self, cursor, position, seq):
+            import base64
+
+            doc = {"f": cursor['f'], "a": cursor['a'], "u": cursor['u'],
+                   "c": cursor['c'], "s": seq, "p": position}
+            body = base64.urlsafe_b64encode(mson.encode(doc, mson.MONGO)).rstrip(b'=')
+            sig = base64.urlsafe_b64encode(self.sign(body)).rstrip(b'=')
+            return (body + b'.' + sig).decode('ascii')
+
+        #  The token's doc if it is good and for func, else None
+        def decode(self, token, func):
+            import base64
+            import hmac
+
+            try:
+                (body, sig) = token.encode('ascii').split(b'.')
+                if not hmac.compare_digest(base64.urlsafe_b64decode(sig + b'=' * (-len(sig) % 4)), self.sign(body)):
+                    return None
+                doc = mson.parse(base64.urlsafe_b64decode(body + b'=' * (-len(body) % 4)).decode('utf-8'), mson.MONGO)
+            except Exception:
+                return None
+            return doc if doc.get('f') == func else None
+
+        def park(self, ee):
+            import os
+            import threading
+            import time
+
+            now = time.monotonic()
+            with self.lock:
+                victims = self.expire(now)
+                self.entries[ee.cid] = ee
+                self.parked += 1
+                while len(self.entries) > self.maxEntries:
+                    victims.append(self.entries.popitem(last=False)[1])
+                    self.evictions += 1
+                if self.pid != os.getpid():   # none yet, or forked since
+                    self.pid = os.getpid()
+                    threading.Thread(target=self.run, daemon=True).start()
+            for x in victims:
+                self.close(x)
+
+        #  Take out the expired entries (under lock) and return them
+        def expire(self, now):
+            victims = [x for x in self.entries.values() if x.expires <= now]
+            for x in victims:
+                del self.entries[x.cid]
+            self.expired += len(victims)
+            return victims
+
+        def run(self):
+            while True:
+                time.sleep(self.sweepSecs)
+                with self.lock:
+                    victims = self.expire(time.monotonic())
+                for x in victims:
+                    self.close(x)
+
+        #  The parked stream cid with replay set to the docs after token
+        #  seq, or None if it is gone or that token is too old
+        def take(self, cid, seq):
+            import time
+
+            with self.lock:
+                ee = self.entries.pop(cid, None)
+                if ee is None:
+                    return None
+                if ee.expires <= time.monotonic():
+                    self.expired += 1
+                elif seq in ee.marks:
+                    self.resumed += 1
+                    ee.replay = ee.docs[ee.marks[seq]:]
+                    return ee
+            self.close(ee)
+            return None
+
+        @staticmethod
+        def close(ee):
+            try:
+                ee.gen.close()
+            except Exception:
+                traceback.print_exc()
+
+            mmm = getattr(ee.handler, "abort", None)
+            if not callable(mmm):
+                mmm = getattr(ee.handler, "end", None)
+            if callable(mmm):
+                try:
+                    mmm()
+                except Exception:
+                    traceback.print_exc()
+
+        def clear(self, func=None):
+            with self.lock:
+                victims = [x for x in self.entries.values() if func is None or x.func == func]
+                for x in victims:
+                    del self.entries[x.cid]
+            for x in victims:
+                self.close(x)
+
+        def stats(self):
+            return {"parked": self.parked, "resumed": self.resumed, "expired": self.expired,
+                    "evictions": self.evictions, "entries": len(self.entries)}
+
+
+
+    #  Where the time of one call went, by phase:  the monotonic time a
+    #  phase first started and last ended, and the seconds spent in it.
+    #  A phase that comes up more than once in a call (the function's rate
+    #  limit after the server's, socket writes) adds up.  phase(name) ends
+    #  the current phase and starts the next; phase(None) just ends it.
+    #  Reported to the logger as phaseMillis, in the Server-Timing header
+    #  and trailer (wargs serverTiming), and to the tracer as spans.
+    class phaseTimer:
+        def __init__(self, t0):
+            self.t0 = t0
+            self.wall0 = time.time()
+            self.phases = {}    # name -> [start, end, secs]
+            self.current = None
+
+        def add(self, name, start, end, secs):
+            pp = self.phases.get(name)
+            if pp is None:
+                self.phases[name] = [start, end, secs]
+            else:
+                pp[1] = end
+                pp[2] += secs
+
+        def phase(self, name):
+            now = time.monotonic()
+            if self.current is not None:
+                (cname, start) = self.current
+                self.add(cname, start, now, now - start)
+            self.current = (name, now) if name is not None else None
+
+        def secs(self, name):
+            pp = self.phases.get(name)
+            return pp[2] if pp is not None else 0.0
+
+        #  The next() loop that began at t0, when writes were at
+        #  writeSecs:  the generator and encoding its docs, less the
+        #  socket writes (timing each doc would cost more than encoding)
+        def loop(self, t0, writeSecs):
+            now = time.monotonic()
+            self.add("next", t0, now, max(0.0, now - t0 - (self.secs("write") - writeSecs)))
+
+        def millis(self):
+            return dict([(name, round(pp[2] * 1000, 3)) for (name, pp) in self.phases.items()])
+
+        #  Server-Timing:  the phases so far and the total
+        def header(self):
+            items = ["%s;dur=%.3f" % (name, pp[2] * 1000) for (name, pp) in self.phases.items()]
+            items.append("total;dur=%.3f" % ((time.monotonic() - self.t0) * 1000))
+            return ", ".join(items)
+
+        #  The phases as spans with wall clock (epoch secs) start and end
+        def spans(self):
+            return [{"name": name,
+                     "start": self.wall0 + (pp[0] - self.t0),
+                     "end": self.wall0 + (pp[1] - self.t0),
+                     "secs": pp[2]} for (name, pp) in self.phases.items()]
+
+
+
+    #  Per-function call metrics, served by the __metrics function:  calls
+    #  by status, calls in flight, docs and bytes sent, and histograms of
+    #  seconds to first byte (the headers) and to the end of the call.
+    #  Each function has its own small lock, taken once when a call starts
+    #  and once when it ends; bucket lookups happen outside of it.  Status
+    #  "aborted" is a call that ended without sending headers.
+    class callMetrics:
+        bounds = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+        class funcStats:
+            def __init__(self, nbuckets):
+                import threading
+
+                self.lock = threading.Lock()
+                self.inFlight = 0
+                self.status = {}
+                self.docs = 0
+                self.bytes = 0
+                self.disconnects = 0
+                self.ttfb = [0] * nbuckets   # last one is +Inf
+                self.ttfbSum = 0.0
+                self.total = [0] * nbuckets
+                self.totalSum = 0.0
+
+        def __init__(self):
+            import threading
+            import time
+
+            self.funcs = {}   # func name (None if not found) -> funcStats
+            self.lock = threading.Lock()
+            self.started = time.monotonic()
+
+        def enter(self, func):
+            ss = self.funcs.get(func)
+            if ss is None:
+                with self.lock:
+                    ss = self.funcs.setdefault(func, WebF.callMetrics.funcStats(len(self.bounds) + 1))
+            with ss.lock:
+                ss.inFlight += 1
+            return ss
+
+        #  ttfb is None if no headers were sent
+        def leave(self, ss, status, ttfb, total, docs, nbytes, disconnected=False):
+            import bisect
+
+            n = bisect.bisect_left(self.bounds, total)
+            m = bisect.bisect_left(self.bounds, ttfb) if ttfb is not None else None
+            with ss.lock:
+                ss.inFlight -= 1
+                ss.status[status] = ss.status.get(status, 0) + 1
+                ss.docs += docs
+                ss.bytes += nbytes
+                if disconnected:
+                    ss.disconnects += 1
+                ss.total[n] += 1
+                ss.totalSum += total
+                if m is not None:
+                    ss.ttfb[m] += 1
+                    ss.ttfbSum += ttfb
+
+        @staticmethod
+        def histogram(counts, total):
+            cumulative = []
+            n = 0
+            for c in counts:
+                n += c
+                cumulative.append(n)
+            return {"le": list(WebF.callMetrics.bounds) + ["+Inf"], "counts": cumulative, "sum": total, "count": n}
+
+        def snapshot(self):
+            import time
+
+            funcs = []
+            for (func, ss) in sorted(list(self.funcs.items()), key=lambda x: x[0] or ""):
+                with ss.lock:
+                    status = dict([(str(k), v) for (k, v) in ss.status.items()])
+                    doc = {
+                        "func": func,
+                        "calls": sum(ss.status.values()),
+                        "inFlight": ss.inFlight,
+                        "status": status,
+                        "docs": ss.docs,
+                        "bytes": ss.bytes,
+                        "disconnects": ss.disconnects,
+                        "ttfbSecs": WebF.callMetrics.histogram(ss.ttfb, ss.ttfbSum),
+                        "totalSecs": WebF.callMetrics.histogram(ss.total, ss.totalSum)
+                        }
+                funcs.append(doc)
+
+            return {
+                "uptimeSecs": time.monotonic() - self.started,
+                "inFlight": sum([f['inFlight'] for f in funcs]),
+                "functions": funcs
+                }
+
+
+
+    #  Log delivery off the request threads (wargs logQueue etc.).  Calls
+    #  put (fn, args) on a bounded queue and one writer thread takes up to
+    #  batch of them at a time and calls fn(*args).  fn None stands for
+    #  the registered logger:  args is then just info, and the logger gets
+    #  (info, context) or, if registered with batched=True, ([info, ...],
+    #  context) once per batch.  When the queue is full, put either waits
+    #  (block) or drops the entry and counts it.  With sample N only one in
+    #  N successful calls is logged; errors always are.  Without a queue
+    #  (size None) entries are delivered right away on the caller's thread,
+    #  which is the way to have sampling alone.
+    class logPipeline:
+        def __init__(self, parent, size=None, batch=100, block=False, sample=1):
+            import itertools
+            import queue
+            import threading
+
+            self.parent = parent
+            self.size = size
+            self.batch = batch
+            self.block = block
+            self.sample = sample
+            self.seq = itertools.count()
+            self.lock = threading.Lock()
+            self.queued = 0
+            self.delivered = 0
+            self.dropped = 0
+            self.sampledOut = 0
+            self.errors = 0
+
+            self.q = None
+            if size is not None:
+                self.q = queue.Queue(size)
+                tt = threading.Thread(target=self.run, name="WebF-log", daemon=True)
+                tt.start()
+
+        #  Should a call with this status be logged?
+        def keep(self, status):
+            if self.sample <= 1 or not isinstance(status, int) or status >= 400:
+                return True
+            if next(self.seq) % self.sample == 0:
+                return True
+            with self.lock:
+                self.sampledOut += 1
+            return False
+
+        def put(self, fn, args):
+            import queue
+
+            if self.q is None:
+                self.deliver([(fn, args)])
+                return
+
+            try:
+                self.q.put((fn, args), self.block)
+            except queue.Full:
+                with self.lock:
+                    self.dropped += 1
+                return
+            with self.lock:
+                self.queued += 1
+
+        def run(self):
+            import queue
+
+            while True:
+                items = [self.q.get()]
+                try:
+                    while len(items) < self.batch:
+                        items.append(self.q.get_nowait())
+                except queue.Empty:
+                    pass
+
+                self.deliver(items)
+                for item in items:
+                    self.q.task_done()
+
+        def deliver(self, items):
+            xx = self.parent
+            infos = []
+            errors = 0
+
+            for (fn, args) in items:
+                try:
+                    if fn is not None:
+                        fn(*args)
+                    elif xx.log_batched:
+                        infos.append(args)
+                    elif xx.log_handler is not None:
+                        xx.log_handler(args, xx.log_context)
+                except Exception:
+                    traceback.print_exc()
+                    errors += 1
+
+            if len(infos) > 0 and xx.log_handler is not None:
+                try:
+                    xx.log_handler(infos, xx.log_context)
+                except Exception:
+                    traceback.print_exc()
+                    errors += 1
+
+            with self.lock:
+                self.delivered += len(items)
+                self.errors += errors
+
+        #  In a new worker process (WebF.go with workers):  the writer
+        #  thread did not come along, and what the parent has queued is
+        #  the parent's to deliver.
+        def forked(self):
+            WebF.logPipeline.__init__(self, self.parent, self.size, self.batch, self.block, self.sample)
+
+        #  Wait until everything queued so far has been delivered
+        def flush(self):
+            if self.q is not None:
+                self.q.join()
+
+        def stats(self):
+            with self.lock:
+                return {"queued": self.queued, "delivered": self.delivered, "dropped": self.dropped,
+                        "sampledOut": self.sampledOut, "errors": self.errors,
+                        "pending": self.q.qsize() if self.q is not None else 0}
+
+
+    #  Raised by bodyReader and docReader when the request body cannot be
+    #  read:  garbled chunking, an upload cut short, a doc that does not
+    #  parse or is too big.  A start() that lets it out is answered with
+    #  400 Bad Request (errcode 16).
+    class badBody(ValueError):
+        pass
+
+    #  Raised when the client is not taking the response:  reason is
+    #  "disconnect" or "timeout" (wargs writeTimeout / drainTimeout).
+    class clientGone(Exception):
+        def __init__(self, reason):
+            Exception.__init__(self, "client %s" % reason)
+            self.reason = reason
+
+    #  The wfile of a call on the threaded engine.  Before each write the
+    #  socket timeout is set to what handler.writeTimeLeft() allows;
+    #  failed writes raise WebF.clientGone.
+    class timedWriter:
+        def __init__(self, stream, sock, handler):
+            self.stream = stream
+            self.sock = sock
+            self.handler = handler
+            self.timeout = sock.gettimeout()
+
+        def write(self, material):
+            timeout = self.handler.writeTimeLeft()
+            if timeout != self.timeout:
+                self.sock.settimeout(timeout)
+                self.timeout = timeout
+            t = time.monotonic()
+            try:
+                return self.stream.write(material)
+            except TimeoutError as e:
+                raise WebF.clientGone("timeout") from e
+            except OSError as e:
+                raise WebF.clientGone("disconnect") from e
+            finally:
+                now = time.monotonic()
+                self.handler.timing.add("write", t, now, now - t)
+
+        def flush(self):
+            try:
+                self.stream.flush()
+            except OSError as e:
+                raise WebF.clientGone("disconnect") from e
+
+
+    #  Sends what the writers of streams have buffered once flushMillis
+    #  have passed without more output, as when next() waits on a tailing
+    #  cursor:  otherwise the docs emitted before the wait would sit in
+    #  the buffer until the next one comes.  One thread per process,
+    #  started with the first stream, calls idleFlush() on every writer
+    #  added every flushMillis / 2.  A writer added gets a lock, held by
+    #  the call's thread except while it waits for the next doc (see
+    #  idleWhile), so writes never need to take it.  The asyncio engine,
+    #  which writes on the loop, uses a timer on the loop instead.
+    class idleFlusher:
+        def __init__(self, millis):
+            import threading
+
+            self.period = max(millis / 2000.0, 0.005)
+            self.writers = set()
+            self.lock = threading.Lock()
+            self.pid = None
+
+        def add(self, writer):
+            import os
+            import threading
+
+            writer.lock = threading.Lock()
+            writer.lock.acquire()
+            with self.lock:
+                self.writers.add(writer)
+                if self.pid != os.getpid():   # none yet, or forked since
+                    self.pid = os.getpid()
+                    threading.Thread(target=self.run, daemon=True).start()
+
+        def remove(self, writer):
+            with self.lock:
+                self.writers.discard(writer)
+
+        def run(self):
+            while True:
+                time.sleep(self.period)
+                with self.lock:
+                    writers = list(self.writers)
+                for writer in writers:
+                    writer.idleFlush()
+
+
+
+    #  Output writers.  One is constructed per response over the output
+    #  stream (see HTTPHandler.makeWriter) as
+    #     writerClass(ostream, encoding, params)
+    #  where encoding is 'CHUNKED' or None and params are those of the
+    #  negotiated Accept media range, and is driven with prologue(),
+    #  emit(doc) for every doc, and epilogue().  Register more with
+    #  WebF.registerCodec(mime, writerClass).
+    #
+    #  Output is coalesced in one reusable buffer per response and handed
+    #  to the stream (as one chunk, if chunked) when it holds flushBytes,
+    #  when flushMillis have passed since the last flush (checked as
+    #  material is written, and while a stream waits for its next doc by
+    #  idleFlush(), see idleFlusher), and at the epilogue.  bytesWritten
+    #  and flushes are reported to the logger.
+    #
+    #  Material of flushBytes or more is not copied into the buffer but
+    #  sent as is, after whatever is already buffered.
+    #
+    #  Besides dicts, writers take pre-encoded docs:  WebF.encodedDoc,
+    #  RawBSONDocument, and bytes/bytearray/memoryview holding one BSON
+    #  doc.  preEncoded() sorts out what can be sent without re-encoding.
+    #
+    #  After holdHeaders(onStart), onStart(coding or None, final) is called
+    #  upon the first flush to send the headers; final is True if the
+    #  whole response is in buf.  After compressWith(), each flush is
+    #  compressed on its way out and the headers are held back the same
+    #  way:  a response that is complete and smaller than minBytes by the
+    #  first flush is sent as is.
+    class baseWriter:
+        flushBytes = 65536
+        flushMillis = 100
+        copyOnFlush = False   # True if ostream may hold on to what it is given
+
+        # The content type to send; subclasses set this
+        contentType = 'application/octet-stream'
+
+        # Key into encodedDoc for ready-made material in this format
+        encodedKey = None
+
+        # Callable giving {name: value} to send after the last chunk
+        trailers = None
+
+        # Held by the call's thread but while it waits for the next doc
+        # (see idleWhile); what an idleFlush() from another thread ran into
+        lock = None
+        failed = None
+
+        #  Can this writer honor these Accept parameters (e.g. boundary)?
+        #  If not, negotiation moves on to the next acceptable type.
+        @classmethod
+        def accepts(cls, params):
+            return True
+
+        def __init__(self, ostream, encoding, params=None):
+            import time
+
+            self.ostream = ostream
+            self.encoding = encoding
+            self.params = params if params is not None else {}
+            self.buf = bytearray()
+            self.lastFlush = time.monotonic()
+            self.bytesWritten = 0
+            self.flushes = 0
+            self.coding = None
+            self.compressor = None
+            self.onStart = None
+
+        def holdHeaders(self, onStart):
+            self.onStart = onStart
+
+        def compressWith(self, coding, minBytes, level, onStart):
+            self.coding = coding
+            self.minBytes = minBytes
+            self.level = level
+            self.onStart = onStart
+
+        #  (ready-made material in the format of encodedKey or None, the
+        #  doc to encode otherwise)
+        @staticmethod
+        def preEncoded(doc, key):
+            cls = doc.__class__
+            if cls is dict:
+                return (None, doc)
+
+            if isinstance(doc, WebF.encodedDoc):
+                material = doc.get(key)
+                return (material, doc.asDoc() if material is None else None)
+
+            if isinstance(doc, (bytes, memoryview, bytearray)):
+                return (doc, None) if key == 'bson' else (None, bson.decode(doc))
+
+            if isinstance(doc, RawBSONDocument):
+                return (doc.raw, None) if key == 'bson' else (None, bson.decode(doc.raw))
+
+            return (None, doc)
+
+        def writeWrap(self, material):
+            import time
+
+            if len(material) >= self.flushBytes and self.onStart is None and self.compressor is None:
+                self.flush()
+                self.send(material)
+                return
+
+            self.buf += material
+            if len(self.buf) >= self.flushBytes or (time.monotonic() - self.lastFlush)*1000 >= self.flushMillis:
+                self.flush()
+
+        def flush(self, final=False):
+            import time
+
+            self.lastFlush = time.monotonic()
+
+            if self.onStart is not None:
+                if self.coding is not None:
+                    if final and len(self.buf) < self.minBytes:
+                        self.coding = None
+                    else:
+                        self.compressor = WebF.compressor(self.coding, self.level)
+                (onStart, self.onStart) = (self.onStart, None)
+                onStart(self.coding, final)
+
+            if self.compressor is not None:
+                squeezed = self.compressor.compress(self.buf) if len(self.buf) > 0 else b""
+                if final:
+                    squeezed += self.compressor.finish()
+                self.buf[:] = squeezed
+
+            if len(self.buf) == 0:
+                return
+
+            if self.encoding == 'CHUNKED':
+                self.buf[0:0] = format(len(self.buf), 'x').encode('utf-8') + b"\r\n"
+                self.buf += b"\r\n"
+
+            self.ostream.write(bytes(self.buf) if self.copyOnFlush else self.buf)
+            self.bytesWritten += len(self.buf)
+            self.flushes += 1
+            del self.buf[:]
+
+        def send(self, material):
+            if self.copyOnFlush and material.__class__ is not bytes:
+                material = bytes(material)
+
+            if self.encoding == 'CHUNKED':
+                hdr = format(len(material), 'x').encode('utf-8') + b"\r\n"
+                self.ostream.write(hdr)
+                self.ostream.write(material)
+                self.ostream.write(b"\r\n")
+                self.bytesWritten += len(hdr) + 2
+            else:
+                self.ostream.write(material)
+
+            self.bytesWritten += len(material)
+            self.flushes += 1
+
+        #  gen, or with a lock (see idleFlusher) an iterator over gen that
+        #  lets go of the lock only while gen works out the next doc, so
+        #  that idleFlush() may get in then.  What went wrong in an
+        #  idleFlush() is raised in its stead.
+        def idleWhile(self, gen):
+            lock = self.lock
+            if lock is None:
+                return gen
+
+            def docs():
+                while True:
+                    lock.release()
+                    try:
+                        r = next(gen)
+                    except StopIteration:
+                        return
+                    finally:
+                        lock.acquire()
+                    if self.failed is not None:
+                        raise self.failed
+                    yield r
+            return docs()
+
+        #  Flush if flushMillis have passed since the last flush, unless
+        #  the writer is busy; for when no more material comes for now.
+        def idleFlush(self):
+            import time
+
+            if self.lock is not None and not self.lock.acquire(False):
+                return
+            try:
+                if self.failed is None and len(self.buf) > 0 and (time.monotonic() - self.lastFlush)*1000 >= self.flushMillis:
+                    self.flush()
+            except Exception as e:
+                self.failed = e
+            finally:
+                if self.lock is not None:
+                    self.lock.release()
+
+        def finish(self):
+            self.flush(True)
+            if self.encoding == 'CHUNKED':
+                last = b"0\r\n"  # The zero length chunk!
+                if self.trailers is not None:
+                    for (k, v) in self.trailers().items():
+                        last += ("%s: %s\r\n" % (k, v)).encode('latin-1')
+                last += b"\r\n"
+                self.ostream.write(last)
+                self.bytesWritten += len(last)
+
+    class bsonWriter(baseWriter):
+        contentType = 'application/bson'
+        encodedKey = 'bson'
+
+        def __init__(self, ostream, encoding, params=None):
+            WebF.baseWriter.__init__(self, ostream, encoding, params)
+
+        def prologue(self,things=None):
+            pass
+
+        def emit(self,doc):
+            (bytes, doc) = WebF.baseWriter.preEncoded(doc, self.encodedKey)
+            if bytes is None:
+                bytes = bson.BSON.encode(doc)
+            self.writeWrap(bytes)
+
+        def epilogue(self,things=None):
+            self.finish()
+
+
+    #  json and ejson support boundary=[LF,CR] to send CR-delimited
+    #  docs instead of one big array.
+    class jsonWriter(baseWriter):
+        contentType = 'application/json'
+        encodedKey = 'json'
+        fmt = mson.PURE
+
+        @classmethod
+        def accepts(cls, params):
+            return 'boundary' not in params or params['boundary'] in ['LF','CR']
+
+        def __init__(self, ostream, encoding, params=None):
+            WebF.baseWriter.__init__(self, ostream, encoding, params)
+            self.crdelim = params is not None and 'boundary' in params
+            if self.crdelim:
+                self.contentType = self.contentType + "; boundary=LF"
+            self.wroteOne = False
+
+        def prologue(self,things=None):
+            pass
+
+        def emit(self,doc):
+            if self.crdelim is False:
+                if self.wroteOne is False:
+                    self.writeWrap(b'[')
+                else:
+                    self.writeWrap(b',')
+
+            (bytes, doc) = WebF.baseWriter.preEncoded(doc, self.encodedKey)
+            if bytes is None:
+                bytes = mson.encode(doc, self.fmt)
+
+            self.writeWrap(bytes)
+            self.wroteOne = True
+
+        def epilogue(self,things=None):
+            if self.crdelim is False and self.wroteOne is True:
+                self.writeWrap(b']')
+            self.finish()
+
+
+    class ejsonWriter(jsonWriter):
+        contentType = 'application/ejson'
+        encodedKey = 'ejson'
+        fmt = mson.MONGO
+
+
+    #  Newline delimited JSON (http://ndjson.org):  json with boundary=LF
+    #  under its own content type.
+    class ndjsonWriter(jsonWriter):
+        contentType = 'application/x-ndjson'
+
+        @classmethod
+        def accepts(cls, params):
+            return True
+
+        def __init__(self, ostream, encoding, params=None):
+            WebF.jsonWriter.__init__(self, ostream, encoding)
+            self.crdelim = True
+
+
+    #  Prometheus text exposition format (version 0.0.4) of the docs from
+    #  WebF.callMetrics.snapshot(); offered only by __metrics (see codecs())
+    class promWriter(baseWriter):
+        contentType = 'text/plain; version=0.0.4; charset=utf-8'
+
+        def __init__(self, ostream, encoding, params=None):
+            WebF.baseWriter.__init__(self, ostream, encoding, params)
+
+        @staticmethod
+        def label(value):
+            value = "" if value is None else str(value)
+            return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+        def prologue(self,things=None):
+            pass
+
+        def emit(self,doc):
+            out = []
+            def metric(name, mtype, text):
+                out.append("# HELP %s %s\n# TYPE %s %s\n" % (name, text, name, mtype))
+
+            metric("webf_uptime_seconds", "gauge", "Seconds since the server started.")
+            out.append("webf_uptime_seconds %s\n" % repr(doc['uptimeSecs']))
+
+            metric("webf_in_flight", "gauge", "Calls in progress.")
+            out.append("webf_in_flight %d\n" % doc['inFlight'])
+
+            funcs = [(WebF.promWriter.label(f['func']), f) for f in doc['functions']]
+
+            metric("webf_function_in_flight", "gauge", "Calls in progress per function.")
+            for (fl, f) in funcs:
+                out.append('webf_function_in_flight{func="%s"} %d\n' % (fl, f['inFlight']))
+
+            metric("webf_calls_total", "counter", "Calls per function and HTTP status.")
+            for (fl, f) in funcs:
+                for (status, n) in sorted(f['status'].items()):
+                    out.append('webf_calls_total{func="%s",status="%s"} %d\n' % (fl, WebF.promWriter.label(status), n))
+
+            metric("webf_docs_total", "counter", "Docs sent per function.")
+            for (fl, f) in funcs:
+                out.append('webf_docs_total{func="%s"} %d\n' % (fl, f['docs']))
+
+            metric("webf_bytes_total", "counter", "Response body bytes sent per function.")
+            for (fl, f) in funcs:
+                out.append('webf_bytes_total{func="%s"} %d\n' % (fl, f['bytes']))
+
+            metric("webf_disconnects_total", "counter", "Calls cut short by the client leaving or being too slow.")
+            for (fl, f) in funcs:
+                out.append('webf_disconnects_total{func="%s"} %d\n' % (fl, f['disconnects']))
+
+            for (name, key, text) in (("webf_ttfb_seconds", "ttfbSecs", "Seconds from request to response headers."),
+                                      ("webf_duration_seconds", "totalSecs", "Seconds from request to end of response.")):
+                metric(name, "histogram", text)
+                for (fl, f) in funcs:
+                    hh = f[key]
+                    for (le, n) in zip(hh['le'], hh['counts']):
+                        out.append('%s_bucket{func="%s",le="%s"} %d\n' % (name, fl, le, n))
+                    out.append('%s_sum{func="%s"} %s\n' % (name, fl, repr(hh['sum'])))
+                    out.append('%s_count{func="%s"} %d\n' % (name, fl, hh['count']))
+
+            if 'log' in doc:
+                metric("webf_log_entries_total", "counter", "Log entries by what became of them.")
+                for what in ("delivered", "dropped", "sampledOut", "errors"):
+                    out.append('webf_log_entries_total{outcome="%s"} %d\n' % (what, doc['log'][what]))
+
+            self.writeWrap("".join(out).encode('utf-8'))
+
+        def epilogue(self,things=None):
+            self.finish()
+
+
 
     class internalErr:
         def __init__(self, respCode, errs):
@@ -79,6 +2442,87 @@ class WebF:
         #  implemented here, then BaseHTTPRequestHandler will return code 501
         #  unsupported method.
 
+        requestCount = 0
+        theWriter = None   # writer of the current/last response
+        negotiated = None  # (mime, writerClass, params) from Accept
+        fspec = None       # funcSpec of the function called, if found
+        cacheKey = None    # if the response may come from/go to xx.cache
+        cacheState = None  # "hit", "miss", or "notModified"
+        pooled = None      # (handlerPool, instance) to give back after the call
+        respHdrs = None    # headers to add to whatever response is sent
+        poolWait = None    # millis waited for a pooled instance
+        poolPending = None # (pool, func, params, timeout) while waiting for an instance off-thread
+        poolThreadWait = True  # if a call may wait for a pooled instance on its thread
+        t0 = None          # time.monotonic() when the call came in
+        tFirst = None      # ... when the headers were sent
+        tDone = None       # ... when the response was done
+        sentCode = None    # status actually sent
+        docsOut = 0        # docs emitted
+        gen = None         # the handler's next() generator while in use
+        ended = False      # if the handler's end() has been called
+        disconnect = None  # "disconnect" or "timeout" if the client went away
+        timing = None      # phaseTimer of the current/last call
+        caller = None      # {"name","ip","port"} as given to middleware and authenticate()
+        authState = None   # "hit" or "miss" if authentication went through xx.authCache
+        cursor = None      # cursor mode: {"f","a","u","c","s"} as in the tokens
+        cursorState = None # "new", "live" (parked stream), or "checkpoint" (resume())
+        resumed = None     # cursorTable.entry taken up by this call
+        parked = False     # if this call parked its stream
+        waiting = False    # if the connection is parked on a PooledHTTPServer between requests
+        pageSize = None    # cursor mode: docs to send before parking
+
+        def setup(self):
+            xx = self.server.parent
+            if xx.keep_alive:
+                self.protocol_version = "HTTP/1.1"
+                self.timeout = xx.idle_timeout  # waiting for next request
+                #  The writers coalesce output themselves; Nagle would only
+                #  hold a body back behind its headers for a delayed ACK
+                self.disable_nagle_algorithm = True
+            BaseHTTPRequestHandler.setup(self)
+
+        #  As BaseHTTPRequestHandler.handle, but on a PooledHTTPServer a
+        #  keep-alive connection with no next request in hand yet is
+        #  parked there rather than waited on here; a worker takes it up
+        #  again with resume()
+        def handle(self):
+            park = getattr(self.server, "park", None)
+            self.close_connection = True
+            self.handle_one_request()
+            while not self.close_connection:
+                if park is not None and not self.pending():
+                    self.waiting = True
+                    park(self, self.server.parent.idle_timeout)
+                    return
+                self.handle_one_request()
+
+        #  If the next request (pipelined) is already buffered
+        def pending(self):
+            import ssl
+
+            if isinstance(self.connection, ssl.SSLSocket) and self.connection.pending() > 0:
+                return True
+            timeout = self.connection.gettimeout()
+            self.connection.settimeout(0)
+            try:
+                return len(self.rfile.peek(1)) > 0
+            except OSError:
+                return False
+            finally:
+                self.connection.settimeout(timeout)
+
+        def resume(self, close=False):
+            self.waiting = False
+            try:
+                if not close:
+                    self.handle()
+            finally:
+                self.finish()
+
+        def finish(self):
+            if not self.waiting:
+                BaseHTTPRequestHandler.finish(self)
+
         def do_GET(self):
             self.call(self.path)
 
@@ -98,7 +2542,11 @@ class WebF:
         def log_message(self, format, *args):
            xx = self.server.parent
            if xx.log_handler == None:
-              print("%s - - [%s] %s" % (self.address_string(),self.log_date_time_string(),format%args))
+              line = "%s - - [%s] %s" % (self.address_string(),self.log_date_time_string(),format%args)
+              if xx.logs is not None:
+                 xx.logs.put(print, (line,))
+              else:
+                 print(line)
 
 
 
@@ -119,296 +2567,728 @@ class WebF:
         
 
         def getArgTypeToString(self, argval):
-           ss  = argval.__class__.__name__
-           if ss == 'unicode':
-              ss = "string"
-           elif ss == 'str':           
-              ss = "string"
-           elif ss == 'float':           
-              ss = "double"
-           elif ss == 'Decimal':
-              ss = "decimal"
-           elif ss == 'list':
-              ss = "array"
-              
-           return ss
+           return WebF.funcSpec.typeName(argval)
 
 
         def chkArgs(self, funcHelp, webArgs):
-            argerrs = []
-            allowUnknownArgs = False
-
-            if 'allowUnknownArgs' in funcHelp:
-               allowUnknownArgs = funcHelp['allowUnknownArgs']
-
-            declaredArgs = {}
-
-            if 'args' in funcHelp:
-                for hargs in funcHelp['args']:
-
-                    declaredArgs[hargs['name']] = 1
-
-                    if hargs['req'] == "Y":
-                        if hargs['name'] not in webArgs:
-                           argerrs.append({
-                                    "errcode":1,
-                                    "msg":"req arg not found",
-                                    "data":hargs['name']})
-
-                    if hargs['name'] in webArgs:
-                       # exists: but is it the right type?
-                       # any,string, int, long, double, decimal, datetime, binary, array, dict                           
-                       argval = webArgs[hargs['name']]
-                       argtype = hargs['type'];
-                       if argtype != "any":
-                          ss = self.getArgTypeToString(argval)
-                          if ss != argtype:
-                             argerrs.append({
-                                    "errcode":2,
-                                    "msg":"arg has wrong type",
-                                    "data": {
-                                      "arg": hargs['name'],
-                                      "expected": argtype,
-                                      "found": ss
-                                      }})
-                             
-                # Now go the other way:  Check webargs:
-                if allowUnknownArgs == False:
-                   for warg in webArgs:
-                      if warg != '_' and warg not in declaredArgs:
-                         argerrs.append({
-                             "errcode":2,
-                             "msg":"unknown arg",
-                             "data": {
-                                "arg": warg
-                                }})
-                       
-            return argerrs
-                            
-            
+            return WebF.funcSpec(funcHelp).check(webArgs)
 
 
 
-        def respond(self, args, handler):
-
-            class baseWriter:
-                def writeWrap(self, material):
-                    if self.encoding == 'CHUNKED':
-                        slen = format(len(material), 'x')
-                        self.ostream.write(slen.encode('utf-8'))
-                        self.ostream.write("\r\n".encode('utf-8'))
-                        self.ostream.write(material)
-                        self.ostream.write("\r\n".encode('utf-8'))
-                    else:
-                        self.ostream.write(material)
-    
-            class bsonWriter(baseWriter):
-                def __init__(self, ostream, encoding):
-                    self.ostream = ostream
-                    self.encoding = encoding
-
-                def prologue(self,things=None):
-                    pass
+        #  Pick the writer for the output format negotiated from Accept.
+        #  Returns (content type, writer over ostream).
+        def makeWriter(self, ostream, addtl_hdrs):
+            encoding = None
 
-                def emit(self,doc):
-                    bytes = bson.BSON.encode(doc)
-                    self.writeWrap(bytes)
+            if addtl_hdrs is not None:
+                for k,v in addtl_hdrs.items():
+                    if k.upper() == "TRANSFER-ENCODING" and v == "chunked":
+                        encoding = "CHUNKED"
 
-                def epilogue(self,things=None):
-                    if self.encoding == 'CHUNKED':
-                        self.writeWrap(b'')  # The zero length chunk!
+            # Decided by chk_accept() once the function is known.  An
+            # error before that goes out in the best registered format.
+            if self.negotiated is None:
+                xx = self.server.parent
+                accept = self.headers['Accept'] if 'Accept' in self.headers else None
+                self.negotiated = xx.negotiate(accept) or xx.negotiate(None)
+            (mime, writerClass, params) = self.negotiated
 
+            theWriter = writerClass(ostream, encoding, params)
+            fmt = theWriter.contentType
 
-            class jsonWriter(baseWriter):
-                def __init__(self, ostream, fmt, crdelim, encoding):
-                    self.ostream = ostream
-                    self.fmt = fmt
-                    self.crdelim = crdelim
-                    self.encoding = encoding
-                    self.wroteOne = False
+            theWriter.flushBytes = self.server.parent.flush_bytes
+            theWriter.flushMillis = self.server.parent.flush_millis
+            self.theWriter = theWriter  # for logCall
 
-                def prologue(self,things=None):
-                    pass
+            return (fmt, theWriter)
 
-                def emit(self,doc):
-                    import io
 
-                    if self.crdelim is False:
-                        if self.wroteOne is False:
-                            self.writeWrap(b'[')
-                        else:
-                            self.writeWrap(b',')
+        def sendHeaders(self, respCode, fmt, addtl_hdrs):
+            self.tFirst = time.monotonic()
+            self.sentCode = respCode
+            self.send_response(respCode)
 
-                    fstr = io.BytesIO()
-                    mson.write(fstr, doc, self.fmt)
-                    bytes = fstr.getvalue()
-                    fstr.close()
+            self.send_header('Content-type', fmt)
             
-                    self.writeWrap(bytes)
-                    self.wroteOne = True
-
-                def epilogue(self,things=None):
-                    if self.crdelim is False and self.wroteOne is True:
-                        self.writeWrap(b']')
-                    if self.encoding == 'CHUNKED':
-                        self.writeWrap(b'')  # The zero length chunk!
-
+            if addtl_hdrs is not None:
+                for k,v in addtl_hdrs.items():
+                    self.send_header(k,v) 
 
+            if self.respHdrs is not None:
+                for k,v in self.respHdrs.items():
+                    self.send_header(k,v)
 
+            if self.server.parent.cors is not None:
+                self.send_header('Access-Control-Allow-Origin', self.server.parent.cors)
 
-            # Give start() a chance to do something; it is required mostly
-            # because it must provide a response code.
-            (respCode, addtl_hdrs, inititems, keepGoing) = handler.start(self.command, self.headers, args, self.rfile)
+            if self.server.parent.server_timing and self.timing is not None:
+                self.send_header('Server-Timing', self.timing.header())
+                theWriter = self.theWriter
+                if theWriter is not None and theWriter.encoding == 'CHUNKED':
+                    self.send_header('Trailer', 'Server-Timing')
+                    theWriter.trailers = lambda: {'Server-Timing': self.timing.header()}
 
-            self.send_response(respCode)
+            self.end_headers()
 
 
-            fmt = 'application/json'  # default
-            afmt = fmt
-            jfmt = mson.PURE
-            crdelim = False
-            encoding = None
+        #  Pick the Content-Encoding from Accept-Encoding if compression is
+        #  on for this function (help() "compress", else wargs compress)
+        #  and start() has not set Content-Encoding or Content-Length
+        #  itself; Content-Encoding: identity from start() means "don't".
+        #  Returns (addtl_hdrs, coding or None).
+        def chooseCoding(self, addtl_hdrs):
+            xx = self.server.parent
 
             if addtl_hdrs is not None:
                 for k,v in addtl_hdrs.items():
-                    if k.upper() == "TRANSFER-ENCODING" and v == "chunked":
-                        encoding = "CHUNKED"
-
+                    if k.upper() == "CONTENT-ENCODING":
+                        if v.strip().lower() == "identity":
+                            addtl_hdrs = dict([(k2,v2) for (k2,v2) in addtl_hdrs.items() if k2 != k])
+                        return (addtl_hdrs, None)
+                    if k.upper() == "CONTENT-LENGTH":
+                        return (addtl_hdrs, None)
 
-            theWriter = jsonWriter(self.wfile, jfmt, crdelim, encoding)
+            spec = self.fspec
+            wanted = spec.compress if spec is not None and spec.compress is not None else xx.compress
+            if not wanted:
+                return (addtl_hdrs, None)
 
-            #  We expect simple
-            #  Accept: application/json,json 
-            #  No fancy alternative and q factor stuff.
+            addtl_hdrs = dict(addtl_hdrs or {})
+            addtl_hdrs['Vary'] = "Accept-Encoding"
 
-            gg = []
-            if 'Accept' in self.headers:
-                gg = [ x.strip() for x in self.headers['Accept'].split(';')]
-                afmt = gg[0] # just take first one; very simple
+            accept = self.headers['Accept-Encoding'] if 'Accept-Encoding' in self.headers else None
+            return (addtl_hdrs, xx.negotiateEncoding(accept))
 
-            if afmt == "application/bson":
-                fmt = 'application/bson'
-                theWriter = bsonWriter(self.wfile, encoding)
-               
-            elif afmt == "application/json" or afmt == "application/ejson":
 
-                if afmt == "application/json":
-                    fmt = afmt
-                    jfmt = mson.PURE
+        def compressMinBytes(self):
+            spec = self.fspec
+            if spec is not None and spec.compressMinBytes is not None:
+                return spec.compressMinBytes
+            return self.server.parent.compress_min_bytes
 
-                elif afmt == "application/ejson":
-                    fmt = afmt
-                    jfmt = mson.MONGO
-                   
-                # json and ejson support boundary=[LF,CR]
-                if len(gg) > 1:
-                    for item in gg:
-                        attr = item.split("=")
-                        if attr[0] == "boundary":
-                            if attr[1] in ['LF','CR']:
-                                crdelim = True
-                                fmt += "; boundary=LF"
-                            else:
-                                print("unsupported json boundary") # TBD
 
-                theWriter = jsonWriter(self.wfile, jfmt, crdelim, encoding)
+        def compressWith(self, theWriter, coding, onStart):
+            theWriter.compressWith(coding, self.compressMinBytes(), self.server.parent.compress_level, onStart)
 
 
-            # else afmt is an unrecognized fmt; should do something about this
-            self.send_header('Content-type', fmt)
-            
-            if addtl_hdrs is not None:
-                for k,v in addtl_hdrs.items():
-                    self.send_header(k,v) 
-
-            if self.server.parent.cors is not None:
-                self.send_header('Access-Control-Allow-Origin', self.server.parent.cors)
+        #  Send the status line and headers and return the writer for the
+        #  output format negotiated from Accept.  If the body is to be
+        #  compressed the headers go out with the first flush instead.
+        #  With cacheHdrs (the headers from start()), output is held back
+        #  until the end so it can be cached and sent with an ETag, unless
+        #  it outgrows what the function may cache.
+        def beginResponse(self, respCode, addtl_hdrs, cacheHdrs=None):
+            xx = self.server.parent
 
-            self.end_headers()
+            (addtl_hdrs, coding) = self.chooseCoding(addtl_hdrs)
+
+            (fmt, theWriter) = self.makeWriter(self.wfile, addtl_hdrs)
+
+            if coding is None and cacheHdrs is None:
+                self.sendHeaders(respCode, fmt, addtl_hdrs)
+                return theWriter
+
+            if cacheHdrs is not None:
+                theWriter.flushBytes = min(self.fspec.cacheBytes, xx.cache.maxBytes) + 1
+                theWriter.flushMillis = float('inf')
+
+            def onStart(used, final):
+                hdrs = dict(addtl_hdrs or {})
+                if cacheHdrs is not None:
+                    theWriter.flushBytes = xx.flush_bytes
+                    theWriter.flushMillis = xx.flush_millis
+                    self.cacheVary(hdrs)
+                    if final:
+                        ee = self.cachePut(fmt, cacheHdrs, bytes(theWriter.buf))
+                        hdrs['ETag'] = ee.tag(used)
+                if used is not None:
+                    hdrs['Content-Encoding'] = used
+                self.sendHeaders(respCode, fmt, hdrs)
+
+            if coding is None:
+                theWriter.holdHeaders(onStart)
+            else:
+                self.compressWith(theWriter, coding, onStart)
 
+            return theWriter
 
 
+        #
+        #  RESPONSE CACHE (functions with "cache" in help(); GET only)
+        #
+        #  If the response is in the cache, send it and return True.
+        def cacheHit(self):
+            if self.cacheKey is None:
+                return False
+
+            self.timing.phase("cache")
+            ee = self.server.parent.cache.get(self.cacheKey)
+            if ee is None:
+                self.cacheState = "miss"
+                self.timing.phase(None)
+                return False
+
+            self.cacheState = "hit"
+            self.serveCached(ee)
+            self.timing.phase(None)
+            return True
+
+        #  The headers from start() to cache with the response, or None if
+        #  this response is not to be cached.
+        def cacheHeaders(self, respCode, addtl_hdrs):
+            if self.cacheKey is None or respCode != 200:
+                return None
+            if addtl_hdrs is not None:
+                for k in addtl_hdrs:
+                    if k.upper() in ("TRANSFER-ENCODING", "CONTENT-LENGTH", "CONTENT-ENCODING"):
+                        return None
+            return dict(addtl_hdrs or {})
+
+        #  A cached response is picked by output format, so it varies
+        #  with Accept as well as with Accept-Encoding if compressed
+        def cacheVary(self, hdrs):
+            vary = hdrs['Vary'] if 'Vary' in hdrs else None
+            if vary is None:
+                hdrs['Vary'] = "Accept"
+            elif "accept" not in [v.strip().lower() for v in vary.split(',')]:
+                hdrs['Vary'] = "Accept, " + vary
+
+        def cachePut(self, fmt, hdrs, body):
+            spec = self.fspec
+            return self.server.parent.cache.put(self.cacheKey, fmt, hdrs, body, spec.cacheTTL, spec.cacheBytes)
+
+        #  Everything start() returned is in hand:  build it, cache it,
+        #  and send it as if it had come from the cache.
+        def respondCached(self, cacheHdrs, inititems):
+            import io
+
+            buf = io.BytesIO()
+            (fmt, theWriter) = self.makeWriter(buf, None)
             theWriter.prologue()
+            self.emitItems(theWriter, inititems)
+            theWriter.epilogue()
+
+            self.serveCached(self.cachePut(fmt, cacheHdrs, buf.getvalue()))
 
+        def serveCached(self, ee):
+            xx = self.server.parent
 
+            (hdrs, coding) = self.chooseCoding(ee.hdrs)
+            body = ee.body
+            used = None
+            if coding is not None and len(body) >= self.compressMinBytes():
+                body = xx.cache.variant(ee, coding, xx.compress_level, self.fspec.cacheBytes)
+                used = coding
+
+            etag = ee.tag(used)
+            hdrs = dict(hdrs or {})
+            hdrs['ETag'] = etag
+            self.cacheVary(hdrs)
+            if self.close_connection and self.protocol_version >= "HTTP/1.1":
+                hdrs['Connection'] = "close"
+
+            (fmt, theWriter) = self.makeWriter(self.wfile, None)
+
+            inm = self.headers['If-None-Match'] if 'If-None-Match' in self.headers else None
+            if inm is not None:
+                tags = [ t.strip() for t in inm.split(',')]
+                if "*" in tags or etag in tags or ("W/" + etag) in tags:
+                    self.cacheState = "notModified"
+                    for k in list(hdrs):
+                        if k not in ('ETag', 'Vary', 'Connection'):
+                            del hdrs[k]
+                    self.sendHeaders(304, ee.fmt, hdrs)
+                    return
+
+            if used is not None:
+                hdrs['Content-Encoding'] = used
+            hdrs['Content-Length'] = str(len(body))
+            self.sendHeaders(200, ee.fmt, hdrs)
+            theWriter.coding = used
+            theWriter.send(body)
+
+
+        def emitItems(self, theWriter, inititems):
             if inititems != None:
                 if inititems.__class__.__name__ == 'list':
                     for ww in inititems:
                         if ww is not None:
                             theWriter.emit(ww)
+                            self.docsOut += 1
                 else:
                     theWriter.emit(inititems)
+                    self.docsOut += 1
+
+
+        def respond(self, args, handler):
+            #  With HTTP/1.1 keep-alive the response must be framed so the
+            #  client can find the end of it, and the request body must be
+            #  drained so we can find the start of the next request.
+            framed = self.protocol_version >= "HTTP/1.1" and self.request_version >= "HTTP/1.1"
+            if not framed:
+                # The end of the connection is the end of the response, even
+                # for an HTTP/1.0 client that asked for keep-alive
+                self.close_connection = True
+
+            rfile = self.rfile
+            if framed:
+                rfile = WebF.bodyReader(self.rfile, self.headers)
+                self.chkRequestCount()
+            elif WebF.bodyReader.isChunked(self.headers):
+                rfile = WebF.bodyReader(self.rfile, self.headers)
+
+            if self.cacheHit():
+                if framed:
+                    self.finishBody(rfile)
+                return
+
+            # Give start() a chance to do something; it is required mostly
+            # because it must provide a response code.  A parked stream
+            # had its start() on the call that began it.
+            if self.resumed is not None:
+                (respCode, addtl_hdrs) = self.resumed.reply
+                (inititems, keepGoing) = (None, True)
+            else:
+                self.timing.phase("start")
+                try:
+                    (respCode, addtl_hdrs, inititems, keepGoing) = handler.start(self.command, self.headers, args, rfile)
+                except WebF.badBody as e:
+                    handler = self.rejectBody(e)
+                    (respCode, addtl_hdrs, inititems, keepGoing) = handler.start(self.command, self.headers, args, rfile)
+                if self.cursorState == "checkpoint" and respCode == 200:
+                    handler.resume(self.cursor['p'])
+                self.timing.phase(None)
+            reply = (respCode, addtl_hdrs)
+
+            cacheHdrs = self.cacheHeaders(respCode, addtl_hdrs)
+            if cacheHdrs is not None and keepGoing is False:
+                self.respondCached(cacheHdrs, inititems)
+                if framed:
+                    self.finishBody(rfile)
+                return
+
+            if framed:
+                hdrnames = [k.upper() for k in addtl_hdrs] if addtl_hdrs is not None else []
+                if self.close_connection:
+                    addtl_hdrs = dict(addtl_hdrs or {})
+                    addtl_hdrs['Connection'] = "close"
+
+                if "TRANSFER-ENCODING" in hdrnames or "CONTENT-LENGTH" in hdrnames:
+                    pass   # start() has taken responsibility for framing
+
+                elif keepGoing is False:
+                    #  Everything there is to send is in hand; build it
+                    #  and send it with a Content-Length:
+                    import io
+                    self.timing.phase("encode")
+                    buf = io.BytesIO()
+                    (addtl_hdrs, coding) = self.chooseCoding(addtl_hdrs)
+                    (fmt, theWriter) = self.makeWriter(buf, addtl_hdrs)
+                    if coding is not None:
+                        self.compressWith(theWriter, coding, lambda used, final: None)
+                    theWriter.prologue()
+                    self.emitItems(theWriter, inititems)
+                    theWriter.epilogue()
+                    body = buf.getvalue()
+                    self.timing.phase(None)
+
+                    addtl_hdrs = dict(addtl_hdrs or {})
+                    if theWriter.coding is not None:
+                        addtl_hdrs['Content-Encoding'] = theWriter.coding
+                    addtl_hdrs['Content-Length'] = str(len(body))
+                    self.sendHeaders(respCode, fmt, addtl_hdrs)
+                    self.wfile.write(body)
+                    self.finishBody(rfile)
+                    return
+
+                else:
+                    addtl_hdrs = dict(addtl_hdrs or {})
+                    addtl_hdrs['Transfer-Encoding'] = "chunked"
+
+            elif self.protocol_version >= "HTTP/1.1":
+                addtl_hdrs = dict(addtl_hdrs or {})
+                addtl_hdrs['Connection'] = "close"
+
+            theWriter = self.beginResponse(respCode, addtl_hdrs, cacheHdrs)
+
+            theWriter.prologue()
+
+            self.emitItems(theWriter, inititems)
 
             if keepGoing is False:
                 theWriter.epilogue()
                 return
 
-            mmm = getattr(handler, "next", None)
-            if callable(mmm):              
-                for r in handler.next():
+            flusher = self.server.parent.flusher
+            if flusher is not None:
+                flusher.add(theWriter)
+            try:
+                mmm = getattr(handler, "next", None)
+                if self.cursor is not None and callable(mmm):
+                    self.streamCursor(theWriter, handler, reply)
+
+                elif callable(mmm):
+                    self.gen = handler.next()
+                    w0 = self.timing.secs("write")
+                    tLoop = time.monotonic()
+                    try:
+                        for r in theWriter.idleWhile(self.gen):
+                            theWriter.emit(r)
+                            self.docsOut += 1
+                    finally:
+                        self.timing.loop(tLoop, w0)
+                    self.gen = None
+
+                mmm = getattr(handler, "end", None)
+                if callable(mmm) and not self.parked:
+                    self.timing.phase("end")
+                    footerdoc = handler.end()
+                    self.ended = True
+                    self.timing.phase(None)
+                    if footerdoc != None:
+                        theWriter.emit(footerdoc)
+                        self.docsOut += 1
+
+                theWriter.epilogue()
+            finally:
+                if flusher is not None:
+                    flusher.remove(theWriter)
+
+            if framed:
+                self.finishBody(rfile)
+
+
+        #  The next() loop in cursor mode.  After every "every" docs a doc
+        #  {"_cursor": token} goes out.  A page that is full with more to
+        #  come ends with a token, and the stream is parked (or, without
+        #  parking, closed and ended); so is a stream whose client goes
+        #  away after it got a token.  Docs sent since each of the last two
+        #  tokens are kept to be sent again, since the client may not have
+        #  seen them (or the latest token) after all.
+        def streamCursor(self, theWriter, handler, reply):
+            import collections
+
+            cc = self.cursor
+            marks = {cc['s']: 0} if cc['s'] > 0 else {}   # token seq -> index in sent
+            sent = []
+            pending = collections.deque()   # docs to send again first
+
+            if self.resumed is not None:
+                self.gen = self.resumed.gen
+                pending.extend(self.resumed.replay)
+                cc['s'] = self.resumed.top
+            else:
+                self.gen = handler.next()
+
+            n = 0      # docs since the latest token
+            page = 0   # docs in this call
+            docs = theWriter.idleWhile(self.gen)
+            w0 = self.timing.secs("write")
+            tLoop = time.monotonic()
+            try:
+                while True:
+                    if pending:
+                        r = pending.popleft()
+                    else:
+                        try:
+                            r = next(docs)
+                        except StopIteration:
+                            break
+
+                    sent.append(r)
                     theWriter.emit(r)
+                    self.docsOut += 1
+                    n += 1
+                    page += 1
+
+                    # The generator, and so position(), is past the docs
+                    # still to be sent again:
+                    if pending:
+                        continue
+
+                    if self.pageSize is not None and page >= self.pageSize:
+                        position = handler.position()
+                        try:
+                            pending.append(next(self.gen))
+                        except StopIteration:
+                            break
+                        self.emitCursor(theWriter, position, marks, sent)
+                        if not self.server.parent.cursors.parking:
+                            self.gen.close()
+                            break
+                        self.parkStream(handler, reply, marks, sent + list(pending))
+                        return
 
-            mmm = getattr(handler, "end", None)
-            if callable(mmm):              
-                footerdoc = handler.end()
-                if footerdoc != None:
-                    theWriter.emit(footerdoc)
+                    if n >= self.fspec.cursorEvery:
+                        self.emitCursor(theWriter, handler.position(), marks, sent)
+                        n = 0
 
-            theWriter.epilogue()
+            except WebF.clientGone:
+                if len(marks) > 0 and self.server.parent.cursors.parking:
+                    self.parkStream(handler, reply, marks, sent + list(pending))
+                raise
+            finally:
+                self.timing.loop(tLoop, w0)
+
+            self.gen = None
+
+
+        def emitCursor(self, theWriter, position, marks, sent):
+            cc = self.cursor
+            seq = cc['s'] + 1
+            theWriter.emit({"_cursor": self.server.parent.cursors.token(cc, position, seq)})
+            cc['s'] = seq
+
+            marks[seq] = len(sent)
+            if len(marks) > 2:
+                del marks[min(marks)]
+            cut = min(marks.values())
+            del sent[:cut]
+            for k in marks:
+                marks[k] -= cut
+
+
+        def parkStream(self, handler, reply, marks, docs):
+            xx = self.server.parent
+            xx.cursors.park(WebF.cursorTable.entry(self.cursor, marks, docs, self.gen, handler, reply, self.fspec.cursorTTL))
+            self.gen = None
+            self.parked = True
+
+
+        #  How long the next write may take:  writeTimeout, but no later
+        #  than drainTimeout after the headers went out.  None is forever.
+        def writeTimeLeft(self):
+            xx = self.server.parent
+            timeout = xx.write_timeout
+            if xx.drain_timeout is not None and self.tFirst is not None:
+                left = self.tFirst + xx.drain_timeout - time.monotonic()
+                if left <= 0:
+                    raise WebF.clientGone("timeout")
+                timeout = left if timeout is None else min(timeout, left)
+            return timeout
+
+
+        #  The client is gone (or too slow) mid-response:  stop the
+        #  handler's generator and give it a chance to let go of whatever
+        #  it holds with abort(), or else end() if that has not run yet.
+        def abandon(self, handler, reason):
+            self.disconnect = reason
+            self.close_connection = True
+            if self.parked:
+                return   # the stream waits in the cursor table
+
+            (gen, self.gen) = (self.gen, None)
+            if gen is not None:
+                try:
+                    gen.close()   # GeneratorExit at its yield
+                except Exception:
+                    traceback.print_exc()
+
+            mmm = getattr(handler, "abort", None)
+            if not callable(mmm) and not self.ended:
+                mmm = getattr(handler, "end", None)
+            if callable(mmm):
+                try:
+                    mmm()
+                except Exception:
+                    traceback.print_exc()
+
+
+        #  Honor maxRequestsPerConnection:  the last allowed request on a
+        #  connection gets Connection: close.
+        def chkRequestCount(self):
+            xx = self.server.parent
+            self.requestCount += 1
+            if xx.max_requests is not None and self.requestCount >= xx.max_requests:
+                self.close_connection = True
+
+
+        #  start() could not read the request body (WebF.badBody):  the
+        #  error handler answers 400 instead, and with the body in an
+        #  unknown state the connection cannot be used again.
+        def rejectBody(self, e):
+            self.close_connection = True
+            self.bodyErr = {
+                'errcode': 16,
+                'msg': "bad request body",
+                'data': str(e)
+                }
+            return self.server.parent.errHandler(400, [self.bodyErr])
+
+
+        #  Skip whatever part of the request body start() did not read so
+        #  the next request on this connection starts in the right place.
+        #  If that is not possible or too much, give up on the connection.
+        def finishBody(self, rfile):
+            if rfile.chunked:
+                try:
+                    drained = 0
+                    while not rfile.eof and drained <= WebF.bodyReader.maxDrain:
+                        drained += len(rfile.read(65536))
+                except ValueError:
+                    pass   # garbled chunking
+                if not rfile.eof:
+                    self.close_connection = True
+            elif rfile.remaining is None:
+                self.close_connection = True
+            elif rfile.remaining > 0:
+                if rfile.remaining > WebF.bodyReader.maxDrain:
+                    self.close_connection = True
+                else:
+                    while rfile.remaining > 0 and len(rfile.read(min(rfile.remaining, 65536))) > 0:
+                        pass
+                    if rfile.remaining > 0:
+                        self.close_connection = True
 
 
         #
-        #  RATE LIMIT
+        #  MIDDLEWARE
+        #  The stages of xx.middleware, in order, until one answers.
         #
-        def chk_rateLimit(self, xx):
+        def chk_middleware(self, xx, path):
             respCode = 200  # assume all OK
             err = None
 
-            if xx.rateLimiter is not None:
-                import ratelimit # needed for ratelimit.exception 
+            clrt = self.client_address  # not a func, a tuple!
+            self.caller = {
+                "name": self.address_string(),
+                "ip": clrt[0],
+                "port": clrt[1]
+                }
 
-                try: 
-                    # Fancy way of calling decorator:
-                    xx.rateLimiter.__call__(lambda: None)()
-                    
-                except ratelimit.exception.RateLimitException as e:
-                    err = {
-                        'errcode': 9,
-                        'msg': "call rate limit exceeded"
-                        }
-                    respCode = 429
+            tt = self.timing
+            for (name, stage, context) in xx.middleware.stages:
+                tt.phase(name)
+                rr = stage(self.caller, self.command, path, self.headers, context)
+                if rr is not None:
+                    (respCode, err) = rr[0:2]
+                    if len(rr) > 2 and rr[2]:
+                        self.respHdrs = dict(self.respHdrs or {})
+                        self.respHdrs.update(rr[2])
+                    break
 
             return (respCode, err)
 
 
-
-        def chk_headers(self, xx):
+        #
+        #  OUTPUT FORMAT
+        #
+        def chk_accept(self, xx, extra=None):
             respCode = 200  # assume all OK
             err = None
 
-            if xx.match_header is not None:
-                for hdrname in xx.match_header:
-                    mm = None
-                    for rr in xx.match_header[hdrname]:
-                        item = self.headers[hdrname] if hdrname in self.headers else ""
-                        mm = re.search(rr, item)
-                        if mm is not None:
-                            break
+            accept = self.headers['Accept'] if 'Accept' in self.headers else None
+            self.negotiated = xx.negotiate(accept, extra)
 
-                    if mm is None:
-                        err = {
-                            'errcode': 11,
-                            'msg': "header %s value is invalid" % hdrname
-                            }
-                        respCode = 400
+            if self.negotiated is None:
+                err = {
+                    'errcode': 13,
+                    'msg': "no acceptable output format",
+                    'data': accept
+                    }
+                respCode = 406
+                self.negotiated = xx.negotiate(None)   # for the error
 
             return (respCode, err)
 
 
+        #
+        #  RATE LIMIT
+        #  The function's own limit from help(), once the caller is
+        #  authenticated:  per (function, client IP, user).  The
+        #  server-wide limits are the "rateLimit" middleware stage.
+        #
+        def chk_rateLimit(self, xx, func, limit, user=None):
+            respCode = 200  # assume all OK
+            err = None
+
+            wait = xx.rateLimiter.take((func, self.client_address[0], user), limit)
+            if wait > 0:
+                (respCode, err, hdrs) = WebF.rateLimiter.refuse(wait)
+                self.respHdrs = dict(self.respHdrs or {})
+                self.respHdrs.update(hdrs)
+
+            return (respCode, err)
+
+
+        #
+        #  CURSOR
+        #  Functions with "cursor" in help() (and a regular next()) stream
+        #  in cursor mode.  A _cursor token picks up its parked stream,
+        #  whose function instance becomes the handler, or else needs the
+        #  function's resume() to start over from the token's position.
+        #  Without parking (several workers) a function without resume()
+        #  could not be taken up, so it streams without cursors.
+        #  Returns (respCode, err, handler).
+        #
+        def chk_cursor(self, xx, func, args, user, params, cursorFrom, handler):
+            respCode = 200  # assume all OK
+            err = None
+
+            spec = self.fspec
+            if spec.cursorEvery is None or WebF.asyncHTTPHandler.isAsync(handler):
+                if cursorFrom is not None:
+                    err = {
+                        'errcode': 14,
+                        'msg': "invalid cursor"
+                        }
+                    respCode = 400
+                return (respCode, err, handler)
+
+            resumable = callable(getattr(handler, "resume", None))
+            if cursorFrom is None and not xx.cursors.parking and not resumable:
+                return (respCode, err, handler)
+
+            self.pageSize = spec.cursorPage
+            if '_pageSize' in params:
+                try:
+                    self.pageSize = int(params['_pageSize'])
+                except ValueError:
+                    self.pageSize = 0
+                if self.pageSize < 1:
+                    err = {
+                        'errcode': 14,
+                        'msg': "invalid cursor",
+                        'data': "_pageSize"
+                        }
+                    return (400, err, handler)
+
+            if cursorFrom is None:
+                self.cursor = {"f": func, "a": args, "u": user, "c": WebF.cursorTable.newId(), "s": 0}
+                self.cursorState = "new"
+
+            elif cursorFrom['u'] != user:
+                err = {
+                    'errcode': 14,
+                    'msg': "invalid cursor"
+                    }
+                respCode = 400
+
+            else:
+                self.cursor = cursorFrom
+                if xx.cursors.parking:
+                    self.resumed = xx.cursors.take(cursorFrom['c'], cursorFrom['s'])
+                if self.resumed is not None:
+                    self.cursorState = "live"
+                    handler = self.resumed.handler
+                elif resumable:
+                    self.cursorState = "checkpoint"
+                else:
+                    err = {
+                        'errcode': 15,
+                        'msg': "cursor expired"
+                        }
+                    respCode = 410
+
+            return (respCode, err, handler)
+
+
 
         def getHandlerForFunc(self, xx, path):
             user = None
             respCode = 200
+            tt = self.timing
+            tt.phase("route")
 
             # Extract params (after the '?') from the rest of it:
             prefunc,params = self.parse(path)
@@ -423,21 +3303,11 @@ class WebF:
                     prefunc = xx.helpFuncName
 
                 
-            func = None
-            restful = None
-
-            #  Basically, do a longest-first match to get the name:
-            for fname,v in sorted(xx.fmap.items(), key=lambda k: (len(k),k), reverse=True):
-                lname = len(fname)
-                frag = prefunc[:lname]
-                #print("[%s] %d [%s] %d" % (fname,lname,frag,len(frag)))
-                if fname == frag:
-                    func = fname
-                    restful = prefunc[lname+1:]  # hop over the /
-                    if restful == "":
-                        restful = None
-                    break
-                
+            #  Longest registered path prefix wins; the route table is
+            #  rebuilt only upon register/deregister so this is just a walk
+            #  down the path segments:
+            (func, restful) = xx.routes.match(prefunc)
+
             if restful is not None:
                 qq = restful.split('/')
                 params['_'] = qq
@@ -458,12 +3328,49 @@ class WebF:
 
 
             # We have a valid registered function!
-            # Construct a NEW handler instance!
+            # Construct a NEW handler instance (or reuse one from its pool)!
             # From here on down, the function handler can now deal
             # with errors (because we have found a valid funciton)
             (hname,context) = xx.fmap[func]
-            handler = hname(context)
+            pool = xx.pools.get(func)
+            if pool is not None:
+                #  The asyncio engine must not park an executor thread
+                #  here:  the calls holding instances need those threads
+                #  to finish.  It waits on the event loop (resumePrepare).
+                timeout = xx.fspecs[func].poolTimeout
+                (handler, self.poolWait) = pool.acquire(timeout if self.poolThreadWait else 0)
+                if handler is None:
+                    if not self.poolThreadWait:
+                        self.poolPending = (pool, func, params, timeout)
+                        return (func, None, respCode, None, user, None)
+                    return self.poolBusy(xx, func)
+                self.pooled = (pool, handler)
+            else:
+                handler = hname(context)
+
+            return self.setupHandler(xx, func, params, handler)
+
+
+        #  No instance of func came free within its poolTimeout
+        def poolBusy(self, xx, func):
+            err = {
+                'errcode': 12,
+                'msg': "server busy",
+                'data': func
+                }
+            respCode = 503
+            handler = xx.errHandler(respCode, [err])
+            return (func, None, respCode, err, None, handler)
 
+
+        #  The rest of getHandlerForFunc once there is an instance of func
+        #  to call:  args, authentication, and the checks that need them.
+        def setupHandler(self, xx, func, params, handler):
+            user = None
+            respCode = 200
+            tt = self.timing
+
+            tt.phase("args")
             try:
                 args = mson.parse(params['args'], mson.MONGO) if 'args' in params else {}
                 if '_' in params:
@@ -478,14 +3385,31 @@ class WebF:
                 handler = xx.errHandler(respCode, [err])
                 return (func, None, respCode, err, user, handler) # BAIL OUT
 
-            
+            #  Taking up a cursor:  the args are the ones in the token
+            cursorFrom = None
+            if '_cursor' in params:
+                cursorFrom = xx.cursors.decode(params['_cursor'], func)
+                if cursorFrom is None:
+                    err = {
+                        'errcode': 14,
+                        'msg': "invalid cursor"
+                        }
+                    respCode = 400
+                    handler = xx.errHandler(respCode, [err])
+                    return (func, None, respCode, err, user, handler) # BAIL OUT
+                args = cursorFrom['a']
+
+
             #  Basic stuff is OK, args if are parsed (but not checked) and handler is set.
             #  Move on.
             #  Check args and authentication.  If either is bad, then
             #  SWITCH the handler to the error handler and set an
             #  appropriate HTTP return code.
-            zz = handler.help()
-            argerrs = self.chkArgs(zz, args)
+            spec = xx.fspecs[func]
+            if spec.dynamic:
+                spec = WebF.funcSpec(handler.help())
+            self.fspec = spec
+            argerrs = spec.check(args)
 
             if len(argerrs) > 0:
                 respCode = 400
@@ -494,24 +3418,37 @@ class WebF:
 
 
             tt2 = None
+            tt.phase("auth")
 
-            # Low impact so get it out of the way, even if
-            # unused...
-            clrt = self.client_address  # not a func, a tuple!
-            clrh = {
-                "name": self.address_string(),
-                "ip": clrt[0],
-                "port": clrt[1]
-                }
+            clrh = self.caller
 
             # Go for local override first...
             authMethod = getattr(handler, "authenticate", None)
 
-            if callable(authMethod):
-                tt2 = authMethod(clrh, self.headers, args)
+            #  With authCache, the credentials' fingerprint may stand in
+            #  for asking again
+            authKey = None
+            if xx.auth_cache is not None:
+                if callable(authMethod):
+                    keyMethod = getattr(handler, "authKey", None)
+                else:
+                    keyMethod = xx.auth_key if xx.auth_handler is not None else None
+                if callable(keyMethod):
+                    fingerprint = keyMethod(clrh, self.headers, args)
+                    if fingerprint is not None:
+                        authKey = (func, fingerprint)
+                        tt2 = xx.auth_cache.get(authKey)
+                        self.authState = "miss" if tt2 is None else "hit"
+
+            if self.authState != "hit":
+                if callable(authMethod):
+                    tt2 = authMethod(clrh, self.headers, args)
+
+                elif xx.auth_handler is not None:
+                    tt2 = xx.auth_handler(handler, xx.auth_context, clrh, self.headers, args)
 
-            elif xx.auth_handler is not None:
-                tt2 = xx.auth_handler(handler, xx.auth_context, clrh, self.headers, args)
+                if authKey is not None and tt2 is not None:
+                    xx.auth_cache.put(authKey, tuple(tt2))
 
             if tt2 is not None:
                 # Expect (T|F, name, data)
@@ -531,35 +3468,80 @@ class WebF:
                     return (func, args, respCode, err, user, handler) # BAIL OUT
 
 
+            if spec.rateLimit is not None:
+                tt.phase("rateLimit")
+                (respCode, err) = self.chk_rateLimit(xx, func, spec.rateLimit, user)
+                if respCode != 200:
+                    handler = xx.errHandler(respCode, [err])
+                    return (func, args, respCode, err, user, handler) # BAIL OUT
+
+            #  Functions may offer output formats of their own
+            tt.phase("accept")
+            mmm = getattr(handler, "codecs", None)
+            (respCode, err) = self.chk_accept(xx, mmm() if callable(mmm) else None)
+            if respCode != 200:
+                handler = xx.errHandler(respCode, [err])
+                return (func, args, respCode, err, user, handler) # BAIL OUT
+
+            if spec.cacheTTL is not None and self.command == "GET":
+                self.cacheKey = WebF.responseCache.key(func, args, self.negotiated)
+
+            if spec.cursorEvery is not None or cursorFrom is not None:
+                tt.phase("cursor")
+            (respCode, err, handler) = self.chk_cursor(xx, func, args, user, params, cursorFrom, handler)
+            if respCode != 200:
+                handler = xx.errHandler(respCode, [err])
+                return (func, args, respCode, err, user, handler) # BAIL OUT
+
             # Ready to go!
             return (func, args, respCode, None, user, handler)
 
 
 
 
-        def call(self, path):
-            xx = self.server.parent
+        #  Everything up to (but not including) start():  rate limit,
+        #  headers, routing, args, and authentication.  Returns
+        #  (func, args, respCode, err, user, handler); handler is the
+        #  error handler if anything went wrong.
+        def prepare(self, xx, path):
+            self.theWriter = None
+            self.negotiated = None
+            self.fspec = None
+            self.cacheKey = None
+            self.cacheState = None
+            self.pooled = None
+            self.poolWait = None
+            self.poolPending = None
+            self.bodyErr = None
+            self.respHdrs = None
+            self.tFirst = None
+            self.tDone = None
+            self.sentCode = None
+            self.docsOut = 0
+            self.gen = None
+            self.ended = False
+            self.disconnect = None
+            self.cursor = None
+            self.cursorState = None
+            self.resumed = None
+            self.parked = False
+            self.pageSize = None
+            self.authState = None
 
             respCode    = 200
             user        = None
             args        = None
-            fmt         = None
             func        = None
             err         = None
             handler     = None
 
-            ss = datetime.datetime.now()
-
+            tt = self.timing
             try:
-                (respCode,err) = self.chk_rateLimit(xx)
+                (respCode,err) = self.chk_middleware(xx, path)
                 if respCode != 200:
                     handler = xx.errHandler(respCode, [err])
                 else:
-                    (respCode,err) = self.chk_headers(xx)
-                    if respCode != 200:
-                        handler = xx.errHandler(respCode, [err])                    
-                    else:
-                        (func,args,respCode,err,user,handler) = self.getHandlerForFunc(xx, path)
+                    (func,args,respCode,err,user,handler) = self.getHandlerForFunc(xx, path)
 
 
             except Exception as e:
@@ -574,12 +3556,119 @@ class WebF:
                traceback.print_exc() # will be picked up in local logs...?
                #raise e
 
+            tt.phase(None)
+            return (func, args, respCode, err, user, handler)
+
 
-            # One way or another we now MUST have a handler.
-            # Respond begins the start/next looper:
-            self.respond(args, handler)
+        #  The rest of prepare() for the asyncio engine, once reserve()
+        #  gave (item) what prepare() stopped for in poolPending, or gave
+        #  up (None) after poolTimeout.
+        def resumePrepare(self, xx, item, waited):
+            (pool, func, params, timeout) = self.poolPending
+            self.poolPending = None
+            self.poolWait = waited
 
+            args = None
+            user = None
+            tt = self.timing
+            try:
+                if item is None:
+                    (func,args,respCode,err,user,handler) = self.poolBusy(xx, func)
+                else:
+                    handler = pool.make(item)
+                    self.pooled = (pool, handler)
+                    (func,args,respCode,err,user,handler) = self.setupHandler(xx, func, params, handler)
 
+            except Exception as e:
+               respCode = 500
+               err = {
+                  'errcode': 6,
+                  'msg': "internal error",
+                  "data": "TBD"
+                  }
+               handler = xx.errHandler(500, [err])
+
+               traceback.print_exc()
+
+            tt.phase(None)
+            return (func, args, respCode, err, user, handler)
+
+
+        def call(self, path):
+            xx = self.server.parent
+
+            ss = datetime.datetime.now()
+            self.t0 = time.monotonic()
+            self.timing = WebF.phaseTimer(self.t0)
+
+            # Idle timeout is only for waiting between requests:
+            if self.timeout is not None:
+                self.connection.settimeout(None)
+
+            (func,args,respCode,err,user,handler) = self.prepare(xx, path)
+            stats = xx.metrics.enter(func) if xx.metrics is not None else None
+
+            wfile = self.wfile
+            self.wfile = WebF.timedWriter(wfile, self.connection, self)
+
+            try:
+                # One way or another we now MUST have a handler.
+                # Respond begins the start/next looper:
+                try:
+                    self.respond(args, handler)
+                except WebF.clientGone as e:
+                    self.abandon(handler, e.reason)
+                self.tDone = time.monotonic()
+
+                if self.timeout is not None or self.wfile.timeout is not None:
+                    self.connection.settimeout(self.timeout)
+
+                self.logCall(xx, ss, func, args, respCode, err, user, handler)
+                self.traceCall(xx, func, user)
+            finally:
+                self.wfile = wfile
+                self.releaseHandler()
+                self.recordCall(xx, stats)
+
+
+        #  Add the call to the metrics, whatever became of it
+        def recordCall(self, xx, stats):
+            if stats is None:
+                return
+            tDone = self.tDone if self.tDone is not None else time.monotonic()
+            ttfb = self.tFirst - self.t0 if self.tFirst is not None else None
+            nbytes = self.theWriter.bytesWritten if self.theWriter is not None else 0
+            status = self.sentCode if self.sentCode is not None else "aborted"
+            xx.metrics.leave(stats, status, ttfb, tDone - self.t0, self.docsOut, nbytes, self.disconnect is not None)
+
+
+        #  Hand the phases of the call to the tracer, if there is one
+        def traceCall(self, xx, func, user):
+            if xx.tracer is None:
+                return
+            trace = {
+                "func": func,
+                "user": user,
+                "status": self.sentCode if self.sentCode is not None else "aborted",
+                "start": self.timing.wall0,
+                "end": self.timing.wall0 + ((self.tDone or time.monotonic()) - self.t0),
+                "spans": self.timing.spans()
+                }
+            try:
+                xx.tracer(trace, xx.tracer_context)
+            except Exception:
+                traceback.print_exc()
+
+
+        #  Give a pooled function instance back, whatever became of the call
+        def releaseHandler(self):
+            if self.pooled is not None:
+                (pool, handler) = self.pooled
+                self.pooled = None
+                pool.release(handler)
+
+
+        def logCall(self, xx, ss, func, args, respCode, err, user, handler):
             ee = datetime.datetime.now()               
                
             loghandler = None
@@ -596,11 +3685,17 @@ class WebF:
                     uselogcontext = False
 
             if loghandler != None:
+                if xx.logs is not None:
+                    # No headers sent at all is an error too
+                    status = self.sentCode if self.sentCode is not None else 500
+                    if not xx.logs.keep(status):
+                        return
+
                 if user == None:
                     user = "ANONYMOUS"
 
-                tdelta = ee - ss
-                diffms = int(tdelta.microseconds/1000)
+                # From the monotonic clock; stime/etime are wall clock
+                diffms = int(((self.tDone or time.monotonic()) - self.t0) * 1000)
 
                 clrt = self.client_address  # not a func, a tuple!
                 clrh = {
@@ -621,8 +3716,55 @@ class WebF:
                     "err": err
                     }
 
-                if uselogcontext == True:
-                    loghandler(info, xx.log_context)
+                poolInfo = getattr(self.server, "poolInfo", None)
+                if poolInfo is not None:
+                    info['queueMillis'] = poolInfo.queueMillis
+
+                if self.poolWait is not None:
+                    info['poolWaitMillis'] = self.poolWait
+
+                if self.theWriter is not None:
+                    info['bytes'] = self.theWriter.bytesWritten
+                    info['flushes'] = self.theWriter.flushes
+                    if self.theWriter.coding is not None:
+                        info['encoding'] = self.theWriter.coding
+
+                if xx.worker is not None:
+                    info['worker'] = xx.worker
+
+                info['docs'] = self.docsOut
+                info['phaseMillis'] = self.timing.millis()
+                if self.tFirst is not None:
+                    info['ttfbMillis'] = round((self.tFirst - self.t0) * 1000, 3)
+                if self.disconnect is not None:
+                    info['disconnect'] = self.disconnect
+
+                if self.cursorState is not None:
+                    info['cursor'] = self.cursorState
+                    if self.parked:
+                        info['parked'] = True
+
+                if self.authState is not None:
+                    info['auth'] = self.authState
+                    info['authCacheStats'] = xx.auth_cache.stats()
+
+                if self.bodyErr is not None:
+                    info['status'] = 400
+                    info['err'] = self.bodyErr
+
+                if self.cacheState is not None:
+                    info['cache'] = self.cacheState
+                    info['cacheStats'] = xx.cache.stats()
+                    if self.cacheState == "notModified":
+                        info['status'] = 304
+
+                if xx.logs is not None:
+                    if uselogcontext == True:
+                        xx.logs.put(None, info)
+                    else:
+                        xx.logs.put(loghandler, (info,))
+                elif uselogcontext == True:
+                    loghandler([info] if xx.log_batched else info, xx.log_context)
                 else:
                     loghandler(info)
 
@@ -630,6 +3772,295 @@ class WebF:
 
 
 
+    #  Per-connection handler for the asyncio engine.  It reuses all of
+    #  HTTPHandler (prepare, beginResponse, the writers, logCall) but reads
+    #  the request itself from an asyncio stream instead of letting
+    #  BaseHTTPRequestHandler service a socket.  Function handlers whose
+    #  start/end are coroutines or whose next is an async generator are
+    #  driven on the loop; everything else runs on the server's executor
+    #  exactly as it would under the threaded engine.  One request per
+    #  connection (HTTP/1.0):  unlike HTTPHandler, keepAlive is not
+    #  supported here.
+    class asyncHTTPHandler(HTTPHandler):
+        poolThreadWait = False   # see getHandlerForFunc
+
+        def __init__(self, server, reader, writer):
+            # Deliberately NOT calling BaseHTTPRequestHandler.__init__,
+            # which would try to service the request synchronously.
+            self.server = server
+            self.reader = reader
+            self.writer = writer
+            self.client_address = writer.get_extra_info('peername')[:2]
+            self.close_connection = True
+            self.request_version = self.default_request_version
+            self.requestline = ""
+            self.command = None
+            self.rfile = None
+            self.wfile = writer
+
+        async def readRequest(self):
+            import http.client
+            import io
+
+            line = await self.reader.readline()
+            if not line:
+                return False
+
+            self.raw_requestline = line
+            self.requestline = line.decode('iso-8859-1').rstrip('\r\n')
+            words = self.requestline.split()
+            if len(words) != 3 or not words[2].startswith('HTTP/'):
+                self.send_error(400, "Bad request syntax (%r)" % self.requestline)
+                return False
+
+            (self.command, self.path, self.request_version) = words
+
+            raw = []
+            while True:
+                hline = await self.reader.readline()
+                raw.append(hline)
+                if hline in (b'\r\n', b'\n', b''):
+                    break
+                if len(raw) > http.client._MAXHEADERS:
+                    self.send_error(431, "Too many headers")
+                    return False
+
+            self.headers = http.client.parse_headers(io.BytesIO(b''.join(raw)))
+            return True
+
+        @staticmethod
+        def isAsync(handler):
+            import inspect
+            return (inspect.iscoroutinefunction(getattr(handler, "start", None)) or
+                    inspect.isasyncgenfunction(getattr(handler, "next", None)) or
+                    inspect.iscoroutinefunction(getattr(handler, "end", None)))
+
+        async def handleAsync(self):
+            import asyncio
+
+            loop = asyncio.get_running_loop()
+            ex = self.server.executor
+            xx = self.server.parent
+
+            try:
+                ok = await self.readRequest()
+            except (ValueError, asyncio.LimitOverrunError):
+                self.send_error(400, "Request line or header too long")
+                ok = False
+
+            if ok and not hasattr(self, 'do_' + self.command):
+                self.send_error(501, "Unsupported method (%r)" % self.command)
+                ok = False
+
+            if not ok:
+                await self.writer.drain()
+                return
+
+            ss = datetime.datetime.now()
+            self.t0 = time.monotonic()
+            self.timing = WebF.phaseTimer(self.t0)
+
+            # Sync code on the executor sees ordinary blocking files:
+            self.rfile = BlockingReader(self.reader, loop)
+            self.wfile = BlockingWriter(self.writer, loop, drain=self.drainOut)
+
+            (func,args,respCode,err,user,handler) = await loop.run_in_executor(ex, self.prepare, xx, self.path)
+            if self.poolPending is not None:
+                self.timing.phase("pool")
+                (pool, func, params, timeout) = self.poolPending
+                (item, waited) = await pool.reserve(timeout)
+                (func,args,respCode,err,user,handler) = await loop.run_in_executor(ex, self.resumePrepare, xx, item, waited)
+            stats = xx.metrics.enter(func) if xx.metrics is not None else None
+
+            try:
+                try:
+                    if WebF.asyncHTTPHandler.isAsync(handler):
+                        await self.respondAsync(args, handler)
+                    else:
+                        await loop.run_in_executor(ex, self.respond, args, handler)
+
+                    await self.drainOut()
+                except WebF.clientGone as e:
+                    await self.abandonAsync(handler, e.reason)
+                self.tDone = time.monotonic()
+
+                await loop.run_in_executor(ex, self.logCall, xx, ss, func, args, respCode, err, user, handler)
+                if xx.tracer is not None:
+                    await loop.run_in_executor(ex, self.traceCall, xx, func, user)
+            finally:
+                if self.pooled is not None:
+                    await loop.run_in_executor(ex, self.releaseHandler)
+                self.recordCall(xx, stats)
+
+
+        #  writer.drain() within writeTimeLeft(); raises WebF.clientGone
+        async def drainOut(self):
+            import asyncio
+
+            t = time.monotonic()
+            try:
+                await asyncio.wait_for(self.writer.drain(), self.writeTimeLeft())
+            except (TimeoutError, asyncio.TimeoutError) as e:
+                raise WebF.clientGone("timeout") from e
+            except OSError as e:
+                raise WebF.clientGone("disconnect") from e
+            finally:
+                now = time.monotonic()
+                self.timing.add("write", t, now, now - t)
+
+        #  abandon() for handlers that may be async
+        async def abandonAsync(self, handler, reason):
+            import asyncio
+            import inspect
+
+            loop = asyncio.get_running_loop()
+            ex = self.server.executor
+
+            self.disconnect = reason
+            if self.parked:
+                return   # the stream waits in the cursor table
+
+            (gen, self.gen) = (self.gen, None)
+
+            try:
+                if inspect.isasyncgen(gen):
+                    await gen.aclose()
+                elif gen is not None:
+                    await loop.run_in_executor(ex, gen.close)
+            except Exception:
+                traceback.print_exc()
+
+            mmm = getattr(handler, "abort", None)
+            if not callable(mmm) and not self.ended:
+                mmm = getattr(handler, "end", None)
+            try:
+                if inspect.iscoroutinefunction(mmm):
+                    await mmm()
+                elif callable(mmm):
+                    await loop.run_in_executor(ex, mmm)
+            except Exception:
+                traceback.print_exc()
+
+
+        async def respondAsync(self, args, handler):
+            import asyncio
+            import inspect
+
+            loop = asyncio.get_running_loop()
+            ex = self.server.executor
+
+            if self.cacheKey is not None:
+                self.wfile = self.writer
+                if self.cacheHit():
+                    return
+
+            # Coroutine start() gets the asyncio StreamReader as rfile
+            self.timing.phase("start")
+            try:
+                if inspect.iscoroutinefunction(handler.start):
+                    (respCode, addtl_hdrs, inititems, keepGoing) = await handler.start(self.command, self.headers, args, self.reader)
+                else:
+                    (respCode, addtl_hdrs, inititems, keepGoing) = await loop.run_in_executor(ex, handler.start, self.command, self.headers, args, self.rfile)
+            except WebF.badBody as e:
+                handler = self.rejectBody(e)
+                (respCode, addtl_hdrs, inititems, keepGoing) = handler.start(self.command, self.headers, args, self.rfile)
+            self.timing.phase(None)
+
+            # From here on we write from the loop thread:
+            self.wfile = self.writer
+
+            cacheHdrs = self.cacheHeaders(respCode, addtl_hdrs)
+            if cacheHdrs is not None and keepGoing is False:
+                self.respondCached(cacheHdrs, inititems)
+                return
+
+            theWriter = self.beginResponse(respCode, addtl_hdrs, cacheHdrs)
+            theWriter.copyOnFlush = True  # transports may keep a reference
+
+            theWriter.prologue()
+
+            self.emitItems(theWriter, inititems)
+
+            if keepGoing is False:
+                theWriter.epilogue()
+                return
+
+            #  Docs emitted before a wait for the next one go out after
+            #  flushMillis all the same; see idleFlusher
+            idle = None
+            if self.server.parent.flusher is not None:
+                period = self.server.parent.flusher.period
+                def idleFlush():
+                    nonlocal idle
+                    theWriter.idleFlush()
+                    idle = loop.call_later(period, idleFlush)
+                idle = loop.call_later(period, idleFlush)
+
+            try:
+                await self.streamAsync(theWriter, handler)
+            finally:
+                if idle is not None:
+                    idle.cancel()
+
+
+        #  next() and end() of respondAsync
+        async def streamAsync(self, theWriter, handler):
+            import asyncio
+            import inspect
+
+            loop = asyncio.get_running_loop()
+            ex = self.server.executor
+
+            mmm = getattr(handler, "next", None)
+            w0 = self.timing.secs("write")
+            tLoop = time.monotonic()
+            try:
+                if inspect.isasyncgenfunction(mmm):
+                    self.gen = mmm()
+                    async for r in self.gen:
+                        theWriter.emit(r)
+                        self.docsOut += 1
+                        await self.drainOut()
+                    self.gen = None
+
+                elif callable(mmm):
+                    self.gen = mmm()
+                    done = object()
+                    while True:
+                        r = await loop.run_in_executor(ex, next, self.gen, done)
+                        if r is done:
+                            break
+                        theWriter.emit(r)
+                        self.docsOut += 1
+                        await self.drainOut()
+                    self.gen = None
+            finally:
+                if callable(mmm):
+                    self.timing.loop(tLoop, w0)
+
+            mmm = getattr(handler, "end", None)
+            footerdoc = None
+            if inspect.iscoroutinefunction(mmm):
+                self.timing.phase("end")
+                footerdoc = await mmm()
+                self.ended = True
+                self.timing.phase(None)
+            elif callable(mmm):
+                self.timing.phase("end")
+                footerdoc = await loop.run_in_executor(ex, mmm)
+                self.ended = True
+                self.timing.phase(None)
+
+            if footerdoc != None:
+                theWriter.emit(footerdoc)
+                self.docsOut += 1
+
+            theWriter.epilogue()
+
+
+
+
+
     #
     #  wargs:
     #  port           int      listen port (default: 7778)
@@ -646,29 +4077,115 @@ class WebF:
     #  cors           URI | *  Set Access-Control-Allow-Origin to this
     #                          value.  See http CORS docs for details.
     #
-    #  rateLimit      int      Server-scoped function call rate limit per second
+    #  rateLimit      int | dict  Server-scoped function call rate limit per second,
+    #                          or {"rate": per sec, "burst": calls}
+    #  clientRateLimit int | dict  Same, but for each client IP separately
+    #  rateLimitKeys  int      most rate limit buckets (clients x functions) to
+    #                          keep track of (default: 100000)
     #  allowHelp      boolean  Permit or disable /help builtin function (default: true)
+    #  metrics        boolean  Collect per-function call metrics and serve them at
+    #                          /__metrics to whoever may call functions (default: false)
+    #  serverTiming   boolean  Send the time spent in each phase of the call in a
+    #                          Server-Timing header, and trailer if chunked (default: false)
+    #
+    #  logQueue       int      deliver log entries from a background thread through a
+    #                          queue of this many entries (default: none; on the
+    #                          request thread after the response)
+    #  logBatch       int      logQueue: entries taken off the queue at a time (default: 100)
+    #  logOverflow    string   logQueue: "drop" (default) or "block" when the queue is full
+    #  logSample      int      log one in this many successful calls; errors are
+    #                          always logged (default: 1, all of them)
+    #
+    #  writeTimeout   int      secs a client may keep us waiting to take any part of
+    #                          a response (default: none, forever)
+    #  drainTimeout   int      secs a client may take to take the whole response,
+    #                          from the headers on (default: none, forever)
+    #
+    #  workers        int      go() forks this many worker processes to serve calls
+    #                          (default: none, serve in this process).  Rate limits,
+    #                          caches, and parked cursors are per worker:  rateLimit
+    #                          and clientRateLimit allow up to workers times as many
+    #  workerGrace    int      secs workers get to finish up upon SIGTERM/SIGINT
+    #                          before they are killed (default: 30)
     #
     #  matchHeader  (dict of array of regexp)  Incoming header must match one of the specified regexp. To 
     #                 make a header mandatory but with any value use .*
+    #
+    #  engine         string   "threaded" (default: one thread per connection) or
+    #                          "asyncio" (event loop; permits async start/next/end)
+    #  executorThreads int     asyncio engine only: size of the thread pool that
+    #                          runs sync handlers and callbacks (default: python's)
+    #
+    #  maxWorkers     int      threaded engine only: serve connections from a fixed
+    #                          pool of this many threads instead of one per connection
+    #  maxQueue       int      with maxWorkers: connections allowed to wait for a worker
+    #                          (default: maxWorkers; 0: none, every worker busy means
+    #                          turned away); beyond that, 503 via errorHandler
+    #
+    #  keepAlive      boolean  threaded engine: speak HTTP/1.1 and keep connections
+    #                          open across calls (default: False, HTTP/1.0)
+    #  idleTimeout    int      keepAlive: secs to wait for the next request (default: 15)
+    #  maxRequestsPerConnection int  keepAlive: close after this many calls (default: no limit)
+    #
+    #  flushBytes     int      output is coalesced and sent when this much is
+    #                          buffered (default: 65536)
+    #  flushMillis    int      ... or when this much time passed since the last send,
+    #                          also while next() waits for its next doc
+    #                          (default: 100; 0 means send every doc right away)
+    #
+    #  compress       boolean | array  compress output per Accept-Encoding; True for
+    #                          all codings installed (zstd, br, gzip, deflate) or a list
+    #                          of them in order of preference (default: False)
+    #  compressMinBytes int    do not bother if the whole response is smaller (default: 1024)
+    #  compressLevel  int      compression level (default: each coding's own)
+    #
+    #  cacheBytes     int      memory for cached responses of functions that have
+    #                          "cache" in help(), all told (default: 64MB)
+    #
+    #  cursors        int      most streams of functions that have "cursor" in help()
+    #                          to keep parked for _cursor calls (default: 1000)
+    #  cursorSecret   string   key to sign cursor tokens with, for tokens that work
+    #                          across servers and restarts (default: random)
+    #
+    #  authCache      int      most authentication results to keep, by the fingerprint
+    #                          of the credentials from authKey() or the key function
+    #                          given to registerAuthentication (default: none kept)
+    #  authCacheTTL   int      secs a success is kept (default: 60)
+    #  authCacheNegativeTTL int  secs a failure is kept (default: 5)
                             
 
     def __init__(self, wargs=None):
 
         self.fmap = {}
+        self.fspecs = {}
+        self.pools = {}
+        self.routes = WebF.routeTable()
         self.wargs = wargs if wargs is not None else {}
 
 
-        self.rateLimiter = None
-        if 'rateLimit' in self.wargs:
-            import ratelimit   # PYTHONPATH= pip3 install ratelimit
-            self.rateLimiter = ratelimit.RateLimitDecorator(calls=self.wargs['rateLimit'],period=1)
+        # Per-function limits come from help() "rateLimit"
+        self.rate_limit = WebF.rateLimiter.limit(self.wargs['rateLimit'] if 'rateLimit' in self.wargs else None)
+        self.client_rate_limit = WebF.rateLimiter.limit(self.wargs['clientRateLimit'] if 'clientRateLimit' in self.wargs else None)
+        self.rateLimiter = WebF.rateLimiter(int(self.wargs['rateLimitKeys']) if 'rateLimitKeys' in self.wargs else 100000)
 
 
         listen_addr = self.wargs['addr'] if 'addr' in self.wargs else "localhost"
         listen_port = int(self.wargs['port']) if 'port' in self.wargs else 7778
 
-        self.httpd = MultiThreadedHTTPServer((listen_addr, listen_port), WebF.HTTPHandler)
+        engine = self.wargs['engine'] if 'engine' in self.wargs else "threaded"
+
+        if engine == "asyncio":
+            self.httpd = AsyncHTTPServer((listen_addr, listen_port), WebF.asyncHTTPHandler,
+                                         self.wargs['executorThreads'] if 'executorThreads' in self.wargs else None)
+        elif engine == "threaded":
+            if 'maxWorkers' in self.wargs:
+                maxWorkers = int(self.wargs['maxWorkers'])
+                maxQueue = int(self.wargs['maxQueue']) if 'maxQueue' in self.wargs else maxWorkers
+                self.httpd = PooledHTTPServer((listen_addr, listen_port), WebF.HTTPHandler, maxWorkers, maxQueue)
+            else:
+                self.httpd = MultiThreadedHTTPServer((listen_addr, listen_port), WebF.HTTPHandler)
+        else:
+            raise ValueError("unknown engine %s" % engine)
 
         #  To run this server as https:
         #  Make a key and cert files:
@@ -682,7 +4199,12 @@ class WebF:
            import ssl   # condition import!
            cf = self.wargs['sslKeyCertChainFile']
 
-           self.httpd.socket = ssl.wrap_socket (self.httpd.socket, certfile=cf, server_side=True)
+           if engine == "asyncio":
+              context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+              context.load_cert_chain(cf)
+              self.httpd.sslContext = context
+           else:
+              self.httpd.socket = ssl.wrap_socket (self.httpd.socket, certfile=cf, server_side=True)
 
         if 'sslKeyFile' in self.wargs and 'sslCertChainFile' in self.wargs:
            import ssl   # condition import!
@@ -692,25 +4214,96 @@ class WebF:
            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
            context.load_cert_chain(cf, kf)
 
-           self.httpd.socket = context.wrap_socket(self.httpd.socket, server_side=True)
+           if engine == "asyncio":
+              self.httpd.sslContext = context
+           else:
+              self.httpd.socket = context.wrap_socket(self.httpd.socket, server_side=True)
             
 
         self.cors = self.wargs['cors'] if 'cors' in self.wargs else None
 
         self.log_handler = None   # optional
         self.log_context = None   # optional
+        self.log_batched = False
+
+        self.worker = None  # worker number in a worker process (see go)
+
+        self.write_timeout = self.wargs['writeTimeout'] if 'writeTimeout' in self.wargs else None
+        self.drain_timeout = self.wargs['drainTimeout'] if 'drainTimeout' in self.wargs else None
+
+        self.logs = None
+        if 'logQueue' in self.wargs or 'logSample' in self.wargs:
+            overflow = self.wargs['logOverflow'] if 'logOverflow' in self.wargs else "drop"
+            if overflow not in ("drop", "block"):
+                raise ValueError("unknown logOverflow %s" % overflow)
+            self.logs = WebF.logPipeline(self,
+                                         int(self.wargs['logQueue']) if 'logQueue' in self.wargs else None,
+                                         int(self.wargs['logBatch']) if 'logBatch' in self.wargs else 100,
+                                         overflow == "block",
+                                         int(self.wargs['logSample']) if 'logSample' in self.wargs else 1)
         self.auth_handler = None   # optional
         self.auth_context = None   # optional
+        self.auth_key = None       # optional
+        self.tracer = None         # optional
+        self.tracer_context = None # optional
 
         self.allow_help = self.wargs['allowHelp'] if 'allowHelp' in self.wargs else True
 
         self.match_header = self.wargs['matchHeader'] if 'matchHeader' in self.wargs else None
+        self.middleware = WebF.middleware(self, self.match_header)
 
         self.errHandler = self.wargs['errorHandler'] if 'errorHandler' in self.wargs else self.internalErr
 
+        self.server_timing = self.wargs['serverTiming'] if 'serverTiming' in self.wargs else False
+
+        self.flush_bytes = int(self.wargs['flushBytes']) if 'flushBytes' in self.wargs else WebF.baseWriter.flushBytes
+        self.flush_millis = self.wargs['flushMillis'] if 'flushMillis' in self.wargs else WebF.baseWriter.flushMillis
+        self.flusher = WebF.idleFlusher(self.flush_millis) if self.flush_millis > 0 else None
+
+        self.keep_alive = self.wargs['keepAlive'] if 'keepAlive' in self.wargs else False
+        self.idle_timeout = self.wargs['idleTimeout'] if 'idleTimeout' in self.wargs else 15
+        self.max_requests = self.wargs['maxRequestsPerConnection'] if 'maxRequestsPerConnection' in self.wargs else None
+
+        # Content codings, in order of preference.  Functions may turn
+        # compression on or off for themselves in help() "compress".
+        compress = self.wargs['compress'] if 'compress' in self.wargs else False
+        self.compress = compress is not False and compress is not None
+        self.compress_codings = WebF.compressor.available()
+        if isinstance(compress, list):
+            for coding in compress:
+                if coding not in WebF.compressor.order:
+                    raise ValueError("unknown content coding %s" % coding)
+            self.compress_codings = [c for c in compress if c in self.compress_codings]
+        self.compress_min_bytes = int(self.wargs['compressMinBytes']) if 'compressMinBytes' in self.wargs else 1024
+        self.compress_level = self.wargs['compressLevel'] if 'compressLevel' in self.wargs else None
+        self.encodingCache = {}
+
+        self.cache = WebF.responseCache(int(self.wargs['cacheBytes']) if 'cacheBytes' in self.wargs else 64*1024*1024)
+        self.cursors = WebF.cursorTable(int(self.wargs['cursors']) if 'cursors' in self.wargs else 1000,
+                                        self.wargs['cursorSecret'] if 'cursorSecret' in self.wargs else None)
+        self.auth_cache = None
+        if 'authCache' in self.wargs and self.wargs['authCache']:
+            self.auth_cache = WebF.authCache(int(self.wargs['authCache']),
+                                             self.wargs['authCacheTTL'] if 'authCacheTTL' in self.wargs else 60,
+                                             self.wargs['authCacheNegativeTTL'] if 'authCacheNegativeTTL' in self.wargs else 5)
+
+        # Output formats, in order of preference for */* and type/*.  The
+        # first is the default when there is no Accept header.
+        self.codecs = {}
+        self.acceptCache = {}
+        self.registerCodec('application/json', WebF.jsonWriter)
+        self.registerCodec('application/ejson', WebF.ejsonWriter)
+        self.registerCodec('application/bson', WebF.bsonWriter)
+        self.registerCodec('application/x-ndjson', WebF.ndjsonWriter)
+
         # Needed for args chking.
         self.registerFunction(self.helpFuncName, self.internalHelp, {"parent":self});
 
+        self.metrics = None
+        if self.wargs['metrics'] if 'metrics' in self.wargs else False:
+            self.metrics = WebF.callMetrics()
+            self.registerFunction(self.metricsFuncName, self.internalMetrics, {"parent":self})
+
         self.httpd.parent = self
 
 
@@ -718,26 +4311,392 @@ class WebF:
         if name == "":
             raise ValueError("function name cannot be empty string")
 
+        # Construct one instance just to compile its help(); will raise
+        # here (not on the first call) if help() is broken or its doc
+        # cannot be encoded.  So the constructor runs now, side effects
+        # and all, and again for every call (unless reusable).
+        instance = handler(context)
+        spec = WebF.funcSpec(instance.help(), name)
+        if spec.cursorEvery is not None and callable(getattr(instance, "next", None)) and \
+           not WebF.asyncHTTPHandler.isAsync(instance) and not callable(getattr(instance, "position", None)):
+            raise ValueError("%s: help() cursor needs a position() method" % name)
+
+        # ... and if it is reusable, it is the first one in its pool
+        pool = None
+        if spec.reusable:
+            pool = WebF.handlerPool(handler, context, spec.poolSize, instance)
+
+        self.fspecs[name] = spec
         self.fmap[name] = (handler,context)
+        old = self.pools.pop(name, None)
+        if pool is not None:
+            self.pools[name] = pool
+        self.routes = WebF.routeTable(self.fmap.keys())
+        self.cache.clear(name)
+        self.cursors.clear(name)
+        self.invalidateAuth(name=name)
+        if old is not None:
+            old.close()
 
     def deregisterFunction(self, name):
         if name in self.fmap:
             del self.fmap[name]
+            self.routes = WebF.routeTable(self.fmap.keys())
+            self.fspecs.pop(name, None)
+            self.cache.clear(name)
+            self.cursors.clear(name)
+            self.invalidateAuth(name=name)
+            pool = self.pools.pop(name, None)
+            if pool is not None:
+                pool.close()
+
+
+    def poolStats(self, name=None):
+        #  Stats of the instance pools of reusable functions:  one dict, or
+        #  {name: dict} for all of them if name is None.
+        if name is not None:
+            return self.pools[name].stats() if name in self.pools else None
+        return dict([(fname, pool.stats()) for (fname, pool) in list(self.pools.items())])
+
+
+    def invalidateHelp(self, name=None):
+        #  Recompile help() for one function, or all if name is None.
+        #  Call this when what a function returns from help() changes.
+        #  Like registerFunction(), constructs an instance to ask.
+        names = [name] if name is not None else list(self.fmap.keys())
+        for fname in names:
+            if fname in self.fmap:
+                (handler,context) = self.fmap[fname]
+                self.fspecs[fname] = WebF.funcSpec(handler(context).help(), fname)
+
+
+    def invalidateCache(self, name=None):
+        #  Forget cached responses of one function, or all if name is None.
+        self.cache.clear(name)
+
+
+    def cursorStats(self):
+        #  Counters of the streams parked for _cursor calls
+        return self.cursors.stats()
+
+
+    def invalidateAuth(self, fingerprint=None, name=None):
+        #  Forget cached authentication of one set of credentials (as
+        #  fingerprinted by authKey or the registered key function), of one
+        #  function, or all if neither is given.
+        #  Call this when credentials are revoked or changed.
+        if self.auth_cache is not None:
+            self.auth_cache.clear(fingerprint, name)
+
+    def authCacheStats(self):
+        #  Counters of the authCache, or None if not in use
+        return self.auth_cache.stats() if self.auth_cache is not None else None
+
+
+
+
+    #  Make output format mime available to callers via Accept.  
+    #  writerClass should derive from WebF.baseWriter; see jsonWriter.
+    def registerCodec(self, mime, writerClass):
+        self.codecs[mime.lower()] = writerClass
+        self.acceptCache = {}
+
+    def deregisterCodec(self, mime):
+        if mime.lower() in self.codecs:
+            del self.codecs[mime.lower()]
+            self.acceptCache = {}
+
+
+    #  Choose the output format for an Accept header value (None if there
+    #  was no Accept).  Honors comma lists, q values (highest first, then
+    #  most specific, then order given), type/* and */*, and q=0 as "not
+    #  this".  Returns (mime, writerClass, params), or None if nothing
+    #  registered is acceptable.  Results are cached per Accept value.
+    #  A function's own codecs ({mime: writerClass}, see codecs() on
+    #  internalMetrics) are considered after the registered ones.
+    def negotiate(self, accept, extra=None):
+        codecs = self.codecs
+        key = accept
+        if extra is not None:
+            codecs = dict(list(self.codecs.items()) + [(k.lower(), v) for (k, v) in extra.items() if k.lower() not in self.codecs])
+            key = (accept, tuple(sorted(extra.items())))
+
+        cache = self.acceptCache
+        if key in cache:
+            return cache[key]
+
+        result = None
+        if accept is None or accept.strip() == "":
+            mime = next(iter(codecs))
+            result = (mime, codecs[mime], {})
+        else:
+            ranges = []
+            refused = set()
+            for (n, item) in enumerate(accept.split(',')):
+                gg = [ x.strip() for x in item.split(';')]
+                mrange = gg[0].lower()
+                if mrange == "":
+                    continue
+                q = 1.0
+                params = {}
+                for attr in gg[1:]:
+                    if '=' not in attr:
+                        continue
+                    (k, v) = [ x.strip() for x in attr.split('=', 1)]
+                    if k.lower() == 'q':
+                        try:
+                            q = float(v)
+                        except ValueError:
+                            q = 0.0
+                    else:
+                        params[k] = v.strip('"')
+
+                if q <= 0:
+                    refused.add(mrange)
+                    continue
+
+                specific = 0 if mrange == '*/*' else (1 if mrange.endswith('/*') else 2)
+                ranges.append((-q, -specific, n, mrange, params))
+
+            for (nq, ns, n, mrange, params) in sorted(ranges, key=lambda r: r[0:3]):
+                for (mime, writerClass) in codecs.items():
+                    if mime in refused:
+                        continue
+                    if mrange == '*/*' or mime == mrange or (mrange.endswith('/*') and mime.startswith(mrange[:-1])):
+                        if writerClass.accepts(params):
+                            result = (mime, writerClass, params)
+                            break
+                if result is not None:
+                    break
 
+        if len(cache) < 256:
+            cache[key] = result
+        return result
+
+
+
+    #  Choose the content coding for an Accept-Encoding header value (None
+    #  if there was none).  Highest q wins, then our order of preference;
+    #  "*" covers codings not named and q=0 is "not this".  Returns the
+    #  coding, or None to send the body as is (including when identity
+    #  has been given a higher q than anything we have).
+    def negotiateEncoding(self, accept):
+        cache = self.encodingCache
+        if accept in cache:
+            return cache[accept]
+
+        result = None
+        if accept is not None:
+            qs = {}
+            for item in accept.split(','):
+                gg = [ x.strip() for x in item.split(';')]
+                coding = gg[0].lower()
+                if coding == "":
+                    continue
+                q = 1.0
+                for attr in gg[1:]:
+                    if '=' in attr:
+                        (k, v) = [ x.strip() for x in attr.split('=', 1)]
+                        if k.lower() == 'q':
+                            try:
+                                q = float(v)
+                            except ValueError:
+                                q = 0.0
+                qs[coding] = q
+
+            bestq = 0
+            for coding in self.compress_codings:
+                q = qs.get(coding, qs.get('*', 0))
+                if q > bestq:
+                    (result, bestq) = (coding, q)
+
+            if result is not None and qs.get('identity', 0) > bestq:
+                result = None
+
+        if len(cache) < 256:
+            cache[accept] = result
+        return result
+
+
+
+    #  With batched=True, handler is called with a list of infos instead of
+    #  one info:  a batch of them with logQueue, else a list of one.
+    def registerLogger(self, handler, context, batched=False):
+        self.log_handler = handler
+        self.log_context = context
+        self.log_batched = batched
 
 
+    def logStats(self):
+        #  Counters of the logQueue/logSample pipeline, or None if not in use
+        return self.logs.stats() if self.logs is not None else None
 
-    def registerLogger(self, handler, context):
-        self.log_handler = handler
-        self.log_context = context
+    def flushLogs(self):
+        #  Wait for queued log entries to be delivered
+        if self.logs is not None:
+            self.logs.flush()
 
 
 
-    def registerAuthentication(self, handler, context):
+    #  With authCache, key(caller, headers, args) gives the fingerprint of
+    #  the credentials (e.g. the Authorization header) under which what
+    #  handler said is kept; None means ask handler every time.
+    def registerAuthentication(self, handler, context, key=None):
         self.auth_handler = handler
         self.auth_context = context
+        self.auth_key = key
+        self.invalidateAuth()
+
+
+    #  stage(caller, command, path, headers, context) is run for every
+    #  call ahead of routing, args, and authentication; see middleware.
+    #  Registering a name again replaces that stage (or moves it, given
+    #  before), and before names the stage to put it ahead of (default:
+    #  at the end).
+    def registerMiddleware(self, name, stage, context=None, before=None):
+        self.middleware.add(name, stage, context, before)
+
+    def deregisterMiddleware(self, name):
+        self.middleware.remove(name)
+
+
+    #  tracer(trace, context) is called after each call with the phases
+    #  of the call as spans; see phaseTimer
+    def registerTracer(self, tracer, context):
+        self.tracer = tracer
+        self.tracer_context = context
+
+
+    #  With workers (here or in wargs), fork that many worker processes
+    #  serving the listening socket opened (and, for https, wrapped) in
+    #  __init__; this process then only supervises them:  a worker that
+    #  dies is restarted (no sooner than a second after it last started),
+    #  and SIGTERM or SIGINT is passed on to the workers, which stop
+    #  accepting and finish the calls in progress.  Workers still running
+    #  after workerGrace secs are killed.  go() returns when all are gone.
+    def go(self, workers=None):
+        if workers is None and 'workers' in self.wargs:
+            workers = int(self.wargs['workers'])
+
+        if workers is None or workers < 1:
+            self.httpd.serve_forever()
+            return
+
+        import os
+        import signal
+
+        if not hasattr(os, "fork"):
+            raise ValueError("workers requires os.fork()")
+
+        # A stream parked in one worker would not be found by the others
+        if workers > 1:
+            self.cursors.parking = False
+
+        grace = self.wargs['workerGrace'] if 'workerGrace' in self.wargs else 30
+
+        # All workers wait on the one socket; the ones that lose the race
+        # for a connection must not block in accept().
+        if not isinstance(self.httpd, AsyncHTTPServer):
+            self.httpd.socket.setblocking(False)
+
+        kids = {}      # pid -> (worker number, when started)
+        due = {}       # worker number -> when it may be restarted
+        stopping = []  # when the signal to stop came in
+
+        def onSignal(signum, frame):
+            if len(stopping) == 0:
+                stopping.append(time.monotonic())
+            for pid in list(kids):
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
 
-
-    def go(self):
-        self.httpd.serve_forever()
+        oldTerm = signal.signal(signal.SIGTERM, onSignal)
+        oldInt = signal.signal(signal.SIGINT, onSignal)
+
+        try:
+            for n in range(0, workers):
+                kids[self.forkWorker(n)] = (n, time.monotonic())
+
+            while len(kids) > 0:
+                (pid, status) = os.waitpid(-1, os.WNOHANG)
+                if pid == 0:
+                    time.sleep(0.1)
+                elif pid in kids:
+                    (n, started) = kids.pop(pid)
+                    if len(stopping) == 0:
+                        print("WebF worker %d (pid %d) exited with status %d; restarting" %
+                              (n, pid, os.waitstatus_to_exitcode(status)), file=sys.stderr)
+                        due[n] = started + 1.0
+
+                now = time.monotonic()
+                if len(stopping) == 0:
+                    for (n, when) in list(due.items()):
+                        if when <= now:
+                            del due[n]
+                            kids[self.forkWorker(n)] = (n, now)
+                elif now - stopping[0] > grace:
+                    for pid in list(kids):
+                        try:
+                            os.kill(pid, signal.SIGKILL)
+                        except ProcessLookupError:
+                            pass
+        finally:
+            signal.signal(signal.SIGTERM, oldTerm)
+            signal.signal(signal.SIGINT, oldInt)
+            self.httpd.socket.close()
+
+
+    #  Returns the pid in the parent; never returns in the worker.
+    def forkWorker(self, n):
+        import os
+        import signal
+        import threading
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+        pid = os.fork()
+        if pid != 0:
+            return pid
+
+        code = 0
+        try:
+            self.worker = n
+
+            stopping = []
+            def onSignal(signum, frame):
+                if len(stopping) == 0:
+                    stopping.append(signum)
+                    # shutdown() waits for serve_forever() to notice; not here
+                    threading.Thread(target=self.httpd.shutdown, daemon=True).start()
+
+            signal.signal(signal.SIGTERM, onSignal)
+            signal.signal(signal.SIGINT, onSignal)
+
+            if hasattr(self.httpd, "forked"):
+                self.httpd.forked()
+            if self.logs is not None:
+                self.logs.forked()
+
+            #  Instances built before the fork (the one from registration
+            #  and any idle ones) hold whatever they opened, e.g. database
+            #  sockets, now shared with the other processes.  Leave them be
+            #  (close() would close them for everyone) and start over.
+            self.pools = dict([(fname, WebF.handlerPool(pool.hname, pool.context, pool.maxSize))
+                               for (fname, pool) in self.pools.items()])
+
+            self.httpd.serve_forever()
+
+            if hasattr(self.httpd, "server_close"):
+                self.httpd.server_close()  # waits for calls in progress
+            self.flushLogs()
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
 
@@ -0,0 +1,122 @@
+#
+#  The asyncio engine with async function classes:  a coroutine start,
+#  an async generator next, and a coroutine end run on the event loop
+#  (many calls waiting at once without a thread each); a coroutine start
+#  reads the body from the asyncio.StreamReader, and a badBody it raises
+#  is answered 400 (errcode 16) as under the threaded engine.  Exits
+#  non-zero on any failure.
+#
+#  python3 WebF_asyncio.t.py
+#
+import asyncio
+import json
+import threading
+import time
+
+import WebF
+from WebF_testing import check, done, serve, call
+
+
+events = []
+infos = []
+
+class Feed:
+    def __init__(self, context):
+        pass
+
+    def help(self):
+        return {"args": [{"name": "n", "type": "int", "req": "Y"}]}
+
+    async def start(self, cmd, hdrs, args, rfile):
+        self.n = args['n']
+        await asyncio.sleep(0.3)
+        return (200, None, [{"first": True}], True)
+
+    async def next(self):
+        for i in range(self.n):
+            await asyncio.sleep(0.01)
+            yield {"i": i}
+
+    async def end(self):
+        events.append("end")
+
+
+class Count:
+    def __init__(self, context):
+        pass
+
+    def help(self):
+        return {}
+
+    async def start(self, cmd, hdrs, args, rfile):
+        data = await rfile.readexactly(int(hdrs['Content-Length']))
+        try:
+            docs = json.loads(data)
+        except ValueError as e:
+            raise WebF.WebF.badBody("not json: %s" % e)
+        return (200, None, [{"count": len(docs)}], False)
+
+
+class SyncCount(Count):
+    def start(self, cmd, hdrs, args, rfile):
+        return (200, None, [{"count": sum([len(b) for b in WebF.WebF.docReader(rfile, hdrs, batch=10)])}], False)
+
+
+serve({"port": 7916, "engine": "asyncio"}, {"feed": Feed, "count": Count, "syncCount": SyncCount},
+      lambda info, ctx: infos.append(info))
+
+
+def latest(func):
+    t0 = time.monotonic()
+    while time.monotonic() - t0 < 5:
+        for info in list(infos):
+            if info['func'] == func:
+                return info
+        time.sleep(0.05)
+    return {}
+
+
+#  start, next, end
+(rr, body) = call(7916, '/feed?args={"n":5}')
+docs = json.loads(body) if rr.status == 200 else []
+check("async start, next, end", rr.status == 200 and len(docs) == 6 and docs[0] == {"first": True}
+      and [d['i'] for d in docs[1:]] == list(range(5)), (rr.status, body[0:200]))
+time.sleep(0.1)
+check("... end() once", events == ["end"], events)
+check("... logged", latest("feed").get('docs') == 6, latest("feed"))
+
+#  Calls waiting in start() at once do not wait on each other
+results = []
+def one():
+    (rr, body) = call(7916, '/feed?args={"n":1}', timeout=10)
+    results.append(rr.status)
+t0 = time.monotonic()
+tt = [threading.Thread(target=one) for i in range(20)]
+for t in tt:
+    t.start()
+for t in tt:
+    t.join()
+secs = time.monotonic() - t0
+check("20 calls sleeping 0.3s in start() at once", results == [200] * 20 and secs < 2, (results, secs))
+
+
+#  Request bodies
+(rr, body) = call(7916, "/count", method="POST", body=json.dumps([{"a": 1}] * 7), headers={"Content-Type": "application/json"})
+check("coroutine start reads the body", rr.status == 200 and json.loads(body) == [{"count": 7}], (rr.status, body))
+
+del infos[:]
+(rr, body) = call(7916, "/count", method="POST", body=b"[{nope", headers={"Content-Type": "application/json"})
+err = json.loads(body)[0] if rr.status == 400 else {}
+check("coroutine start raising badBody:  400, errcode 16", rr.status == 400 and err.get('errcode') == 16
+      and "not json" in err.get('data', ""), (rr.status, body[0:200]))
+info = latest("count")
+check("... logged as such", info.get('status') == 400 and info.get('err', {}).get('errcode') == 16, info)
+
+(rr, body) = call(7916, "/syncCount", method="POST", body=json.dumps([{"a": 1}] * 25), headers={"Content-Type": "application/json"})
+check("plain start under asyncio reads the body", rr.status == 200 and json.loads(body) == [{"count": 25}], (rr.status, body))
+(rr, body) = call(7916, "/syncCount", method="POST", body=b"[{nope", headers={"Content-Type": "application/json"})
+err = json.loads(body)[0] if rr.status == 400 else {}
+check("... and badBody from it:  400, errcode 16", rr.status == 400 and err.get('errcode') == 16, (rr.status, body[0:200]))
+
+
+done()
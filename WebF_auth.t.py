@@ -0,0 +1,77 @@
+#
+#  Authentication cache:  results are reused for the same credentials
+#  on the same function only (a cached allow on one function must not
+#  answer a call to another the server-wide handler denies), failures
+#  expire on the shorter negative ttl, and invalidateAuth() forces the
+#  handler to be asked again.  Exits non-zero on any failure.
+#
+#  python3 WebF_auth.t.py
+#
+import time
+
+from WebF_testing import check, done, serve, call
+
+
+class Open:
+    def __init__(self, context):
+        pass
+
+    def help(self):
+        return {}
+
+    def start(self, cmd, hdrs, args, rfile):
+        return (200, None, [{"ok": 1}], False)
+
+
+class Admin(Open):
+    pass
+
+
+class Own(Open):
+    def authKey(self, caller, headers, args):
+        return headers['Authorization'] if 'Authorization' in headers else None
+
+    def authenticate(self, caller, headers, args):
+        asked['own'] += 1
+        return (headers.get('Authorization') == "good", "own")
+
+
+asked = {"server": 0, "own": 0}
+
+#  Anyone with "good" may call open, nobody may call admin
+def serverAuth(instance, context, caller, headers, args):
+    asked['server'] += 1
+    ok = headers.get('Authorization') == "good" and not isinstance(instance, Admin)
+    return (ok, "user")
+
+def credentials(caller, headers, args):
+    return headers['Authorization'] if 'Authorization' in headers else None
+
+
+logs = []
+ws = serve({"port": 7941, "authCache": 100, "authCacheTTL": 60, "authCacheNegativeTTL": 0.3},
+           {"open": Open, "admin": Admin, "own": Own}, lambda info, ctx: logs.append(info))
+ws.registerAuthentication(serverAuth, None, key=credentials)
+
+def status(path, auth):
+    return call(7941, path, {"Authorization": auth})[0].status
+
+check("allowed on open", [status("/open", "good") for i in range(3)] == [200] * 3)
+check("... asked once", asked['server'] == 1, asked)
+check("cached allow on open does not answer admin", status("/admin", "good") == 401)
+check("... asked for admin", asked['server'] == 2, asked)
+check("denial on admin cached", status("/admin", "good") == 401 and asked['server'] == 2, asked)
+time.sleep(0.4)
+check("denial expires after negative ttl", status("/admin", "good") == 401 and asked['server'] == 3, asked)
+
+check("function's own authenticate", [status("/own", "good") for i in range(2)] == [200, 200] and asked['own'] == 1, asked)
+
+ws.invalidateAuth("good")
+check("invalidateAuth asks again", status("/open", "good") == 200 and asked['server'] == 4, asked)
+check("... for every function", status("/own", "good") == 200 and asked['own'] == 2, asked)
+
+time.sleep(0.1)
+check("logged", logs[-1].get('auth') == "miss" and logs[-1]['authCacheStats']['hits'] > 0, logs[-1].get('authCacheStats'))
+
+
+done()
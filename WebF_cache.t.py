@@ -0,0 +1,161 @@
+#
+#  Response cache:  hits and misses per function, args, and output
+#  format; ETag and If-None-Match; Vary; time to live; eviction by a
+#  function's maxBytes and by the server's cacheBytes, least recently
+#  used first; invalidateCache().  Exits non-zero on any failure.
+#
+#  python3 WebF_cache.t.py
+#
+import gzip
+import json
+import time
+import urllib.parse
+
+from WebF_testing import check, done, serve, call
+
+
+calls = {}
+
+class Cat:
+    name = "cat"
+    cache = {"ttl": 30, "maxBytes": 2000}
+
+    def __init__(self, context):
+        pass
+
+    def help(self):
+        return {"cache": self.cache,
+                "args": [{"name": "k", "type": "int", "req": "Y"},
+                         {"name": "n", "type": "int", "req": "N"}]}
+
+    def start(self, cmd, hdrs, args, rfile):
+        calls[self.name] = calls.get(self.name, 0) + 1
+        return (200, None, [{"k": args['k'], "pad": "x" * args.get('n', 900)}], False)
+
+
+class Other(Cat):
+    name = "other"
+
+
+class Brief(Cat):
+    name = "brief"
+    cache = {"ttl": 0.5, "maxBytes": 100000}
+
+
+class Zipped(Cat):
+    name = "zipped"
+
+    def help(self):
+        hh = Cat.help(self)
+        hh.update({"compress": True, "compressMinBytes": 100})
+        return hh
+
+
+def get(func, k, headers=None, args=None):
+    args = args or '{"k":%d}' % k
+    (rr, body) = call(7908, "/%s?args=%s" % (func, urllib.parse.quote(args)), headers)
+    return (rr, body)
+
+
+def made(func):
+    return calls.get(func, 0)
+
+
+ws = serve({"port": 7908, "cacheBytes": 3000}, {"cat": Cat, "other": Other, "brief": Brief, "zipped": Zipped})
+
+
+#  Hit and miss
+(rr, body) = get("cat", 1)
+(rr2, body2) = get("cat", 1)
+check("miss, then hit", made("cat") == 1 and rr2.status == 200 and body2 == body, (made("cat"), rr2.status))
+check("... sent with Content-Length and ETag",
+      rr2.getheader("Content-Length") == str(len(body2)) and rr2.getheader("ETag") == rr.getheader("ETag") is not None,
+      rr2.getheaders())
+check("... and Vary: Accept, stored and hit", rr.getheader("Vary") == "Accept" and rr2.getheader("Vary") == "Accept",
+      (rr.getheader("Vary"), rr2.getheader("Vary")))
+get("cat", 1, args='{"n":900,"k":1}')
+get("cat", 1, args='{"k":1,"n":900}')
+check("args in any key order are one entry", made("cat") == 2, made("cat"))
+(rr, body) = get("cat", 1, {"Accept": "application/bson"})
+check("another output format is another entry", made("cat") == 3 and rr.getheader("Content-Type") == "application/bson",
+      (made("cat"), rr.getheader("Content-Type")))
+
+
+#  If-None-Match
+(rr, body) = get("cat", 1)
+etag = rr.getheader("ETag")
+(rr, body) = get("cat", 1, {"If-None-Match": etag})
+check("If-None-Match:  304, no body", rr.status == 304 and body == b"" and rr.getheader("ETag") == etag,
+      (rr.status, body[0:100]))
+check("... still Vary", rr.getheader("Vary") == "Accept", rr.getheaders())
+(rr, body) = get("cat", 1, {"If-None-Match": '"nope"'})
+check("... 200 if it does not match", rr.status == 200 and len(body) > 900, rr.status)
+
+
+#  Time to live
+get("brief", 1)
+get("brief", 1)
+before = ws.cache.stats()['evictions']
+check("brief:  hit within its ttl", made("brief") == 1, made("brief"))
+time.sleep(0.7)
+get("brief", 1)
+check("... miss after it", made("brief") == 2, made("brief"))
+check("... counted as an eviction", ws.cache.stats()['evictions'] == before + 1, ws.cache.stats())
+
+
+#  A function's maxBytes (2000:  two ~925 byte responses) evicts its own
+#  least recently used only
+ws.invalidateCache()
+calls.clear()
+for (func, k) in (("cat", 1), ("cat", 2), ("other", 1), ("cat", 3)):
+    get(func, k)
+get("other", 1)
+check("maxBytes:  another function's response is kept", made("other") == 1, calls)
+get("cat", 3)
+get("cat", 2)
+check("... this function's most recent ones are kept", made("cat") == 3, calls)
+get("cat", 1)
+check("... its least recently used is not", made("cat") == 4, calls)
+
+
+#  cacheBytes (3000) evicts the least recently used of all functions
+ws.invalidateCache()
+calls.clear()
+for (func, k) in (("other", 1), ("cat", 1), ("cat", 2), ("other", 2)):
+    get(func, k)
+get("cat", 1)
+get("cat", 2)
+check("cacheBytes:  recent ones are kept", made("cat") == 2, calls)
+get("other", 1)
+check("... the least recently used of any function is not", made("other") == 3, calls)
+check("... the cache stays within cacheBytes", ws.cache.stats()['bytes'] <= 3000, ws.cache.stats())
+
+
+#  invalidateCache
+ws.invalidateCache()
+calls.clear()
+get("cat", 1)
+get("other", 1)
+ws.invalidateCache("cat")
+get("cat", 1)
+get("other", 1)
+check("invalidateCache(name):  just that function", made("cat") == 2 and made("other") == 1, calls)
+ws.invalidateCache()
+get("other", 1)
+check("invalidateCache():  all of them", made("other") == 2, calls)
+
+
+#  Compressed variants vary with Accept-Encoding too
+(rr, body) = get("zipped", 1, {"Accept-Encoding": "gzip"})
+(rr2, body2) = get("zipped", 1, {"Accept-Encoding": "gzip"})
+(rr3, body3) = get("zipped", 1)
+check("compressed:  stored and hit", made("zipped") == 1 and rr2.getheader("Content-Encoding") == "gzip", calls)
+check("... Vary: Accept, Accept-Encoding, stored and hit",
+      rr.getheader("Vary") == "Accept, Accept-Encoding" and rr2.getheader("Vary") == "Accept, Accept-Encoding",
+      (rr.getheader("Vary"), rr2.getheader("Vary")))
+check("... same body as uncompressed", gzip.decompress(body2) == body3 and json.loads(body3)[0]['k'] == 1,
+      body3[0:100])
+check("... each with its own ETag", rr2.getheader("ETag") != rr3.getheader("ETag"), (rr2.getheader("ETag"), rr3.getheader("ETag")))
+
+
+done()
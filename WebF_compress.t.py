@@ -0,0 +1,143 @@
+#
+#  Compression:  the coding negotiated from Accept-Encoding (gzip,
+#  deflate, q values, q=0, *), compressMinBytes leaving a small response
+#  alone, Content-Length of compressed responses on a keep-alive
+#  connection, chunked compressed streams, help() turning it off or
+#  lowering the threshold, and Content-Encoding: identity from start()
+#  opting a call out.  Exits non-zero on any failure.
+#
+#  python3 WebF_compress.t.py
+#
+import gzip
+import http.client
+import json
+import zlib
+
+import WebF
+from WebF_testing import check, done, serve, call
+
+
+class Big:
+    def __init__(self, context):
+        pass
+
+    def help(self):
+        return {}
+
+    def start(self, cmd, hdrs, args, rfile):
+        return (200, None, [{"i": i, "name": "buzz", "city": "NY"} for i in range(200)], False)
+
+
+class Small(Big):
+    def start(self, cmd, hdrs, args, rfile):
+        return (200, None, [{"i": 1}], False)
+
+
+class Tiny(Small):
+    def help(self):
+        return {"compressMinBytes": 10}
+
+
+class Off(Big):
+    def help(self):
+        return {"compress": False}
+
+
+class Identity(Big):
+    def start(self, cmd, hdrs, args, rfile):
+        (code, hh, docs, more) = Big.start(self, cmd, hdrs, args, rfile)
+        return (code, {"Content-Encoding": "identity"}, docs, more)
+
+
+class Stream(Big):
+    def start(self, cmd, hdrs, args, rfile):
+        return (200, None, None, True)
+
+    def next(self):
+        for i in range(2000):
+            yield {"i": i, "name": "buzz", "city": "NY"}
+
+
+serve({"port": 7919, "compress": True, "keepAlive": True},
+      {"big": Big, "small": Small, "tiny": Tiny, "off": Off, "identity": Identity, "stream": Stream})
+
+
+def decode(coding, body):
+    if coding == "gzip":
+        return gzip.decompress(body)
+    if coding == "deflate":
+        return zlib.decompress(body)
+    if coding == "br":
+        import brotli
+        return brotli.decompress(body)
+    if coding == "zstd":
+        import zstandard
+        return zstandard.ZstdDecompressor().decompressobj().decompress(body)
+    return body
+
+
+def get(path, ae=None):
+    (rr, body) = call(7919, path, {"Accept-Encoding": ae} if ae is not None else None)
+    return (rr, rr.getheader("Content-Encoding"), body)
+
+
+plain = call(7919, "/big")[1]
+best = WebF.WebF.compressor.available()[0]
+for (ae, expect) in (
+        (None, None),
+        ("gzip", "gzip"),
+        ("deflate", "deflate"),
+        ("gzip, deflate", "gzip"),
+        ("gzip;q=0.5, deflate", "deflate"),
+        ("deflate;q=0.9, gzip", "gzip"),
+        ("gzip;q=0, deflate;q=0", None),
+        ("identity", None),
+        ("compress", None),
+        ("*", best),
+        ("*, gzip;q=0, deflate;q=0" if best in ("gzip", "deflate") else "*;q=0.5, gzip", "gzip"),
+        ):
+    (rr, coding, body) = get("/big", ae)
+    check("Accept-Encoding %r:  %s" % (ae, expect),
+          rr.status == 200 and coding == expect and decode(coding, body) == plain,
+          (rr.status, coding, len(body)))
+check("... and it pays", len(get("/big", "gzip")[2]) < len(plain) / 3, len(plain))
+check("Vary: Accept-Encoding", get("/big", "gzip")[0].getheader("Vary") == "Accept-Encoding")
+
+
+#  compressMinBytes
+(rr, coding, body) = get("/small", "gzip")
+check("smaller than compressMinBytes:  as is", rr.status == 200 and coding is None and json.loads(body) == [{"i": 1}],
+      (coding, body))
+(rr, coding, body) = get("/tiny", "gzip")
+check("... help() compressMinBytes lower", coding == "gzip" and json.loads(gzip.decompress(body)) == [{"i": 1}], coding)
+
+
+#  Opting out
+(rr, coding, body) = get("/off", "gzip")
+check("help() compress False", coding is None and body == plain, coding)
+(rr, coding, body) = get("/identity", "gzip")
+check("start() Content-Encoding: identity", coding is None and body == plain and rr.getheader("Content-Length") == str(len(body)),
+      rr.getheaders())
+
+
+#  Content-Length on a keep-alive connection, and chunked streams
+cc = http.client.HTTPConnection("localhost", 7919, timeout=5)
+got = []
+for (path, ae) in (("/big", "gzip"), ("/small", "gzip"), ("/big", "deflate"), ("/stream", "gzip"), ("/big", "gzip")):
+    cc.request("GET", path, headers={"Accept-Encoding": ae})
+    rr = cc.getresponse()
+    body = rr.read()
+    got.append((path, rr.status, rr.getheader("Content-Encoding"), rr.getheader("Content-Length"),
+                rr.getheader("Transfer-Encoding"), len(body), body))
+cc.close()
+check("keep-alive:  five calls on one connection", [g[1] for g in got] == [200] * 5, [g[0:6] for g in got])
+check("... compressed bodies with their Content-Length",
+      all([g[3] == str(g[5]) for g in got if g[0] != "/stream"]) and got[0][5] < len(plain) / 3,
+      [g[0:6] for g in got])
+check("... and intact", decode("gzip", got[0][6]) == plain and decode("deflate", got[2][6]) == plain
+      and got[4][6] == got[0][6], [g[0:6] for g in got])
+check("... a stream compressed and chunked", got[3][2] == "gzip" and got[3][4] == "chunked"
+      and len(json.loads(gzip.decompress(got[3][6]))) == 2000, got[3][0:6])
+
+
+done()
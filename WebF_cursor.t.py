@@ -0,0 +1,72 @@
+#
+#  Cursors:  a parked stream that nobody comes back for is closed once its
+#  ttl is up, without waiting for some other stream to be parked or taken;
+#  and a cursor function without position() is refused at registration
+#  rather than failing in the middle of a stream.  Exits non-zero on any
+#  failure.
+#
+#  python3 WebF_cursor.t.py
+#
+import json
+import time
+
+from WebF_testing import check, done, serve, call
+
+
+closed = []
+
+class Things:
+    def __init__(self, context):
+        self.last = None
+
+    def help(self):
+        return {"cursor": {"every": 10, "ttl": 0.5, "pageSize": 10}}
+
+    def start(self, cmd, hdrs, args, rfile):
+        return (200, None, None, True)
+
+    def position(self):
+        return self.last
+
+    def next(self):
+        try:
+            for i in range(100):
+                self.last = i
+                yield {"i": i}
+        except GeneratorExit:
+            closed.append(time.monotonic())
+            raise
+
+
+class NoPosition:
+    def __init__(self, context):
+        pass
+
+    def help(self):
+        return {"cursor": True}
+
+    def start(self, cmd, hdrs, args, rfile):
+        return (200, None, None, True)
+
+    def next(self):
+        yield {"i": 0}
+
+
+ws = serve({"port": 7998}, {"things": Things})
+ws.cursors.sweepSecs = 0.2
+
+docs = json.loads(call(7998, "/things")[1])
+check("first page parked", len(docs) == 11 and "_cursor" in docs[-1] and ws.cursorStats()['entries'] == 1, ws.cursorStats())
+
+time.sleep(1.2)
+stats = ws.cursorStats()
+check("expired stream closed by the sweep", stats['entries'] == 0 and stats['expired'] == 1 and len(closed) == 1, (stats, closed))
+
+try:
+    ws.registerFunction("noposition", NoPosition, None)
+    check("cursor without position() refused", False)
+except ValueError:
+    check("cursor without position() refused", "noposition" not in ws.fmap)
+
+
+done()
@@ -0,0 +1,53 @@
+#
+#  Pre-encoded docs:  encodedDoc.wrap() takes bytes, bytearray, or
+#  memoryview material, and RawBSONDocument subclasses (as a custom
+#  document_class may be) are sent as is to bson callers and decoded for
+#  json ones.  Exits non-zero on any failure.
+#
+#  python3 WebF_encoded.t.py
+#
+import json
+
+import bson
+from bson.raw_bson import RawBSONDocument
+
+import WebF
+from WebF_testing import check, done, serve, call
+
+
+class MyRaw(RawBSONDocument):
+    pass
+
+
+class Encoded:
+    def __init__(self, context):
+        pass
+
+    def help(self):
+        return {}
+
+    def start(self, cmd, hdrs, args, rfile):
+        wrap = WebF.WebF.encodedDoc.wrap
+        return (200, None, [wrap('json', memoryview(b'{"a":1}')),
+                            wrap('json', bytearray(b'{"b":2}\n')),
+                            wrap('bson', memoryview(bson.encode({"c": 3}))),
+                            MyRaw(bson.encode({"d": 4}))], False)
+
+
+serve({"port": 7904}, {"encoded": Encoded})
+
+def get(accept):
+    (rr, body) = call(7904, "/encoded", {"Accept": accept})
+    return (rr.status, body)
+
+want = [{"a": 1}, {"b": 2}, {"c": 3}, {"d": 4}]
+
+(status, body) = get("application/json")
+check("json", status == 200 and json.loads(body) == want, (status, body))
+
+(status, body) = get("application/bson")
+docs = list(bson.decode_iter(body)) if status == 200 else None
+check("bson", docs == want, (status, body))
+
+
+done()
@@ -0,0 +1,61 @@
+#
+#  Output coalescing:  a doc emitted just before next() blocks (tailing
+#  cursors, change streams) reaches the client within about flushMillis
+#  rather than when the next doc comes, on either engine and with or
+#  without compression; and a stream that keeps coming is still sent in
+#  few writes.  Exits non-zero on any failure.
+#
+#  python3 WebF_flush.t.py
+#
+import time
+import zlib
+import http.client
+
+from WebF_testing import check, done, serve, call
+
+
+class Tail:
+    def __init__(self, context):
+        pass
+
+    def help(self):
+        return {"compress": True}
+
+    def start(self, cmd, hdrs, args, rfile):
+        return (200, None, None, True)
+
+    def next(self):
+        yield {"first": 1}
+        time.sleep(2)       # waiting on the next change
+        yield {"second": 2}
+
+
+class Lots(Tail):
+    def next(self):
+        for i in range(20000):
+            yield {"i": i}
+
+
+logs = []
+for (port, engine) in ((7971, "threaded"), (7972, "asyncio")):
+    serve({"port": port, "engine": engine, "compress": ["deflate"], "compressMinBytes": 1},
+          {"tail": Tail, "lots": Lots}, lambda info, ctx: logs.append(info))
+
+    for coding in (None, "deflate"):
+        cc = http.client.HTTPConnection("localhost", port, timeout=5)
+        t0 = time.monotonic()
+        cc.request("GET", "/tail", headers={"Accept-Encoding": coding} if coding else {})
+        rr = cc.getresponse()
+        piece = rr.read1(65536) if coding is None else zlib.decompressobj().decompress(rr.read1(65536))
+        took = time.monotonic() - t0
+        check("%s %s: first doc before next() unblocks" % (engine, coding or "identity"),
+              b'"first"' in piece and took < 1, (took, piece))
+        rr.read()
+        cc.close()
+
+    call(port, "/lots")
+    time.sleep(0.1)
+    check("%s: 20000 docs in few writes" % engine, logs[-1]['flushes'] < 100, logs[-1]['flushes'])
+
+
+done()
@@ -0,0 +1,144 @@
+#
+#  help() compiled at registration:  the args check (required args,
+#  types, unknown args), the pre-encoded /help docs, what registering
+#  does (constructs an instance; a help doc that cannot be encoded
+#  raises), invalidateHelp(), and "dynamicHelp":True.  Exits non-zero on
+#  any failure.
+#
+#  python3 WebF_help.t.py
+#
+import json
+import urllib.parse
+from decimal import Decimal
+
+import bson
+
+import WebF
+from WebF_testing import check, done, serve, call
+
+
+class Typed:
+    def __init__(self, context):
+        pass
+
+    def help(self):
+        return {"desc": "one of each",
+                "args": [{"name": "s", "type": "string", "req": "Y"},
+                         {"name": "i", "type": "int", "req": "N"},
+                         {"name": "d", "type": "double", "req": "N"},
+                         {"name": "a", "type": "array", "req": "N"},
+                         {"name": "m", "type": "dict", "req": "N"},
+                         {"name": "t", "type": "datetime", "req": "N"},
+                         {"name": "dec", "type": "decimal", "req": "N"},
+                         {"name": "x", "type": "any", "req": "N"}]}
+
+    def start(self, cmd, hdrs, args, rfile):
+        return (200, None, [{"got": sorted(args.keys())}], False)
+
+
+class Loose(Typed):
+    def help(self):
+        return {"args": [{"name": "s", "type": "string", "req": "Y"}], "allowUnknownArgs": True}
+
+
+#  What Changing and Dynamic return from help(), changed as we go
+changing = {"args": [{"name": "a", "type": "int", "req": "N"}]}
+
+class Changing(Typed):
+    constructed = 0
+
+    def __init__(self, context):
+        Changing.constructed += 1
+
+    def help(self):
+        return dict(changing)
+
+
+class Dynamic(Typed):
+    def help(self):
+        return dict(changing, dynamicHelp=True)
+
+
+ws = serve({"port": 7917}, {"typed": Typed, "loose": Loose, "changing": Changing, "dynamic": Dynamic})
+
+
+def get(func, args=None, accept=None):
+    path = "/" + func
+    if args is not None:
+        path += "?args=" + urllib.parse.quote(args)
+    (rr, body) = call(7917, path, {"Accept": accept} if accept else None)
+    if rr.getheader("Content-Type") == "application/bson":
+        return (rr.status, bson.decode_all(body))
+    return (rr.status, json.loads(body))
+
+
+def helpFor(func, accept=None):
+    (status, docs) = get("help", accept=accept)
+    return dict([(d['funcname'], d) for d in docs]).get(func)
+
+
+#  The args check
+(status, docs) = get("typed", json.dumps({"s": "x", "i": 3, "d": 1.5, "a": [1], "m": {"k": 1},
+                                           "t": {"$date": 1485640066333}, "dec": {"$numberDecimal": "1.5"},
+                                           "x": [1]}))
+check("args of each type", status == 200 and len(docs[0]['got']) == 8, (status, docs))
+(status, docs) = get("typed", '{"i":3}')
+check("required arg missing:  errcode 1", status == 400 and docs == [{"errcode": 1, "msg": "req arg not found", "data": "s"}],
+      (status, docs))
+(status, docs) = get("typed", '{"s":"x","i":"3","d":2}')
+check("wrong types:  errcode 2 for each", status == 400 and [d['data'] for d in docs] ==
+      [{"arg": "i", "expected": "int", "found": "string"}, {"arg": "d", "expected": "double", "found": "int"}],
+      (status, docs))
+(status, docs) = get("typed", '{"s":"x","sz":1}')
+check("unknown arg:  errcode 2", status == 400 and docs == [{"errcode": 2, "msg": "unknown arg", "data": {"arg": "sz"}}],
+      (status, docs))
+(status, docs) = get("typed", '{"sz":1,"i":1.5}')
+check("... all the errors at once", status == 400 and [d['errcode'] for d in docs] == [1, 2, 2], (status, docs))
+(status, docs) = get("loose", '{"s":"x","sz":1}')
+check("allowUnknownArgs", status == 200, (status, docs))
+
+check("type names:  read only", WebF.WebF.funcSpec.typeName(Decimal("1")) == "decimal"
+      and len(WebF.WebF.funcSpec.typeNames) == 3, dict(WebF.WebF.funcSpec.typeNames))
+try:
+    WebF.WebF.funcSpec.typeNames[bytes] = "binary"
+    check("... cannot be changed", False)
+except TypeError:
+    check("... cannot be changed", True)
+
+
+#  /help
+hh = helpFor("typed")
+check("/help:  the compiled doc", hh is not None and hh['desc'] == "one of each" and len(hh['args']) == 8, hh)
+check("... in bson too", helpFor("typed", "application/bson") == hh, helpFor("typed", "application/bson"))
+check("... not the internal functions", helpFor("__help") is None and helpFor("__metrics") is None)
+
+
+#  Registration constructs an instance, and encodes the help doc
+n = Changing.constructed
+ws.registerFunction("changing2", Changing, None)
+check("registering constructs an instance", Changing.constructed == n + 1, Changing.constructed - n)
+
+class Unencodable(Typed):
+    def help(self):
+        return {"desc": set([1, 2])}
+try:
+    ws.registerFunction("unencodable", Unencodable, None)
+    check("a help doc that cannot be encoded raises at registration", False)
+except Exception as e:
+    check("a help doc that cannot be encoded raises at registration", "unencodable" not in ws.fmap, e)
+
+
+#  invalidateHelp and dynamicHelp
+changing = {"args": [{"name": "a", "type": "int", "req": "Y"}]}
+check("help changed:  compiled help still in use", get("changing", '{}')[0] == 200 and
+      helpFor("changing")['args'][0]['req'] == "N", helpFor("changing"))
+check("... dynamicHelp in use at once", get("dynamic", '{}')[0] == 400 and helpFor("dynamic")['args'][0]['req'] == "Y",
+      helpFor("dynamic"))
+ws.invalidateHelp("changing")
+check("... after invalidateHelp(name)", get("changing", '{}')[0] == 400 and get("changing2", '{}')[0] == 200 and
+      helpFor("changing")['args'][0]['req'] == "Y", helpFor("changing"))
+ws.invalidateHelp()
+check("... after invalidateHelp()", get("changing2", '{}')[0] == 400, helpFor("changing2"))
+
+
+done()
@@ -0,0 +1,132 @@
+#
+#  Persistent connections (keepAlive):  HTTP/1.1 responses are framed
+#  (Content-Length when all docs are in hand, chunked for next()
+#  streams) so several calls, pipelined or not, share one connection;
+#  an HTTP/1.0 client gets its response and the connection closed, even
+#  if it asked for keep-alive.  With maxWorkers, a connection between
+#  requests does not hold a worker.  Exits non-zero on any failure.
+#
+#  python3 WebF_keepalive.t.py
+#
+import socket
+import time
+import http.client
+
+from WebF_testing import check, done, serve, call
+
+
+class Small:
+    def __init__(self, context):
+        pass
+
+    def help(self):
+        return {}
+
+    def start(self, cmd, hdrs, args, rfile):
+        return (200, None, [{"a": 1}], False)
+
+
+class Stream(Small):
+    def start(self, cmd, hdrs, args, rfile):
+        return (200, None, None, True)
+
+    def next(self):
+        for i in range(500):
+            yield {"i": i}
+
+
+serve({"port": 7951, "keepAlive": True, "idleTimeout": 10}, {"small": Small, "stream": Stream})
+
+
+cc = http.client.HTTPConnection("localhost", 7951, timeout=5)
+got = []
+for path in ("/small", "/stream", "/small", "/stream"):
+    cc.request("GET", path)
+    rr = cc.getresponse()
+    body = rr.read()
+    got.append((rr.status, rr.getheader("Content-Length") is not None, rr.getheader("Transfer-Encoding"), len(body)))
+check("HTTP/1.1: four calls on one connection", [g[0] for g in got] == [200] * 4, got)
+check("... Content-Length for docs in hand", got[0][1] and got[2][1], got)
+check("... chunked for next()", got[1][2] == "chunked" and got[3][2] == "chunked", got)
+check("... whole stream", got[1][3] == got[3][3] and got[1][3] > 500 * 7, got)
+cc.close()
+
+
+#  Two requests in one send
+def receive(ss, until):
+    data = b""
+    t0 = time.monotonic()
+    try:
+        while until(data) is False and time.monotonic() - t0 < 5:
+            more = ss.recv(65536)
+            if len(more) == 0:
+                return (data, True)
+            data += more
+    except socket.timeout:
+        pass
+    return (data, False)
+
+ss = socket.create_connection(("localhost", 7951), timeout=5)
+ss.sendall(b"GET /small HTTP/1.1\r\nHost: x\r\n\r\nGET /stream HTTP/1.1\r\nHost: x\r\n\r\n")
+(data, closed) = receive(ss, lambda d: d.count(b"HTTP/1.1 200") == 2 and d.endswith(b"\r\n0\r\n\r\n"))
+check("pipelined: both answered", data.count(b"HTTP/1.1 200") == 2 and not closed, data[0:200])
+ss.close()
+
+
+#  HTTP/1.0 with Connection: keep-alive; the response is not framed so
+#  the connection must close right after it rather than at idleTimeout
+for path in ("/small", "/stream"):
+    ss = socket.create_connection(("localhost", 7951), timeout=3)
+    t0 = time.monotonic()
+    ss.sendall(("GET %s HTTP/1.0\r\nConnection: keep-alive\r\n\r\n" % path).encode())
+    (data, closed) = receive(ss, lambda d: False)
+    check("HTTP/1.0 keep-alive %s: answered and closed" % path,
+          data.startswith(b"HTTP/1.1 200") and closed and time.monotonic() - t0 < 2,
+          (closed, time.monotonic() - t0, data[0:120]))
+    ss.close()
+
+
+#  Pooled:  two idle keep-alive clients and maxWorkers 2; a third client
+#  is answered at once, not after idleTimeout, and the two idle ones can
+#  still make their next call
+serve({"port": 7906, "keepAlive": True, "idleTimeout": 10, "maxWorkers": 2, "maxQueue": 0}, {"small": Small, "stream": Stream})
+
+idle = []
+for n in range(2):
+    cc = http.client.HTTPConnection("localhost", 7906, timeout=5)
+    cc.request("GET", "/small")
+    cc.getresponse().read()
+    idle.append(cc)
+t0 = time.monotonic()
+try:
+    (rr, body) = call(7906, "/small")
+    got = (rr.status, time.monotonic() - t0)
+except Exception as e:
+    got = (repr(e), time.monotonic() - t0)
+check("pooled: idle keep-alive connections leave the workers free", got[0] == 200 and got[1] < 2, got)
+got = []
+for cc in idle:
+    cc.request("GET", "/stream")
+    rr = cc.getresponse()
+    got.append((rr.status, len(rr.read())))
+    cc.close()
+check("... and they are served again", [g[0] for g in got] == [200, 200] and got[0][1] > 500 * 7, got)
+time.sleep(0.3)   # maxQueue 0:  let the workers see those two closed first
+
+ss = socket.create_connection(("localhost", 7906), timeout=5)
+ss.sendall(b"GET /small HTTP/1.1\r\nHost: x\r\n\r\nGET /stream HTTP/1.1\r\nHost: x\r\n\r\n")
+(data, closed) = receive(ss, lambda d: d.count(b"HTTP/1.1 200") == 2 and d.endswith(b"\r\n0\r\n\r\n"))
+check("pooled, pipelined: both answered", data.count(b"HTTP/1.1 200") == 2 and not closed, data[0:200])
+ss.close()
+
+serve({"port": 7907, "keepAlive": True, "idleTimeout": 1, "maxWorkers": 1}, {"small": Small})
+ss = socket.create_connection(("localhost", 7907), timeout=5)
+t0 = time.monotonic()
+ss.sendall(b"GET /small HTTP/1.1\r\nHost: x\r\n\r\n")
+(data, closed) = receive(ss, lambda d: False)
+check("pooled: closed after idleTimeout", data.startswith(b"HTTP/1.1 200") and closed and 0.8 < time.monotonic() - t0 < 3,
+      (closed, time.monotonic() - t0, data[0:120]))
+ss.close()
+
+
+done()
@@ -0,0 +1,38 @@
+#
+#  Loggers:  one registered with batched=True always gets a list of
+#  infos, with logQueue (a batch at a time) or without it (a list of
+#  one).  Exits non-zero on any failure.
+#
+#  python3 WebF_log.t.py
+#
+import time
+
+from WebF_testing import check, done, serve, call
+
+
+class Hello:
+    def __init__(self, context):
+        pass
+
+    def help(self):
+        return {}
+
+    def start(self, cmd, hdrs, args, rfile):
+        return (200, None, [{"hello": 1}], False)
+
+
+for (port, wargs) in ((7901, {}), (7902, {"logQueue": 100}), (7903, {"logSample": 1})):
+    got = []
+    ws = serve(dict(wargs, port=port), {"hello": Hello})
+    ws.registerLogger(lambda infos, ctx: got.append(infos), None, batched=True)
+
+    for i in range(3):
+        call(port, "/hello")
+    ws.flushLogs()
+    time.sleep(0.1)
+    check("batched logger, %s: lists of infos" % (wargs or "no queue"),
+          len(got) > 0 and all([isinstance(x, list) for x in got]) and sum([len(x) for x in got]) == 3 and
+          all([info['func'] == "hello" for x in got for info in x]), got[0:1])
+
+
+done()
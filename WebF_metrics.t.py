@@ -0,0 +1,46 @@
+#
+#  Metrics:  __metrics is not there unless metrics is asked for; when it
+#  is, it counts calls per function and is subject to the server-wide
+#  authentication handler like any other function.  Exits non-zero on
+#  any failure.
+#
+#  python3 WebF_metrics.t.py
+#
+import json
+
+from WebF_testing import check, done, serve, call
+
+
+class Hello:
+    def __init__(self, context):
+        pass
+
+    def help(self):
+        return {}
+
+    def start(self, cmd, hdrs, args, rfile):
+        return (200, None, [{"hello": 1}], False)
+
+
+def get(port, path, auth=None):
+    (rr, body) = call(port, path, {"Authorization": auth} if auth else {})
+    return (rr.status, body)
+
+
+ws = serve({"port": 7995}, {"hello": Hello})
+check("off by default", get(7995, "/__metrics")[0] == 404 and ws.metrics is None)
+
+ws = serve({"port": 7996, "metrics": True}, {"hello": Hello})
+for i in range(3):
+    get(7996, "/hello")
+(status, body) = get(7996, "/__metrics")
+funcs = dict([(ff['func'], ff) for ff in json.loads(body)[0]['functions']]) if status == 200 else {}
+check("metrics: True serves counts", status == 200 and funcs.get("hello", {}).get("calls") == 3, (status, body[0:200]))
+
+ws = serve({"port": 7997, "metrics": True}, {"hello": Hello})
+ws.registerAuthentication(lambda instance, context, caller, headers, args: (headers.get('Authorization') == "good", "user"), None)
+check("... behind server-wide authentication", get(7997, "/__metrics")[0] == 401)
+check("... with credentials", get(7997, "/__metrics", "good")[0] == 200)
+
+
+done()
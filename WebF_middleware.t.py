@@ -0,0 +1,88 @@
+#
+#  Middleware:  stages run in order until one answers, with the answer
+#  (and its extra headers) going out through the error handler; a stage
+#  registered again is replaced in place, or moved with before, built-in
+#  ones included; built-in stages cannot be removed.  Exits non-zero on
+#  any failure.
+#
+#  python3 WebF_middleware.t.py
+#
+import json
+
+from WebF_testing import check, done, serve, call
+
+
+class Hello:
+    def __init__(self, context):
+        pass
+
+    def help(self):
+        return {}
+
+    def start(self, cmd, hdrs, args, rfile):
+        return (200, None, [{"hello": 1}], False)
+
+
+ran = []
+
+def record(caller, command, path, headers, context):
+    ran.append(context)
+
+def deny(caller, command, path, headers, context):
+    ran.append("deny")
+    if headers.get('X-Key') != context:
+        return (403, {"errcode": 100, "msg": "not allowed"}, {"X-Denied-By": "deny"})
+
+def denyAll(caller, command, path, headers, context):
+    ran.append("denyAll")
+    return (451, {"errcode": 101, "msg": "not here"})
+
+
+ws = serve({"port": 7905}, {"hello": Hello})
+
+def get(key=None):
+    del ran[:]
+    (rr, body) = call(7905, "/hello", {"X-Key": key} if key else {})
+    return (rr.status, rr.getheader("X-Denied-By"), json.loads(body))
+
+
+check("built-in stages", ws.middleware.names() == ["shed", "rateLimit", "headers"], ws.middleware.names())
+
+ws.registerMiddleware("deny", deny, "secret")
+ws.registerMiddleware("early", record, "early", before="rateLimit")
+ws.registerMiddleware("late", record, "late")
+check("order", ws.middleware.names() == ["shed", "early", "rateLimit", "headers", "deny", "late"], ws.middleware.names())
+
+(status, hdr, body) = get("secret")
+check("all stages run in order", status == 200 and ran == ["early", "deny", "late"], (status, ran))
+
+(status, hdr, body) = get("wrong")
+check("first to answer wins", status == 403 and ran == ["early", "deny"], (status, ran))
+check("... with its headers and err", hdr == "deny" and body == [{"errcode": 100, "msg": "not allowed"}], (hdr, body))
+
+ws.registerMiddleware("deny", deny, "other")
+check("registered again: replaced in place", ws.middleware.names() == ["shed", "early", "rateLimit", "headers", "deny", "late"], ws.middleware.names())
+check("... with the new context", get("other")[0] == 200 and get("secret")[0] == 403)
+
+ws.registerMiddleware("deny", denyAll, None, before="early")
+check("registered again with before: moved", ws.middleware.names() == ["shed", "deny", "early", "rateLimit", "headers", "late"], ws.middleware.names())
+(status, hdr, body) = get("other")
+check("... and runs first", status == 451 and ran == ["denyAll"], (status, ran))
+
+ws.deregisterMiddleware("deny")
+check("deregistered", ws.middleware.names() == ["shed", "early", "rateLimit", "headers", "late"] and get()[0] == 200, ws.middleware.names())
+
+ws.registerMiddleware("headers", record, "headers")
+check("built-in replaced in place", ws.middleware.names() == ["shed", "early", "rateLimit", "headers", "late"], ws.middleware.names())
+check("... and runs in its place", get()[0] == 200 and ran == ["early", "headers", "late"], ran)
+
+for (what, fn) in (("built-in cannot be removed", lambda: ws.deregisterMiddleware("rateLimit")),
+                   ("before an unknown stage", lambda: ws.registerMiddleware("x", record, "x", before="nosuch"))):
+    try:
+        fn()
+        check(what, False)
+    except ValueError:
+        check(what, "x" not in ws.middleware.names() and "rateLimit" in ws.middleware.names())
+
+
+done()
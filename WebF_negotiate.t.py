@@ -0,0 +1,123 @@
+#
+#  Output format negotiation from Accept:  q values, q=0 as "not this",
+#  type/* and */*, boundary params, a function's own codecs(), and 406
+#  (errcode 13) when nothing is acceptable.  Accept is negotiated once a
+#  call, after routing.  Exits non-zero on any failure.
+#
+#  python3 WebF_negotiate.t.py
+#
+import json
+
+import bson
+
+import WebF
+from WebF_testing import check, done, serve, call
+
+
+class Hello:
+    def __init__(self, context):
+        pass
+
+    def help(self):
+        return {}
+
+    def start(self, cmd, hdrs, args, rfile):
+        return (200, None, [{"hello": 1}, {"hello": 2}], False)
+
+
+class TextWriter(WebF.WebF.baseWriter):
+    contentType = "text/plain"
+
+    def prologue(self):
+        pass
+
+    def emit(self, doc):
+        self.writeWrap(("%s\n" % doc).encode('utf-8'))
+
+    def epilogue(self):
+        self.finish()
+
+
+class Plain(Hello):
+    def codecs(self):
+        return {"text/plain": TextWriter}
+
+
+ws = serve({"port": 7909}, {"hello": Hello, "plain": Plain})
+
+negotiations = []
+negotiate = ws.negotiate
+def counted(accept, extra=None):
+    negotiations.append(accept)
+    return negotiate(accept, extra)
+ws.negotiate = counted
+
+
+def get(path, accept):
+    (rr, body) = call(7909, path, {"Accept": accept} if accept is not None else {})
+    return (rr.status, rr.getheader("Content-Type"), body)
+
+
+for (accept, expect) in (
+        (None, "application/json"),
+        ("", "application/json"),
+        ("application/bson", "application/bson"),
+        ("application/json;q=0.5, application/bson", "application/bson"),
+        ("application/bson;q=0.2, application/json;q=0.9", "application/json"),
+        ("application/ejson;q=0.5, application/bson;q=0.5", "application/ejson"),
+        ("*/*;q=0.5, application/bson;q=0.5", "application/bson"),
+        ("application/json;q=0, */*", "application/ejson"),
+        ("application/json;q=0, application/ejson;q=0, application/*", "application/bson"),
+        ("application/*", "application/json"),
+        ("*/*", "application/json"),
+        ("image/png, application/x-ndjson;q=0.1", "application/x-ndjson"),
+        ("application/json; boundary=LF", "application/json; boundary=LF"),
+        ("application/json; boundary=XX, application/bson;q=0.5", "application/bson"),
+        ):
+    (status, ctype, body) = get("/hello", accept)
+    check("Accept %r:  %s" % (accept, expect), status == 200 and ctype == expect, (status, ctype))
+
+(status, ctype, body) = get("/hello", "application/json; boundary=LF")
+check("boundary=LF:  one doc a line", body.split(b"\n")[0:2] == [b'{"hello":1}', b'{"hello":2}'], body)
+(status, ctype, body) = get("/hello", "application/bson")
+check("bson:  docs one after the other", bson.decode_all(body) == [{"hello": 1}, {"hello": 2}], body)
+
+
+#  406
+for accept in ("image/png", "application/json;q=0, application/ejson;q=0, application/bson;q=0, application/x-ndjson;q=0",
+               "application/json; boundary=XX", "text/*"):
+    (status, ctype, body) = get("/hello", accept)
+    err = json.loads(body)[0] if status == 406 else {}
+    check("Accept %r:  406 errcode 13, in json" % accept,
+          status == 406 and ctype == "application/json" and err.get('errcode') == 13 and err.get('data') == accept,
+          (status, ctype, body[0:200]))
+
+
+#  A function's own formats
+(status, ctype, body) = get("/plain", "text/plain")
+check("codecs():  its own format", status == 200 and ctype == "text/plain" and body.startswith(b"{'hello': 1}\n"),
+      (status, ctype, body[0:100]))
+(status, ctype, body) = get("/plain", "text/*, application/json;q=0.5")
+check("... type/* matches it", status == 200 and ctype == "text/plain", (status, ctype))
+(status, ctype, body) = get("/plain", "*/*")
+check("... after the registered ones", status == 200 and ctype == "application/json", (status, ctype))
+(status, ctype, body) = get("/hello", "text/plain")
+check("... and only for that function", status == 406, (status, ctype))
+
+
+#  Errors before the function is known are in the best registered format
+(status, ctype, body) = get("/nope", "application/bson")
+check("unknown function:  404 in bson", status == 404 and ctype == "application/bson" and bson.decode_all(body)[0]['errcode'] == 5,
+      (status, ctype, body[0:100]))
+(status, ctype, body) = get("/nope", "image/png")
+check("... in json if nothing is acceptable", status == 404 and ctype == "application/json", (status, ctype))
+
+
+#  Once a call
+negotiations.clear()
+get("/hello", "application/x-ndjson;q=0.5, application/bson")
+get("/plain", "text/plain")
+check("negotiated once a call", negotiations == ["application/x-ndjson;q=0.5, application/bson", "text/plain"], negotiations)
+
+
+done()
@@ -0,0 +1,51 @@
+#
+#  Instance pools of reusable functions:  more concurrent calls than
+#  asyncio executor threads on a poolSize 1 function must all be served
+#  (the wait for an instance must not hold an executor thread), and a
+#  call that cannot get an instance within poolTimeout gets a 503 on
+#  either engine.  Exits non-zero on any failure.
+#
+#  python3 WebF_pool.t.py
+#
+import time
+
+from WebF_testing import check, done, serve, calls
+
+
+class Slow:
+    def __init__(self, context):
+        self.secs = context
+
+    def help(self):
+        return {"reusable": True, "poolSize": 1, "poolTimeout": 5}
+
+    def start(self, cmd, hdrs, args, rfile):
+        time.sleep(self.secs)
+        return (200, None, [{"ok": 1}], False)
+
+
+class Stuck(Slow):
+    def help(self):
+        return {"reusable": True, "poolSize": 1, "poolTimeout": 0.3}
+
+
+funcs = {"slow": (Slow, 0.05), "stuck": (Stuck, 1.0)}
+
+ws = serve({"port": 7931, "engine": "asyncio", "executorThreads": 2}, funcs)
+t0 = time.monotonic()
+rr = calls(7931, "/slow", 12)
+check("asyncio: 12 calls, 2 executor threads, poolSize 1", rr == [200] * 12, rr)
+check("asyncio: ... served one after another", time.monotonic() - t0 < 5, time.monotonic() - t0)
+check("asyncio: one instance", ws.poolStats("slow")['created'] == 1, ws.poolStats("slow"))
+
+rr = sorted(calls(7931, "/stuck", 2))
+check("asyncio: poolTimeout answers 503", rr == [200, 503], rr)
+
+ws = serve({"port": 7932}, funcs)
+rr = sorted(calls(7932, "/stuck", 2))
+check("threaded: poolTimeout answers 503", rr == [200, 503], rr)
+rr = calls(7932, "/slow", 6)
+check("threaded: 6 calls, poolSize 1", rr == [200] * 6, rr)
+
+
+done()
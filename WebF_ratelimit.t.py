@@ -0,0 +1,43 @@
+#
+#  Rate limit buckets:  a full table forgets the least recently used
+#  bucket, not the first one made, so a client that keeps calling stays
+#  limited however many others come and go; memory stays within
+#  rateLimitKeys, and a full table costs no more per new key than an
+#  empty one.  Exits non-zero on any failure.
+#
+#  python3 WebF_ratelimit.t.py
+#
+import time
+
+import WebF
+from WebF_testing import check, done
+
+
+slow = WebF.WebF.rateLimiter.limit({"rate": 0.001, "burst": 1})
+
+rl = WebF.WebF.rateLimiter(maxKeys=64)
+check("first call allowed", rl.take("hot", slow) == 0)
+check("second call limited", rl.take("hot", slow) > 0)
+allowed = 0
+for i in range(5000):
+    rl.take(("other", i), slow)
+    if i % 2 == 0 and rl.take("hot", slow) == 0:
+        allowed += 1
+check("still limited among 5000 other keys", allowed == 0, allowed)
+check("table bounded", rl.size() <= 64, rl.size())
+
+
+rl = WebF.WebF.rateLimiter(maxKeys=16000)
+def newKeys(base, n):
+    t0 = time.perf_counter()
+    for i in range(n):
+        rl.take((base, i), slow)
+    return time.perf_counter() - t0
+
+empty = newKeys("a", 16000)
+full = newKeys("b", 16000)
+check("new keys on a full table cost about the same", full < empty * 3, (empty, full))
+check("table bounded", rl.size() <= 16000, rl.size())
+
+
+done()
@@ -0,0 +1,81 @@
+#
+#  Routing:  functions are matched on whole path components, longest
+#  registered name first, and what follows the name is the RESTful
+#  remainder, given to start() as args['_'].  Exits non-zero on any
+#  failure.
+#
+#  python3 WebF_routing.t.py
+#
+import json
+import urllib.parse
+
+import WebF
+from WebF_testing import check, done, serve, call
+
+
+routes = WebF.WebF.routeTable(["func1", "v1/foo", "v1/foo/bar"])
+for (path, expect) in (
+        ("func1", ("func1", None)),
+        ("func12", (None, None)),
+        ("func", (None, None)),
+        ("func1/x/y", ("func1", "x/y")),
+        ("v1", (None, None)),
+        ("v1/foo", ("v1/foo", None)),
+        ("v1/foobar", (None, None)),
+        ("v1/foo/baz", ("v1/foo", "baz")),
+        ("v1/foo/bar", ("v1/foo/bar", None)),
+        ("v1/foo/bar/E123", ("v1/foo/bar", "E123")),
+        ("v1/foo/barn/E123", ("v1/foo", "barn/E123")),
+        ("nope/func1", (None, None)),
+        ):
+    check("routeTable.match(%r)" % path, routes.match(path) == expect, routes.match(path))
+
+
+class Echo:
+    def __init__(self, context):
+        self.name = context
+
+    def help(self):
+        return {"args": [{"name": "id", "type": "string", "req": "N"}]}
+
+    def start(self, cmd, hdrs, args, rfile):
+        return (200, None, [{"func": self.name, "args": args}], False)
+
+
+ws = serve({"port": 7918}, {"func1": (Echo, "func1"), "v1/foo": (Echo, "v1/foo"), "v1/foo/bar": (Echo, "v1/foo/bar")})
+
+
+def get(path, args=None):
+    if args is not None:
+        path += "?args=" + urllib.parse.quote(args)
+    (rr, body) = call(7918, path)
+    return (rr.status, json.loads(body)[0])
+
+
+(status, doc) = get("/func12")
+check("/func12 is not func1", status == 404 and doc.get('errcode') == 5, (status, doc))
+(status, doc) = get("/func1", '{"id":"E123"}')
+check("/func1:  no RESTful args", status == 200 and doc == {"func": "func1", "args": {"id": "E123"}}, (status, doc))
+(status, doc) = get("/func1/E999/4", '{"id":"E123"}')
+check("/func1/E999/4:  args['_']", status == 200 and doc == {"func": "func1", "args": {"_": ["E999", "4"], "id": "E123"}},
+      (status, doc))
+(status, doc) = get("/v1/foo/bar/E123")
+check("/v1/foo/bar/E123:  the longest name", status == 200 and doc == {"func": "v1/foo/bar", "args": {"_": ["E123"]}},
+      (status, doc))
+(status, doc) = get("/v1/foo/barn")
+check("/v1/foo/barn:  v1/foo with barn", status == 200 and doc == {"func": "v1/foo", "args": {"_": ["barn"]}},
+      (status, doc))
+(status, doc) = get("/v1/foobar")
+check("/v1/foobar:  neither", status == 404, (status, doc))
+
+ws.registerFunction("func12", Echo, "func12")
+(status, doc) = get("/func12/x")
+check("registered:  /func12/x is func12", status == 200 and doc == {"func": "func12", "args": {"_": ["x"]}}, (status, doc))
+ws.deregisterFunction("func12")
+(status, doc) = get("/func12/x")
+check("deregistered:  /func12/x is not func1", status == 404, (status, doc))
+(status, doc) = get("/func1/x")
+check("... and func1 is still there", status == 200 and doc["func"] == "func1", (status, doc))
+
+
+done()
@@ -0,0 +1,85 @@
+#
+#  Worker pool (maxWorkers/maxQueue):  with maxQueue 0 a call is turned
+#  away with a 503 as soon as every worker is busy, rather than queued
+#  without limit; and a client that connects and never sends its request
+#  while being turned away does not hold up the connections behind it.
+#  Exits non-zero on any failure.
+#
+#  python3 WebF_shed.t.py
+#
+import socket
+import threading
+import time
+
+import WebF
+from WebF_testing import check, done, serve, call
+
+
+class Slow:
+    def __init__(self, context):
+        pass
+
+    def help(self):
+        return {}
+
+    def start(self, cmd, hdrs, args, rfile):
+        time.sleep(1.0)
+        return (200, None, [{"ok": 1}], False)
+
+
+class Fast(Slow):
+    def start(self, cmd, hdrs, args, rfile):
+        return (200, None, [{"ok": 1}], False)
+
+
+serve({"port": 7981, "maxWorkers": 2, "maxQueue": 0}, {"slow": Slow, "fast": Fast})
+
+
+def status(path, results):
+    try:
+        results.append(call(7981, path, timeout=10)[0].status)
+    except Exception as e:
+        results.append(repr(e))
+
+
+results = []
+tt = [threading.Thread(target=status, args=("/slow", results)) for i in range(4)]
+for t in tt:
+    t.start()
+    time.sleep(0.05)
+for t in tt:
+    t.join(15)
+check("maxQueue 0: two served, two turned away", sorted(results) == [200, 200, 503, 503], results)
+
+
+#  Both workers busy; one client connects and sends nothing, the next
+#  must still get its 503 right away
+busy = []
+tt = [threading.Thread(target=status, args=("/slow", busy)) for i in range(2)]
+for t in tt:
+    t.start()
+time.sleep(0.2)
+mute = [socket.create_connection(("localhost", 7981)) for i in range(3)]
+t0 = time.monotonic()
+results = []
+status("/fast", results)
+took = time.monotonic() - t0
+check("silent clients do not hold up accept()", results == [503] and took < 0.5, (results, took))
+for t in tt:
+    t.join(15)
+for ss in mute:
+    ss.close()
+
+results = []
+status("/fast", results)
+check("served again once workers are free", results == [200], results)
+
+
+try:
+    WebF.PooledHTTPServer(("localhost", 7982), WebF.WebF.HTTPHandler, 2, -1)
+    check("negative maxQueue rejected", False)
+except ValueError:
+    check("negative maxQueue rejected", True)
+
+
+done()
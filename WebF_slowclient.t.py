@@ -0,0 +1,136 @@
+#
+#  Slow clients (writeTimeout, drainTimeout) and clients that leave
+#  mid-response, on both engines:  the next() generator is closed, abort()
+#  (or else end()) runs once, the connection is closed, and the logger
+#  gets disconnect.  Exits non-zero on any failure.
+#
+#  python3 WebF_slowclient.t.py
+#
+import socket
+import time
+
+from WebF_testing import check, done, serve
+
+
+events = []   # (func, "closed" | "abort" | "end")
+infos = []
+
+class Firehose:
+    name = "firehose"
+
+    def __init__(self, context):
+        pass
+
+    def help(self):
+        return {}
+
+    def start(self, cmd, hdrs, args, rfile):
+        return (200, None, None, True)
+
+    def next(self):
+        try:
+            while True:
+                yield {"pad": "x" * 8192}
+        finally:
+            events.append((self.name, "closed"))
+
+    def abort(self):
+        events.append((self.name, "abort"))
+
+    def end(self):
+        events.append((self.name, "end"))
+
+
+class EndOnly(Firehose):
+    name = "endOnly"
+    abort = None
+
+
+def begin(port, path):
+    ss = socket.socket()
+    ss.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    ss.connect(("localhost", port))
+    ss.settimeout(10)
+    ss.sendall(("GET %s HTTP/1.1\r\nHost: x\r\n\r\n" % path).encode())
+    ss.recv(1024)
+    return ss
+
+
+#  Read to the end; if the server closed the connection
+def closed(ss, pause=0):
+    try:
+        while len(ss.recv(4096)) > 0:
+            time.sleep(pause)
+        return True
+    except OSError:
+        return False
+    finally:
+        ss.close()
+
+
+def logged(func, timeout=10):
+    t0 = time.monotonic()
+    while time.monotonic() - t0 < timeout:
+        for info in list(infos):
+            if info['func'] == func:
+                return info
+        time.sleep(0.05)
+    return {}
+
+
+def after(func):
+    return [e[1] for e in events if e[0] == func]
+
+
+for (engine, port) in (("threaded", 7910), ("asyncio", 7911)):
+    serve({"port": port, "engine": engine, "keepAlive": True, "writeTimeout": 1, "drainTimeout": 3},
+          {"firehose": Firehose, "endOnly": EndOnly}, lambda info, ctx: infos.append(info))
+
+    #  Stops reading:  writeTimeout
+    for func in ("firehose", "endOnly"):
+        del events[:]
+        del infos[:]
+        t0 = time.monotonic()
+        ss = begin(port, "/" + func)
+        info = logged(func)
+        secs = time.monotonic() - t0
+        time.sleep(0.2)
+        label = "%s, %s, stops reading" % (engine, func)
+        check(label + ":  logged as timeout after writeTimeout",
+              info.get('disconnect') == "timeout" and secs < 2.5, (info.get('disconnect'), secs))
+        check("... generator closed", after(func).count("closed") == 1, events)
+        if func == "firehose":
+            check("... abort() once, no end()", after(func).count("abort") == 1 and "end" not in after(func), events)
+        else:
+            check("... end() once", after(func).count("end") == 1, events)
+        check("... connection closed", closed(ss))
+
+    #  Keeps reading, slowly:  drainTimeout
+    del events[:]
+    del infos[:]
+    t0 = time.monotonic()
+    ss = begin(port, "/firehose")
+    gone = closed(ss, 0.005)
+    secs = time.monotonic() - t0
+    info = logged("firehose")
+    label = "%s, reads slowly" % engine
+    check(label + ":  closed after drainTimeout", gone and 2.5 < secs < 6, (gone, secs))
+    check("... logged as timeout", info.get('disconnect') == "timeout", info.get('disconnect'))
+    check("... generator closed, abort() once, no end()",
+          after("firehose") == ["closed", "abort"], events)
+
+    #  Goes away
+    del events[:]
+    del infos[:]
+    ss = begin(port, "/endOnly")
+    ss.recv(4096)
+    ss.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, b"\1\0\0\0\0\0\0\0")
+    ss.close()
+    info = logged("endOnly")
+    time.sleep(0.2)
+    label = "%s, disconnects" % engine
+    check(label + ":  logged as disconnect", info.get('disconnect') == "disconnect", info.get('disconnect'))
+    check("... generator closed, end() once", after("endOnly") == ["closed", "end"], events)
+
+
+done()
@@ -0,0 +1,73 @@
+#
+#  What the WebF_*.t.py scripts have in common:
+#     check(what, ok, detail)   one result; prints ok or FAIL (with detail)
+#     done()                    prints the number of failures and exits,
+#                               non-zero if there were any
+#     serve(wargs, funcs)       a WebF on a daemon thread, ready for calls;
+#                               funcs is {name: handler} or
+#                               {name: (handler, context)}
+#     call(port, path, ...)     one call on a connection of its own:
+#                               (response, body)
+#     calls(port, path, n)      n calls at once; their statuses, or the
+#                               repr() of what they raised
+#
+import sys
+import threading
+import time
+import http.client
+
+import WebF
+
+
+bad = 0
+
+def check(what, ok, detail=None):
+    global bad
+    if not ok:
+        bad += 1
+        print("FAIL", what, repr(detail)[0:300] if detail is not None else "")
+    else:
+        print("ok  ", what)
+
+
+def done():
+    print("%d failures" % bad)
+    sys.exit(1 if bad > 0 else 0)
+
+
+def serve(wargs, funcs, logger=None):
+    ws = WebF.WebF(wargs)
+    for (name, handler) in funcs.items():
+        (handler, context) = handler if isinstance(handler, tuple) else (handler, None)
+        ws.registerFunction(name, handler, context)
+    ws.registerLogger(logger if logger is not None else lambda info, ctx: None, None)
+    threading.Thread(target=ws.go, daemon=True).start()
+    time.sleep(0.3)
+    return ws
+
+
+def call(port, path, headers=None, method="GET", body=None, timeout=5):
+    cc = http.client.HTTPConnection("localhost", port, timeout=timeout)
+    try:
+        cc.request(method, path, body=body, headers=headers or {})
+        rr = cc.getresponse()
+        return (rr, rr.read())
+    finally:
+        cc.close()
+
+
+def calls(port, path, n, timeout=10):
+    results = []
+
+    def one():
+        try:
+            results.append(call(port, path, timeout=timeout)[0].status)
+        except Exception as e:
+            results.append(repr(e))
+
+    tt = [threading.Thread(target=one) for i in range(n)]
+    for t in tt:
+        t.start()
+    for t in tt:
+        t.join(timeout + 5)
+    return results
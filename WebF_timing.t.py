@@ -0,0 +1,142 @@
+#
+#  Call timing on both engines:  the Server-Timing header on a response
+#  built whole (with Content-Length under keepAlive), the Server-Timing
+#  trailer on a chunked one (threaded engine with keepAlive; the asyncio
+#  engine answers HTTP/1.0 and just gets the header), phaseMillis and
+#  ttfbMillis for the logger, and the spans given to a registered tracer.
+#  Exits non-zero on any failure.
+#
+#  python3 WebF_timing.t.py
+#
+import socket
+import time
+
+from WebF_testing import check, done, serve, call
+
+
+infos = []
+traces = []
+
+class Docs:
+    def __init__(self, context):
+        pass
+
+    def help(self):
+        return {}
+
+    def start(self, cmd, hdrs, args, rfile):
+        time.sleep(0.05)
+        return (200, None, [{"a": 1}, {"a": 2}], False)
+
+
+class Stream(Docs):
+    def start(self, cmd, hdrs, args, rfile):
+        time.sleep(0.05)
+        return (200, None, None, True)
+
+    def end(self):
+        pass
+
+    def next(self):
+        for i in range(3):
+            time.sleep(0.03)
+            yield {"i": i}
+
+
+#  "a;dur=1.5, b;dur=2" -> {"a": 1.5, "b": 2.0}
+def durations(value):
+    dd = {}
+    for item in (value or "").split(','):
+        (name, dur) = item.strip().split(';dur=')
+        dd[name] = float(dur)
+    return dd
+
+
+#  A chunked response read off the socket:  (headers, trailers)
+def chunked(port, path):
+    ss = socket.create_connection(("localhost", port), timeout=5)
+    ss.sendall(("GET %s HTTP/1.1\r\nHost: x\r\n\r\n" % path).encode())
+    data = b""
+    while not data.endswith(b"\r\n\r\n") or b"\r\n0\r\n" not in data:
+        more = ss.recv(65536)
+        if len(more) == 0:
+            break
+        data += more
+    ss.close()
+    (head, body) = data.split(b"\r\n\r\n", 1)
+    trailer = body.split(b"\r\n0\r\n", 1)[1] if b"\r\n0\r\n" in body else b""
+
+    def fields(lines):
+        return dict([l.decode().split(": ", 1) for l in lines.split(b"\r\n") if b": " in l])
+    return (fields(head), fields(trailer))
+
+
+def latest(func, got):
+    t0 = time.monotonic()
+    while time.monotonic() - t0 < 5:
+        for x in list(got):
+            if x['func'] == func:
+                return x
+        time.sleep(0.05)
+    return {}
+
+
+for (engine, port) in (("threaded", 7912), ("asyncio", 7913)):
+    ws = serve({"port": port, "engine": engine, "keepAlive": True, "serverTiming": True},
+               {"docs": Docs, "stream": Stream}, lambda info, ctx: infos.append(info))
+    ws.registerTracer(lambda trace, ctx: traces.append(trace), None)
+
+    #  Built whole
+    del infos[:]
+    del traces[:]
+    t0 = time.time()
+    (rr, body) = call(port, "/docs")
+    t1 = time.time()
+    st = durations(rr.getheader("Server-Timing"))
+    check("%s, whole response:  Server-Timing header" % engine,
+          (engine == "asyncio" or rr.getheader("Content-Length") is not None)
+          and st.get("start", 0) >= 50 and st.get("total", 0) >= st.get("start", 0) and "route" in st and "args" in st,
+          rr.getheaders())
+    info = latest("docs", infos)
+    pm = info.get('phaseMillis', {})
+    check("... phaseMillis for the logger",
+          set(["route", "args", "accept", "start"]) <= set(pm) and pm["start"] >= 50 and "next" not in pm, pm)
+    check("... ttfbMillis", info.get('ttfbMillis', 0) >= 50, info.get('ttfbMillis'))
+    trace = latest("docs", traces)
+    spans = dict([(sp['name'], sp) for sp in trace.get('spans', [])])
+    check("... the tracer gets the call",
+          trace.get('status') == 200 and t0 <= trace.get('start', 0) <= trace.get('end', 0) <= t1 + 0.1, trace)
+    check("... and its spans",
+          set(["route", "args", "accept", "start"]) <= set(spans) and
+          all([t0 <= sp['start'] <= sp['end'] <= trace['end'] and sp['secs'] >= 0 for sp in spans.values()]) and
+          spans['start']['secs'] >= 0.05,
+          trace.get('spans'))
+
+    #  Streamed:  chunked under keepAlive on the threaded engine
+    del infos[:]
+    if engine == "threaded":
+        (hdrs, trailers) = chunked(port, "/stream")
+        head = durations(hdrs.get("Server-Timing"))
+        tail = durations(trailers.get("Server-Timing"))
+        check("%s, chunked:  Server-Timing header up to start" % engine,
+              hdrs.get("Transfer-Encoding") == "chunked" and hdrs.get("Trailer") == "Server-Timing"
+              and head.get("start", 0) >= 50 and "next" not in head,
+              hdrs)
+        check("... all of it in the trailer",
+              tail.get("next", 0) >= 80 and "end" in tail and tail.get("total", 0) >= tail["next"] + tail.get("start", 0),
+              trailers)
+    else:
+        (rr, body) = call(port, "/stream")
+        st = durations(rr.getheader("Server-Timing"))
+        check("%s, streamed:  Server-Timing header up to start" % engine,
+              st.get("start", 0) >= 50 and "next" not in st and len(body) > 0, rr.getheaders())
+    pm = latest("stream", infos).get('phaseMillis', {})
+    check("... phaseMillis has next and end", pm.get("next", 0) >= 80 and "end" in pm, pm)
+
+
+ws = serve({"port": 7914}, {"docs": Docs})
+(rr, body) = call(7914, "/docs")
+check("no Server-Timing unless asked for", rr.status == 200 and rr.getheader("Server-Timing") is None, rr.getheaders())
+
+
+done()
@@ -0,0 +1,90 @@
+#
+#  Uploads (docReader):  a JSON array is taken apart as it is read, so
+#  a body far bigger than maxDocBytes goes through as long as each doc
+#  fits, with strings holding brackets, commas, and escapes intact; a doc
+#  that is too big, JSON that does not parse, and garbled chunking are
+#  answered with 400 (errcode 16) on either engine.  Exits non-zero on
+#  any failure.
+#
+#  python3 WebF_upload.t.py
+#
+import json
+import socket
+
+import WebF
+from WebF_testing import check, done, serve, call
+
+
+class Load:
+    def __init__(self, context):
+        pass
+
+    def help(self):
+        return {}
+
+    def start(self, cmd, hdrs, args, rfile):
+        docs = WebF.WebF.docReader(rfile, hdrs, batch=100, maxDocBytes=1024)
+        n = 0
+        last = None
+        for batch in docs:
+            n += len(batch)
+            last = batch[-1]
+        return (200, None, [{"n": docs.count, "last": last}], False)
+
+
+def post(port, body, ctype="application/json", chunked=False):
+    (rr, data) = call(port, "/load", {"Content-Type": ctype}, "POST", timeout=10,
+                      body=iter([body[i:i + 1000] for i in range(0, len(body), 1000)]) if chunked else body)
+    data = json.loads(data)
+    return (rr.status, data[0] if isinstance(data, list) and len(data) > 0 else data)
+
+
+def raw(port, request):
+    ss = socket.create_connection(("localhost", port), timeout=5)
+    ss.sendall(request)
+    data = b""
+    while True:
+        more = ss.recv(65536)
+        if not more:
+            break
+        data += more
+    ss.close()
+    return data
+
+
+tricky = {"s": "a],[b}{\"c\\", "l": [1, [2, {"x": "]"}]], "u": "é☃"}
+docs = [{"i": i, "pad": "x" * 50} for i in range(20000)] + [tricky]
+body = json.dumps(docs).encode()
+
+for (port, engine) in ((7991, "threaded"), (7992, "asyncio")):
+    serve({"port": port, "engine": engine}, {"load": Load})
+
+    (status, got) = post(port, body)
+    check("%s: %d byte array of small docs" % (engine, len(body)),
+          status == 200 and got['n'] == 20001 and got['last'] == tricky, (status, got))
+    (status, got) = post(port, body, chunked=True)
+    check("%s: ... chunked" % engine, status == 200 and got['n'] == 20001 and got['last'] == tricky, (status, got))
+    (status, got) = post(port, b' [ ] ')
+    check("%s: empty array" % engine, status == 200 and got['n'] == 0, (status, got))
+    (status, got) = post(port, b'{"one": 1}')
+    check("%s: one doc" % engine, status == 200 and got['last'] == {"one": 1}, (status, got))
+
+    for (what, text) in (("doc too big", json.dumps([{"a": 1}, {"pad": "x" * 2000}]).encode()),
+                         ("single doc too big", json.dumps({"pad": "x" * 2000}).encode()),
+                         ("bad JSON", b'[{"a": 1}, {"a": }]'),
+                         ("missing doc", b'[{"a": 1},, {"a": 2}]'),
+                         ("unterminated array", b'[{"a": 1}, {"a": 2}'),
+                         ("more after the array", b'[{"a": 1}] {}')):
+        (status, got) = post(port, text)
+        check("%s: %s answered 400" % (engine, what), status == 400 and got['errcode'] == 16, (status, got))
+
+    (status, got) = post(port, b'{"a": 1}\n' + json.dumps({"pad": "x" * 2000}).encode() + b'\n', ctype="application/x-ndjson")
+    check("%s: ndjson line too big answered 400" % engine, status == 400 and got['errcode'] == 16, (status, got))
+
+    data = raw(port, b"POST /load HTTP/1.1\r\nHost: x\r\nContent-Type: application/json\r\n"
+                     b"Transfer-Encoding: chunked\r\n\r\nzz\r\n[]\r\n0\r\n\r\n")
+    check("%s: garbled chunk size answered 400" % engine,
+          data.split(b" ")[1] == b"400" and b'"errcode":16' in data.replace(b" ", b""), data[0:200])
+
+
+done()
@@ -0,0 +1,108 @@
+#
+#  Worker processes:  calls are served by the workers, and every worker
+#  has pools of its own, with instances constructed in that worker
+#  rather than ones inherited from before the fork; cursor tokens are
+#  always taken up with resume(), whichever worker gets the call, and a
+#  cursor function without resume() streams without cursors.  Exits
+#  non-zero on any failure.
+#
+#  python3 WebF_workers.t.py
+#
+import os
+import sys
+import json
+import signal
+import time
+
+import WebF
+from WebF_testing import check, done, call
+
+
+class Pid:
+    def __init__(self, context):
+        self.pid = os.getpid()   # the process the instance belongs to
+
+    def help(self):
+        return {"reusable": True, "poolSize": 2}
+
+    def start(self, cmd, hdrs, args, rfile):
+        return (200, None, [{"made": self.pid, "serving": os.getpid()}], False)
+
+
+class Things:
+    def __init__(self, context):
+        self.last = None
+        self.resumed = False
+
+    def help(self):
+        return {"cursor": {"every": 1000, "pageSize": 5}}
+
+    def start(self, cmd, hdrs, args, rfile):
+        return (200, None, None, True)
+
+    def resume(self, position):
+        self.last = position
+        self.resumed = True
+
+    def position(self):
+        return self.last
+
+    def next(self):
+        for i in range(0 if self.last is None else self.last + 1, 23):
+            self.last = i
+            yield {"i": i, "resumed": self.resumed}
+
+
+class NoResume(Things):
+    resume = None
+
+
+
+if not hasattr(os, "fork"):
+    print("no os.fork(); nothing to test")
+    sys.exit(0)
+
+ws = WebF.WebF({"port": 7961, "workerGrace": 5})
+ws.registerFunction("pid", Pid, None)   # constructs one here, in the parent
+ws.registerFunction("things", Things, None)
+ws.registerFunction("noresume", NoResume, None)
+ws.registerLogger(lambda info, ctx: None, None)
+
+server = os.fork()
+if server == 0:
+    try:
+        ws.go(workers=2)
+    finally:
+        os._exit(0)
+
+time.sleep(1.0)
+
+seen = [json.loads(call(7961, "/pid")[1])[0] for i in range(20)]
+
+check("served by workers", all([dd['serving'] not in (os.getpid(), server) for dd in seen]), seen[0:3])
+check("instances made in the worker serving them", all([dd['made'] == dd['serving'] for dd in seen]), seen[0:3])
+
+
+#  Page through things, every page after the first taken up with resume()
+def pages(path):
+    (rr, body) = call(7961, path)
+    got = [json.loads(body)]
+    while rr.status == 200 and "_cursor" in got[-1][-1]:
+        (rr, body) = call(7961, "/things?_cursor=" + got[-1][-1]['_cursor'])
+        got.append(json.loads(body) if rr.status == 200 else [{"status": rr.status}])
+    return got
+
+walks = [pages("/things") for i in range(6)]
+check("cursor pages:  all the docs in order", all([[d['i'] for pp in got for d in pp if 'i' in d] == list(range(23))
+                                                   for got in walks]), walks[0])
+check("... each page after the first with resume()", all([[pp[0]['resumed'] for pp in got] == [False] + [True] * 4
+                                                          for got in walks]), walks[0])
+docs = json.loads(call(7961, "/noresume?_pageSize=3")[1])
+check("without resume():  no cursors", [d.get('i') for d in docs] == list(range(23)), docs)
+
+os.kill(server, signal.SIGTERM)
+(pid, status) = os.waitpid(server, 0)
+check("workers stop upon SIGTERM", os.WIFEXITED(status), status)
+
+
+done()
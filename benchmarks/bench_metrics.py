@@ -0,0 +1,92 @@
+#
+#  Metrics overhead benchmark:  the cost of recording one call
+#  (callMetrics.enter + leave) from 1 and 8 threads on the same function,
+#  and calls per second over keep-alive connections to an in-process
+#  server with metrics on vs. off.
+#
+#  python3 benchmarks/bench_metrics.py
+#
+import http.client
+import os
+import sys
+import threading
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import WebF
+
+
+class Small:
+    def __init__(self, context):
+        pass
+
+    def help(self):
+        return {}
+
+    def start(self, cmd, hdrs, args, rfile):
+        return (200, None, [{"a": 1}], False)
+
+
+def record(mm, n):
+    for i in range(n):
+        ss = mm.enter("f")
+        mm.leave(ss, 200, 0.0004, 0.0012, 1, 100)
+
+
+def threaded(mm, nthreads, n):
+    tt = [threading.Thread(target=record, args=(mm, n)) for i in range(nthreads)]
+    t0 = time.perf_counter()
+    for t in tt:
+        t.start()
+    for t in tt:
+        t.join()
+    return time.perf_counter() - t0
+
+
+def calls(port, nconn, n):
+    def client():
+        cc = http.client.HTTPConnection("localhost", port)
+        for i in range(n):
+            cc.request("GET", "/f")
+            cc.getresponse().read()
+        cc.close()
+
+    tt = [threading.Thread(target=client) for i in range(nconn)]
+    t0 = time.perf_counter()
+    for t in tt:
+        t.start()
+    for t in tt:
+        t.join()
+    return nconn * n / (time.perf_counter() - t0)
+
+
+def main():
+    n = 100000
+
+    mm = WebF.WebF.callMetrics()
+    t = timeit.timeit(lambda: record(mm, n), number=1)
+    print("%-34s %10.2f us/call" % ("enter+leave, 1 thread", t/n*1e6))
+
+    mm = WebF.WebF.callMetrics()
+    t = threaded(mm, 8, n // 8)
+    print("%-34s %10.2f us/call" % ("enter+leave, 8 threads", t/n*1e6))
+
+    print()
+    print("%-34s %10s" % ("server (keepAlive, 4 conns)", "calls/sec"))
+    port = 7901
+    for metrics in (False, True):
+        ws = WebF.WebF({"port": port, "keepAlive": True, "metrics": metrics})
+        ws.registerFunction("f", Small, None)
+        ws.registerLogger(lambda info, ctx: None, None)
+        threading.Thread(target=ws.go, daemon=True).start()
+        time.sleep(0.2)
+
+        calls(port, 4, 200)   # warm up
+        best = max([calls(port, 4, 1000) for r in range(3)])
+        print("%-34s %10.0f" % ("metrics " + ("on" if metrics else "off"), best))
+        port += 1
+
+
+main()
@@ -0,0 +1,164 @@
+#
+#  mson.parse benchmark:  the original two-pass MONGO parse (json.loads
+#  then a second walk of the tree; copied verbatim below as legacyParse)
+#  vs. the single-pass object hook, over args payloads of increasing
+#  size carrying lists of $date and $numberDecimal values, plus the
+#  no-"$" fast path.
+#
+#  python3 benchmarks/bench_mson_parse.py
+#
+import base64
+import datetime
+import json
+import os
+import sys
+import timeit
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from dateutil import parser
+from bson.objectid import ObjectId
+from bson.binary import Binary
+
+from mson import mson
+
+
+#  The original mson.parse, for comparison:
+def legacyParse(strval,mode):
+
+    mm = json.loads(strval)
+    
+    if mode == mson.PURE:  # Yer done!
+        return mm  #  just leave
+
+    def cvtLongMillisToDatetime(v):
+        millis  = v / 1000.0; # Ha!  micros are float FRACTION!
+        dv = datetime.datetime.utcfromtimestamp(millis)
+        return dv
+
+    # ... else look for code below these two defs!
+    def XprocessMap(zz):
+        for k in zz:
+            newval = XprocessThing(zz[k])
+
+            if newval is not None:
+                zz[k] = newval
+
+    def XprocessThing(thing):
+        newval = None
+
+        if isinstance(thing, dict):
+            # python3 thing.keys() is no long an iteratable but
+            # rather a dict_keys.  len() still works BUT direct
+            # integer subscripting does not.  The std workaround
+            # is to call list() which exposes us to the thread-
+            # changing-the-dict-miditeration problem but we do
+            # not have that here...
+            cks = list(thing.keys())
+
+            #  Sigh.... special case for $binary...
+            if len(cks) == 2:
+                ck1 = cks[0]
+                ck2 = cks[1]
+
+                if ck1 == "$binary" and ck2 == "$type":
+                    v = thing[ck1]
+                    q2 = base64.b64decode(v);
+                    q = Binary(q2)
+                    newval = q    
+                    
+                if ck2 == "$binary" and ck1 == "$type":
+                    v = thing[ck2]
+                    q2 = base64.b64decode(v);
+                    q = Binary(q2)
+                    newval = q    
+
+            elif len(cks) == 1:
+                ck = cks[0]
+                v = thing[ck]
+                    
+                if ck == "$numberInt":  # future?
+                    newval = int(v)
+            
+                elif ck == "$date":
+                    #  jsonp will turn ANY numberish thing into 
+                    #  an int, even 8888123123123123123 .  Yep.
+                    #  is __class__ int.
+                    if isinstance(v, int):
+                        dv = cvtLongMillisToDatetime(v)
+                    else:
+                        # It's a string.  If T is there go for parse:
+                        if "T" in v:
+                            dv = parser.parse(v)
+                        else:
+                            dv = cvtLongMillisToDatetime(int(v))
+
+                    newval = dv
+
+                elif ck == "$numberLong":
+                    newval = long(v)
+            
+                elif ck == "$numberFloat":  # future?
+                    newval = float(v)
+
+                elif ck == "$numberDouble":  # future?
+                    newval = float(v)
+
+                elif ck == "$numberDecimal":
+                    newval = Decimal(v)
+            
+                elif ck == "$binary":
+                    q2 = base64.b64decode(v);
+                    q = Binary(q2)
+                    newval = q    
+
+                elif ck == "$oid":
+                    q = ObjectId(v)
+                    newval = q    
+
+            if newval == None:
+                XprocessMap(thing)
+
+        elif isinstance(thing, list):
+            for i in range(0, len(thing)):
+                v = thing[i]
+                nv2 = XprocessThing(v)
+                if nv2 is not None:
+                    thing[i] = nv2
+
+        return newval
+
+    XprocessMap(mm)
+    return mm
+
+
+def makeArgs(n, ejson=True):
+    items = []
+    for i in range(0, n):
+        if ejson:
+            items.append({"id": i, "when": {"$date": 1485640066333 + i},
+                          "amt": {"$numberDecimal": "%d.25" % i}, "tag": "t%d" % i})
+        else:
+            items.append({"id": i, "when": 1485640066333 + i, "amt": i + 0.25, "tag": "t%d" % i})
+    return json.dumps({"reqs": items, "filter": {"x": 1}})
+
+
+def main():
+    print("%8s %9s %12s %12s %8s %12s" % ("items", "bytes", "legacy ms", "hook ms", "speedup", "no-$ ms"))
+
+    for n in [10, 100, 1000, 10000, 100000]:
+        s1 = makeArgs(n)
+        s2 = makeArgs(n, False)
+
+        assert legacyParse(s1, mson.MONGO) == mson.parse(s1, mson.MONGO)
+
+        reps = max(1, 20000 // n)
+        t1 = min(timeit.repeat(lambda: legacyParse(s1, mson.MONGO), number=reps, repeat=3)) / reps
+        t2 = min(timeit.repeat(lambda: mson.parse(s1, mson.MONGO), number=reps, repeat=3)) / reps
+        t3 = min(timeit.repeat(lambda: mson.parse(s2, mson.MONGO), number=reps, repeat=3)) / reps
+
+        print("%8d %9d %12.3f %12.3f %7.2fx %12.3f" % (n, len(s1), t1*1000, t2*1000, t1/t2, t3*1000))
+
+
+main()
@@ -0,0 +1,274 @@
+#
+#  mson.write benchmark:  the original closure-based writer (copied
+#  verbatim below as legacyWrite) vs. mson.encode / mson.encodeMany vs.
+#  json.dumps, on docs shaped like Func1.makeDoc in minisvc.py.
+#
+#  python3 benchmarks/bench_mson_write.py
+#
+import base64
+import datetime
+import io
+import json
+import os
+import sys
+import timeit
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import bson
+from bson.objectid import ObjectId
+from bson.binary import Binary
+
+from mson import mson
+
+
+def makeDoc(num):
+    #  Same shape as minisvc.Func1.makeDoc
+    dd = datetime.datetime(2018,1,1)
+    bamt = bson.decimal128.Decimal128("23.7")
+
+    CRcontent = """hello
+and
+	goodbye
+forever"""
+
+    return {
+        "name":"buzz",
+        "addr":{"city":"NY","state":"NY","zip":"07078","loc":{"n":"139","s":"W82 St."}},
+        "num":num,
+        "CR": CRcontent,
+        "quotes": [ '"yow"' , "hawai\'i" ],
+        "whatevs": {
+            "fpets": [ "dog","cat", 3, dd]
+            },
+        "someDouble":11.11,
+        "date":dd,
+        "bson128_amt":bamt
+        }
+
+
+#  The original mson.write, for comparison:
+def legacyWrite(ostream, m, fmt):
+    #  ostream,m,fmt will remain in scope for all the functions we
+    #  define here, sort of like class instance level vars
+    
+    def emit(spcs, strval):
+        #ostream.write(strval)
+        ostream.write(strval.encode('utf-8'))
+
+    #  A JSON String that prints like this:
+    #
+    #    {"server": "julia", "bob \"and\" danA"}
+    #
+    #  needs to look like this when captured a string
+    #
+    #    {\"server\": \"julia\", \"bob \\\"and\\\" danA\"}
+    #
+    #  TBD:  This groom could use completeness and performance...
+    def groomJSONStr(instr):
+        return instr.replace('\\','\\\\').replace('"', '\\\"').replace("\n","\\n").replace("\t","\\t")
+
+
+    def emitItem(lvl, ith, v):
+        spcs = ""
+        spcs2 = " " * ith
+
+        if v == None:
+            emit(spcs, "null")
+
+        elif isinstance(v, Binary):
+            q = base64.b64encode(v);
+            emit(spcs,  "{\"$binary\":\"%s\", \"$type\":\"00\"}" % q )
+
+        elif isinstance(v, Decimal):
+            if fmt == mson.MONGO:
+                emit(spcs,  "{\"$numberDecimal\":\"%s\"}" % v )
+            else:
+                emit(spcs, "%s" % v)
+
+        elif isinstance(v, bson.decimal128.Decimal128):
+            if fmt == mson.MONGO:
+                emit(spcs,  "{\"$numberDecimal\":\"%s\"}" % v )
+            else:
+                emit(spcs, "%s" % v)
+
+# no more unicode in python3; strings ARE unicode         
+#            elif isinstance(v, unicode):
+#                q = v.encode('ascii', 'replace')
+#                s2 = groomJSONStr(q)
+#                emit(spcs, "\"%s\"" % s2)
+
+        elif isinstance(v, str):
+            s2 = groomJSONStr(v)
+            emit(spcs, "\"%s\"" % s2)
+
+        # Test for isinstance bool MUST precede test for int
+        # because it will satisfy that condition too!
+        elif isinstance(v, bool):
+            # toString of bool works just fine...
+            emit(spcs, "%s" % v)
+
+        elif isinstance(v, int):
+            if fmt == mson.MONGO:
+                # TBD:  Need to affirm these!
+                if v > 2147483647 or v < -2147483647:
+                    emit(spcs,  "{\"$numberLong\":\"%s\"}" % v )
+                else:
+                    emit(spcs, "%s" % v )
+            else:
+                emit(spcs, "%s" % v )
+
+
+        elif isinstance(v, float):
+            # Fortunately, the string formatter for
+            # doubles will add .0 upon output so you KNOW
+            # it's a double.
+            emit(spcs,  "%s" % v )
+
+# no long in python3
+#            elif isinstance(v, long):
+#                if fmt == mson.MONGO:
+#                    emit(spcs,  "{\"$numberLong\":\"%s\"}" % v )
+#                else:
+#                    emit(spcs, v)
+
+
+        elif isinstance(v, datetime.datetime) or isinstance(v, datetime.date):
+            #  Mongo supports pass epoch as well but
+            #  this is probably the safer route.
+            #  Just convert to ISO8601 for both...
+            # q = v.strftime('%s')  # epoach
+
+            q = v.strftime("%Y-%m-%dT%H:%M:%S")                
+
+            #  Sigh.  Must get millis from micros!
+            if isinstance(v, datetime.date):
+                ms = 0
+            else:
+                ms = v.microsecond/1000
+
+            iso8601 ="%s.%sZ" % (q,ms)
+
+            #  Dates are simply too often used to force people
+            #  not in MongoDB mode to deal with the extra $date.
+            #  It's the caller's choice so... if they really want
+            #  the fidelity, ask for ejson or better yet:  bson!
+            if fmt == mson.MONGO:
+                emit(spcs,  "{\"$date\":\"%s\"}" % iso8601)
+            else:
+                emit(spcs, "\"%s\"" % iso8601)
+
+
+        elif isinstance(v, ObjectId):
+            # toString of ObjectId mercifully does the right thing....
+            emit(spcs,  "{\"$oid\":\"%s\"}" % v )
+
+        elif isinstance(v, list):
+            emit (spcs2,  "[" )
+            i = 0
+            for item in v:
+                if i > 0:
+                    emit( spcs2, "," )
+           
+                emitItem(lvl + 1, i, item)
+                i = i + 1
+
+            emit( spcs2, "]" ) 
+
+        elif isinstance(v, dict):
+            emitDoc(lvl + 1, v)
+
+        else:
+            #  UNKNOWN type?
+            t = type(v)
+            emit(spcs,  "\"%s::%s\"" % (t,v) )
+
+
+    def emitDoc(lvl, m):
+        i = 0
+
+        spcs = ""
+
+        emit( spcs, "{")
+
+        for k in m:
+            item = m[k]
+            if i > 0:
+                emit(spcs,  ",\"%s\":" % (k) )
+            else:
+                emit(spcs,  "\"%s\":" % (k) )
+
+            emitItem(lvl + 1, i, item)
+            i = i + 1
+
+        emit(spcs,  "}")
+
+
+        if lvl == 0:
+            #ostream.write("\n")
+            emit("", "\n")
+
+     #print ""   # force the CR
+
+    emitDoc(0, m)
+
+
+def main():
+    docs = [makeDoc(n) for n in range(0, 1000)]
+    reps = 5
+
+    def runLegacy(fmt):
+        for d in docs:
+            fstr = io.BytesIO()
+            legacyWrite(fstr, d, fmt)
+            fstr.getvalue()
+
+    def runEncode(fmt):
+        for d in docs:
+            mson.encode(d, fmt)
+
+    def runMany(fmt):
+        mson.encodeMany(docs, fmt)
+
+    def runDumps():
+        for d in docs:
+            json.dumps(d, default=str, separators=(',',':')).encode('utf-8')
+
+    def withBackend(name, fn):
+        def run():
+            was = mson.backend
+            mson.setBackend(name)
+            try:
+                fn()
+            finally:
+                mson.setBackend(was)
+        return run
+
+    cases = [
+        ("legacy write   PURE", lambda: runLegacy(mson.PURE)),
+        ("encode         PURE", withBackend("pure", lambda: runEncode(mson.PURE))),
+        ("encodeMany     PURE", withBackend("pure", lambda: runMany(mson.PURE))),
+        ("legacy write  MONGO", lambda: runLegacy(mson.MONGO)),
+        ("encode        MONGO", lambda: runEncode(mson.MONGO)),
+        ("encodeMany    MONGO", lambda: runMany(mson.MONGO)),
+        ("json.dumps(default=str)", runDumps)
+        ]
+
+    try:
+        import orjson
+        cases.insert(3, ("encode orjson  PURE", withBackend("orjson", lambda: runEncode(mson.PURE))))
+    except ImportError:
+        pass
+
+    base = None
+    print("%-24s %12s %8s" % ("case", "docs/sec", "vs legacy"))
+    for (name, fn) in cases:
+        t = min(timeit.repeat(fn, number=reps, repeat=3))
+        rate = len(docs) * reps / t
+        if name.startswith("legacy"):
+            base = rate
+        print("%-24s %12.0f %7.2fx" % (name, rate, rate/base))
+
+
+main()
@@ -0,0 +1,72 @@
+#
+#  Writer passthrough benchmark:  docs read from MongoDB arrive as raw
+#  BSON.  Compare emitting them as decoded dicts (encoded again by the
+#  writer) vs. handing the writer the RawBSONDocument / bytes as is, for
+#  the bson and json writers.
+#
+#  python3 benchmarks/bench_passthrough.py
+#
+import datetime
+import io
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import bson
+from bson.raw_bson import RawBSONDocument
+
+import WebF
+
+
+def makeDoc(num):
+    return {
+        "name":"buzz",
+        "addr":{"city":"NY","state":"NY","zip":"07078","loc":{"n":"139","s":"W82 St."}},
+        "num":num,
+        "quotes": [ '"yow"' , "hawai\'i" ],
+        "whatevs": { "fpets": [ "dog","cat", 3, datetime.datetime(2018,1,1)] },
+        "someDouble":11.11,
+        "blob": "x" * 200
+        }
+
+
+def run(writerClass, docs):
+    out = io.BytesIO()
+    ww = writerClass(out, None)
+    ww.prologue()
+    for doc in docs:
+        ww.emit(doc)
+    ww.epilogue()
+    return out.getvalue()
+
+
+def main():
+    n = 10000
+    reps = 5
+
+    raws = [bson.encode(makeDoc(i)) for i in range(n)]
+    dicts = [bson.decode(r) for r in raws]
+    rawdocs = [RawBSONDocument(r) for r in raws]
+    jsons = [WebF.WebF.encodedDoc.wrap('json', WebF.WebF.encodedDoc.encode(d, 'json')) for d in dicts]
+
+    assert run(WebF.WebF.bsonWriter, dicts) == run(WebF.WebF.bsonWriter, rawdocs) == run(WebF.WebF.bsonWriter, raws)
+    assert run(WebF.WebF.jsonWriter, dicts) == run(WebF.WebF.jsonWriter, jsons)
+
+    cases = [
+        ("bson   dict (re-encode)", WebF.WebF.bsonWriter, dicts),
+        ("bson   RawBSONDocument", WebF.WebF.bsonWriter, rawdocs),
+        ("bson   bytes", WebF.WebF.bsonWriter, raws),
+        ("json   dict (encode)", WebF.WebF.jsonWriter, dicts),
+        ("json   encodedDoc.wrap", WebF.WebF.jsonWriter, jsons),
+        ("json   RawBSONDocument (convert)", WebF.WebF.jsonWriter, rawdocs),
+        ]
+
+    print("%-34s %12s" % ("case", "us/doc"))
+    for (name, writerClass, docs) in cases:
+        t = timeit.timeit(lambda: run(writerClass, docs), number=reps)
+        print("%-34s %12.2f" % (name, t/(reps*n)*1e6))
+
+
+main()
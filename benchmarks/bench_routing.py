@@ -0,0 +1,67 @@
+#
+#  Routing microbenchmark:  the old per-request sorted scan of fmap vs.
+#  the path-segment route table, with 10, 100, and 1000 registered
+#  versioned functions (v1/foo0, v2/foo0/bar, ...)
+#
+#  python3 benchmarks/bench_routing.py
+#
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import WebF
+
+
+def legacyMatch(fmap, prefunc):
+    #  Verbatim copy of the original longest-first scan in getHandlerForFunc
+    func = None
+    restful = None
+    for fname,v in sorted(fmap.items(), key=lambda k: (len(k),k), reverse=True):
+        lname = len(fname)
+        frag = prefunc[:lname]
+        if fname == frag:
+            func = fname
+            restful = prefunc[lname+1:]
+            if restful == "":
+                restful = None
+            break
+    return (func, restful)
+
+
+def makeNames(n):
+    names = []
+    i = 0
+    while len(names) < n:
+        names.append("v1/foo%d" % i)
+        if len(names) < n:
+            names.append("v2/foo%d/bar" % i)
+        i += 1
+    return names
+
+
+def main():
+    reps = 2000
+
+    print("%6s %14s %14s %8s" % ("nfuncs", "legacy us/call", "trie us/call", "speedup"))
+
+    for n in [10, 100, 1000]:
+        names = makeNames(n)
+        fmap = dict([(nm, (None, None)) for nm in names])
+        routes = WebF.WebF.routeTable(names)
+
+        # Mix of hits w/ RESTful remainder, deep hits, and misses:
+        paths = ["v1/foo%d/E999/4" % (n//4), "v2/foo%d/bar" % (n//3), "nope/at/all"]
+
+        for p in paths:
+            assert legacyMatch(fmap, p) == routes.match(p), p
+
+        t1 = timeit.timeit(lambda: [legacyMatch(fmap, p) for p in paths], number=reps)
+        t2 = timeit.timeit(lambda: [routes.match(p) for p in paths], number=reps)
+
+        calls = reps * len(paths)
+        print("%6d %14.2f %14.2f %7.1fx" % (n, t1/calls*1e6, t2/calls*1e6, t1/t2))
+
+
+main()
@@ -0,0 +1,430 @@
+#
+#  Benchmark suite:  starts WebF servers in this process on localhost and
+#  measures calls per second and p50/p99 latency (in millis, from the
+#  client's side) for
+#    - small one-doc calls, over keep-alive and with a connection per call
+#    - streaming next() responses in each output format, chunked (keep-alive)
+#      and not (HTTP/1.0), and one large stream
+#    - the same small and streaming calls over TLS
+#    - calls carrying large args with $date / $numberDecimal values
+#  plus microbenchmarks of mson.parse, mson.write, routing, and the help()
+#  args check.  Results are written as JSON so runs can be compared:
+#
+#  python3 benchmarks/suite.py                      # all of it, to bench-results.json
+#  python3 benchmarks/suite.py --quick --only stream --out new.json
+#  python3 benchmarks/suite.py --compare old.json   # also compare with an earlier run
+#
+#  The exit status is 1 if any call in a case failed (a status other than
+#  200, or an error on the connection), or with --compare if any case got
+#  slower than --threshold (default 10%) in calls (or ops) per second.
+#  Servers are started as the cases that use them come up, so --only
+#  starts just the ones it needs.
+#
+import argparse
+import datetime
+import http.client
+import io
+import json
+import os
+import platform
+import socket
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+import urllib.parse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+
+import WebF
+from mson import mson
+
+
+class Small:
+    def __init__(self, context):
+        pass
+
+    def help(self):
+        return {}
+
+    def start(self, cmd, hdrs, args, rfile):
+        return (200, None, [{"name": "buzz", "num": 1, "when": datetime.datetime(2018, 1, 1)}], False)
+
+
+class Stream:
+    def __init__(self, context):
+        pass
+
+    def help(self):
+        return {"args": [{"name": "n", "type": "int", "req": "Y"}]}
+
+    def start(self, cmd, hdrs, args, rfile):
+        self.n = args['n']
+        return (200, None, None, True)
+
+    def next(self):
+        dd = datetime.datetime(2018, 1, 1)
+        for i in range(self.n):
+            yield {"name": "buzz", "num": i, "date": dd, "someDouble": 11.11,
+                   "addr": {"city": "NY", "state": "NY", "zip": "07078"},
+                   "quotes": ['"yow"', "hawai'i"]}
+
+
+class Args:
+    def __init__(self, context):
+        pass
+
+    def help(self):
+        return {"args": [{"name": "reqs", "type": "array", "req": "Y"},
+                         {"name": "filter", "type": "dict", "req": "N"}]}
+
+    def start(self, cmd, hdrs, args, rfile):
+        return (200, None, [{"count": len(args['reqs'])}], False)
+
+
+#  The same args as the POST body:  too big for a URL
+class ArgsBody:
+    def __init__(self, context):
+        pass
+
+    def help(self):
+        return {}
+
+    def start(self, cmd, hdrs, args, rfile):
+        for doc in WebF.WebF.docReader(rfile, hdrs):
+            return (200, None, [{"count": len(doc['reqs'])}], False)
+        return (400, None, [{"msg": "no body"}], False)
+
+
+def freePort():
+    s = socket.socket()
+    s.bind(("localhost", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+#  A self-signed cert for localhost, or None if openssl is not around
+def makeCert(tmpdir):
+    key = os.path.join(tmpdir, "key.pem")
+    cert = os.path.join(tmpdir, "cert.pem")
+    try:
+        subprocess.run(["openssl", "req", "-x509", "-nodes", "-newkey", "rsa:2048",
+                        "-subj", "/CN=localhost", "-keyout", key, "-out", cert, "-days", "1"],
+                       check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return (key, cert)
+
+
+def startServer(wargs):
+    port = freePort()
+    ws = WebF.WebF(dict(wargs, port=port, metrics=False))
+    ws.registerFunction("small", Small, None)
+    ws.registerFunction("stream", Stream, None)
+    ws.registerFunction("args", Args, None)
+    ws.registerFunction("argsBody", ArgsBody, None)
+    ws.registerLogger(lambda info, context: None, None)
+    threading.Thread(target=ws.go, daemon=True).start()
+
+    # Wait until it answers
+    for i in range(100):
+        try:
+            socket.create_connection(("localhost", port), timeout=1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    return port
+
+
+def argsDoc(n):
+    items = [{"id": i, "when": {"$date": 1485640066333 + i},
+              "amt": {"$numberDecimal": "%d.25" % i}, "tag": "t%d" % i} for i in range(n)]
+    return json.dumps({"reqs": items, "filter": {"x": 1}})
+
+
+def argsPath(n):
+    return "/args?args=" + urllib.parse.quote(argsDoc(n))
+
+
+def percentile(sortedVals, p):
+    if len(sortedVals) == 0:
+        return None
+    return sortedVals[min(len(sortedVals) - 1, int(round(p * (len(sortedVals) - 1))))]
+
+
+#  nconn client threads each make calls over one keep-alive connection
+#  (or a new connection per call) until ncalls have been made in all.
+#  With a body the calls are POSTs.  Only calls answered 200 count
+#  toward the latencies and rate; the rest are errors.
+def drive(port, path, headers, ncalls, nconn, keepAlive, tlsContext, body=None):
+    lock = threading.Lock()
+    left = [ncalls]
+    lats = []
+    nbytes = [0]
+    errors = [0]
+
+    def connect():
+        if tlsContext is not None:
+            return http.client.HTTPSConnection("localhost", port, context=tlsContext)
+        return http.client.HTTPConnection("localhost", port)
+
+    def client():
+        mine = []
+        got = 0
+        bad = 0
+        cc = connect() if keepAlive else None
+        while True:
+            with lock:
+                if left[0] == 0:
+                    break
+                left[0] -= 1
+            t = time.perf_counter()
+            conn = cc if keepAlive else connect()
+            try:
+                conn.request("GET" if body is None else "POST", path, body=body, headers=headers)
+                rr = conn.getresponse()
+                data = rr.read()
+                if rr.status != 200:
+                    bad += 1
+                    continue
+                got += len(data)
+            except (OSError, http.client.HTTPException):
+                bad += 1
+                conn.close()
+                if keepAlive:
+                    cc = connect()
+                continue
+            finally:
+                if not keepAlive:
+                    conn.close()
+            mine.append(time.perf_counter() - t)
+        if cc is not None:
+            cc.close()
+        with lock:
+            lats.extend(mine)
+            nbytes[0] += got
+            errors[0] += bad
+
+    tt = [threading.Thread(target=client) for i in range(nconn)]
+    t0 = time.perf_counter()
+    for t in tt:
+        t.start()
+    for t in tt:
+        t.join()
+    secs = time.perf_counter() - t0
+
+    lats.sort()
+    return {
+        "calls": len(lats),
+        "errors": errors[0],
+        "seconds": round(secs, 4),
+        "callsPerSec": round(len(lats) / secs, 1),
+        "p50Ms": round(percentile(lats, 0.50) * 1000, 3) if lats else None,
+        "p99Ms": round(percentile(lats, 0.99) * 1000, 3) if lats else None,
+        "bytesPerCall": nbytes[0] // len(lats) if lats else 0
+        }
+
+
+def serverCases(scale, tlsFiles):
+    tlsContext = None
+    wargs = {"plain11": {"keepAlive": True}, "plain10": {}}
+    if tlsFiles is not None:
+        (key, cert) = tlsFiles
+        wargs["tls11"] = {"keepAlive": True, "sslKeyFile": key, "sslCertChainFile": cert}
+        wargs["tls10"] = {"sslKeyFile": key, "sslCertChainFile": cert}
+        tlsContext = ssl.create_default_context(cafile=cert)
+    ports = {}
+
+    def port(server):
+        if server not in ports:
+            ports[server] = startServer(wargs[server])
+        return ports[server]
+
+    json_ = {"Accept": "application/json"}
+    fmts = [
+        ("json", json_),
+        ("ejson", {"Accept": "application/ejson"}),
+        ("json-boundaryLF", {"Accept": "application/json; boundary=LF"}),
+        ("ndjson", {"Accept": "application/x-ndjson"}),
+        ("bson", {"Accept": "application/bson"}),
+        ]
+    stream = "/stream?args=" + urllib.parse.quote('{"n":1000}')
+    big = "/stream?args=" + urllib.parse.quote('{"n":100000}')
+
+    # (name, server, path, body, headers, calls, connections, keepAlive)
+    #  args.1000items is some 180KB of args, past what a URL can carry,
+    #  so it goes as the POST body
+    cases = [
+        ("small.keepAlive", "plain11", "/small", None, json_, 4000, 4, True),
+        ("small.connPerCall", "plain10", "/small", None, json_, 1000, 4, False),
+        ]
+    for (fmt, hdrs) in fmts:
+        cases.append(("stream1k.%s.chunked" % fmt, "plain11", stream, None, hdrs, 100, 4, True))
+    cases.append(("stream1k.json.http10", "plain10", stream, None, json_, 100, 4, False))
+    cases.append(("stream100k.json.chunked", "plain11", big, None, json_, 4, 1, True))
+    cases.append(("args.100items", "plain11", argsPath(100), None, json_, 1000, 4, True))
+    cases.append(("args.1000items.body", "plain11", "/argsBody", argsDoc(1000).encode(),
+                  dict(json_, **{"Content-Type": "application/json"}), 200, 4, True))
+    if tlsFiles is not None:
+        cases.append(("tls.small.keepAlive", "tls11", "/small", None, json_, 4000, 4, True))
+        cases.append(("tls.small.connPerCall", "tls10", "/small", None, json_, 500, 4, False))
+        cases.append(("tls.stream1k.json.chunked", "tls11", stream, None, json_, 100, 4, True))
+
+    for (name, server, path, body, hdrs, ncalls, nconn, keepAlive) in cases:
+        ncalls = max(nconn, int(ncalls * scale))
+        tls = server.startswith("tls")
+        run = (lambda server=server, path=path, body=body, hdrs=hdrs, ncalls=ncalls, nconn=nconn, keepAlive=keepAlive, tls=tls:
+               drive(port(server), path, hdrs, ncalls, nconn, keepAlive, tlsContext if tls else None, body))
+        yield (name, run, {"connections": nconn, "keepAlive": keepAlive, "tls": tls})
+
+
+#  Time fn; returns ops per sec and micros per op
+def micro(fn, number):
+    t = min(timeit.repeat(fn, number=number, repeat=3)) / number
+    return {"opsPerSec": round(1 / t, 1), "usPerOp": round(t * 1e6, 3)}
+
+
+def microCases(scale):
+    small = json.dumps({"a": 1, "when": {"$date": 1485640066333}, "tag": "x"})
+    large = argsDoc(1000)
+    doc = mson.parse(json.dumps({"name": "buzz", "num": 1, "when": {"$date": 1485640066333},
+                                 "amt": {"$numberDecimal": "23.7"},
+                                 "addr": {"city": "NY", "state": "NY", "zip": "07078"},
+                                 "quotes": ['"yow"', "hawai'i"], "someDouble": 11.11}), mson.MONGO)
+
+    names = ["v1/foo%d" % i for i in range(500)] + ["v2/foo%d/bar" % i for i in range(500)]
+    routes = WebF.WebF.routeTable(names)
+    paths = ["v1/foo125/E999/4", "v2/foo333/bar", "nope/at/all"]
+
+    spec = WebF.WebF.funcSpec({"args": [
+        {"name": "startTime", "type": "datetime", "req": "Y"},
+        {"name": "maxCount", "type": "int", "req": "N"},
+        {"name": "filter", "type": "dict", "req": "N"},
+        {"name": "tags", "type": "array", "req": "N"},
+        {"name": "name", "type": "string", "req": "N"}]})
+    webArgs = {"startTime": datetime.datetime(2017, 1, 2), "maxCount": 10,
+               "filter": {"x": 1}, "tags": ["a", "b"], "name": "buzz"}
+
+    def writeOne():
+        mson.write(io.BytesIO(), doc, mson.MONGO)
+
+    n = max(1, int(scale * 1000))
+    yield ("mson.parse.small", lambda: micro(lambda: mson.parse(small, mson.MONGO), 20 * n), {})
+    yield ("mson.parse.1000items", lambda: micro(lambda: mson.parse(large, mson.MONGO), max(1, n // 50)), {})
+    yield ("mson.write.doc", lambda: micro(writeOne, 20 * n), {})
+    yield ("mson.encode.doc", lambda: micro(lambda: mson.encode(doc, mson.MONGO), 20 * n), {})
+    yield ("routing.1000funcs", lambda: micro(lambda: [routes.match(p) for p in paths], 20 * n), {"paths": len(paths)})
+    yield ("chkArgs.5args", lambda: micro(lambda: spec.check(webArgs), 50 * n), {})
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, check=True,
+                                capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "when": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "msonBackend": mson.backend,
+        "ssl": ssl.OPENSSL_VERSION
+        }
+
+
+#  Rate of a result:  calls or ops per sec
+def rate(rr):
+    return rr.get("callsPerSec", rr.get("opsPerSec"))
+
+
+def compare(old, new, threshold):
+    prev = dict([(rr["name"], rr) for rr in old["results"]])
+    worse = []
+    print()
+    print("%-30s %12s %12s %8s" % ("vs. " + (old["env"].get("commit") or "baseline"), "before", "now", "change"))
+    for rr in new["results"]:
+        pp = prev.get(rr["name"])
+        if rr.get("errors"):
+            print("%-30s %12s %12s %8s  %d ERRORS" % (rr["name"], "", "", "", rr["errors"]))
+            worse.append(rr["name"])
+            continue
+        if pp is None or not rate(pp) or not rate(rr):
+            continue
+        change = rate(rr) / rate(pp) - 1
+        flag = ""
+        if change < -threshold:
+            flag = "  SLOWER"
+            worse.append(rr["name"])
+        print("%-30s %12.1f %12.1f %+7.1f%%%s" % (rr["name"], rate(pp), rate(rr), change * 100, flag))
+    return worse
+
+
+def main():
+    ap = argparse.ArgumentParser(description="WebF / mson benchmark suite")
+    ap.add_argument("--out", default="bench-results.json", help="where to write the results (JSON)")
+    ap.add_argument("--compare", help="results of an earlier run to compare with")
+    ap.add_argument("--threshold", type=float, default=0.10, help="slowdown that counts as a regression (default 0.10)")
+    ap.add_argument("--only", action="append", help="run only cases whose name contains this (repeatable)")
+    ap.add_argument("--quick", action="store_true", help="a tenth of the calls; for a smoke test, not numbers")
+    ap.add_argument("--no-server", action="store_true", help="microbenchmarks only")
+    ap.add_argument("--no-tls", action="store_true", help="skip the TLS cases")
+    opts = ap.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="webf-bench-") as tmpdir:
+        runSuite(opts, tmpdir)
+
+
+def runSuite(opts, tmpdir):
+    scale = 0.1 if opts.quick else 1.0
+
+    tlsFiles = None if opts.no_tls or opts.no_server else makeCert(tmpdir)
+    if tlsFiles is None and not (opts.no_tls or opts.no_server):
+        print("openssl not found; skipping the TLS cases", file=sys.stderr)
+
+    cases = list(microCases(scale))
+    if not opts.no_server:
+        cases = list(serverCases(scale, tlsFiles)) + cases
+
+    results = []
+    failed = []
+    print("%-30s %12s %10s %10s" % ("case", "calls|ops/s", "p50 ms", "p99 ms"))
+    for (name, run, params) in cases:
+        if opts.only and not any(o in name for o in opts.only):
+            continue
+        rr = run()
+        rr["name"] = name
+        rr.update(params)
+        results.append(rr)
+        print("%-30s %12.1f %10s %10s" % (name, rate(rr),
+                                           rr.get("p50Ms", ""), rr.get("p99Ms", "")), flush=True)
+        if rr.get("errors"):
+            print("%-30s %d of %d calls failed" % ("", rr["errors"], rr["errors"] + rr["calls"]), flush=True)
+            failed.append(name)
+
+    out = {"env": environment(), "quick": opts.quick, "results": results}
+    with open(opts.out, "w") as f:
+        json.dump(out, f, indent=1)
+    print("results in %s" % opts.out)
+
+    if opts.compare:
+        with open(opts.compare) as f:
+            old = json.load(f)
+        worse = compare(old, out, opts.threshold)
+        if worse:
+            print("%d case(s) slower by more than %d%% or failing" % (len(worse), opts.threshold * 100))
+            sys.exit(1)
+    if failed:
+        print("%d case(s) with failed calls" % len(failed))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
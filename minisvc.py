@@ -128,13 +128,9 @@ class Echo:
         print("args:", args)
 
         if cmd == 'POST':
-            len = 0
-            if 'Content-Length' in hdrs:
-                len = int(hdrs['Content-Length'])
-            print("POST data len",len)
-            qq = rfile.read(len)
-            mdata = json.loads(qq)
-            print(mdata)
+            # json, ndjson, or bson; chunked or not; one doc at a time:
+            for mdata in WebF.WebF.docReader(rfile, hdrs):
+                print(mdata)
 
         return (200, None, None, False)
 
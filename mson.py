@@ -4,7 +4,8 @@
 #  like {"$numberDecimal": "234.23"}
 #
 #  Standard scalars are int, float, datetime, string, decimal, etc.
-#  Arrays are supported, as are dicts of dicts.
+#  Arrays are supported, as are dicts of dicts.  A UUID is written as
+#  its string and an Enum member as its value.
 #  Custom class mapping is not supported.
 #  
 #  Two Modes:  Pure and Mongo
@@ -31,6 +32,8 @@
 #
 import json
 import datetime
+import enum
+import uuid
 
 from dateutil import parser
 
@@ -41,284 +44,422 @@ from bson.objectid import ObjectId
 from bson.binary import Binary
 
 import base64
+import os
+import re
+
+#
+#  Optional accelerated JSON backend.  If orjson is importable (and env
+#  MSON_BACKEND is not "pure") it is used wherever it produces exactly
+#  what the pure python code below produces; anything it cannot do
+#  exactly falls back to the pure code doc by doc.  See _accelEncode
+#  and _accelLoads.
+#
+_accel = None
+if os.environ.get("MSON_BACKEND", "") != "pure":
+    try:
+        import orjson as _accel
+    except ImportError:
+        _accel = None
+
 
 class mson:
     PURE = 0
     MONGO = 1
 
+    backend = "orjson" if _accel is not None else "pure"
+
+    #  Switch backends at runtime:  "pure" or "orjson" 
+    @staticmethod
+    def setBackend(name):
+        global _accel
+        if name == "pure":
+            _accel = None
+        elif name == "orjson":
+            import orjson as _accel
+        else:
+            raise ValueError("unknown mson backend %s" % name)
+        mson.backend = name
+
     @staticmethod
     def parse(strval,mode):
 
-        mm = json.loads(strval)
-        
         if mode == mson.PURE:  # Yer done!
-            return mm  #  just leave
-
-        def cvtLongMillisToDatetime(v):
-            millis  = v / 1000.0; # Ha!  micros are float FRACTION!
-            dv = datetime.datetime.utcfromtimestamp(millis)
-            return dv
-
-        # ... else look for code below these two defs!
-        def XprocessMap(zz):
-            for k in zz:
-                newval = XprocessThing(zz[k])
-
-                if newval is not None:
-                    zz[k] = newval
-
-        def XprocessThing(thing):
-            newval = None
-
-            if isinstance(thing, dict):
-                # python3 thing.keys() is no long an iteratable but
-                # rather a dict_keys.  len() still works BUT direct
-                # integer subscripting does not.  The std workaround
-                # is to call list() which exposes us to the thread-
-                # changing-the-dict-miditeration problem but we do
-                # not have that here...
-                cks = list(thing.keys())
-
-                #  Sigh.... special case for $binary...
-                if len(cks) == 2:
-                    ck1 = cks[0]
-                    ck2 = cks[1]
-
-                    if ck1 == "$binary" and ck2 == "$type":
-                        v = thing[ck1]
-                        q2 = base64.b64decode(v);
-                        q = Binary(q2)
-                        newval = q    
-                        
-                    if ck2 == "$binary" and ck1 == "$type":
-                        v = thing[ck2]
-                        q2 = base64.b64decode(v);
-                        q = Binary(q2)
-                        newval = q    
-
-                elif len(cks) == 1:
-                    ck = cks[0]
-                    v = thing[ck]
-                        
-                    if ck == "$numberInt":  # future?
-                        newval = int(v)
-                
-                    elif ck == "$date":
-                        #  jsonp will turn ANY numberish thing into 
-                        #  an int, even 8888123123123123123 .  Yep.
-                        #  is __class__ int.
-                        if isinstance(v, int):
-                            dv = cvtLongMillisToDatetime(v)
-                        else:
-                            # It's a string.  If T is there go for parse:
-                            if "T" in v:
-                                dv = parser.parse(v)
-                            else:
-                                dv = cvtLongMillisToDatetime(int(v))
-
-                        newval = dv
-
-                    elif ck == "$numberLong":
-                        newval = long(v)
-                
-                    elif ck == "$numberFloat":  # future?
-                        newval = float(v)
-
-                    elif ck == "$numberDouble":  # future?
-                        newval = float(v)
-
-                    elif ck == "$numberDecimal":
-                        newval = Decimal(v)
-                
-                    elif ck == "$binary":
-                        q2 = base64.b64decode(v);
-                        q = Binary(q2)
-                        newval = q    
-
-                    elif ck == "$oid":
-                        q = ObjectId(v)
-                        newval = q    
-
-                if newval == None:
-                    XprocessMap(thing)
-
-            elif isinstance(thing, list):
-                for i in range(0, len(thing)):
-                    v = thing[i]
-                    nv2 = XprocessThing(v)
-                    if nv2 is not None:
-                        thing[i] = nv2
-
-            return newval
-
-        XprocessMap(mm)
+            return _loads(strval)
+
+        #  No "$..." keys anywhere means nothing to convert:
+        if '"$' not in strval and '\\u0024' not in strval:
+            return _loads(strval)
+
+        #  Extended JSON is converted as the decoder builds each dict
+        #  (innermost first) so there is no second walk of the tree.
+        mm = json.loads(strval, object_hook=_ejsonHook)
+
+        #  The top level itself has never been subject to conversion,
+        #  e.g. {"$date":...} as a whole stays a dict:
+        if not isinstance(mm, (dict, list)):
+            mm = json.loads(strval)
+
         return mm
 
 
+    #  Parse the one value that starts at pos in strval (no leading
+    #  whitespace) and return (value, end) where end is just past it, for
+    #  callers taking docs out of a larger text one at a time.  A dict is
+    #  converted in MONGO mode even at the top, as it is when it is an
+    #  item of an array given to parse().  Raises json.JSONDecodeError.
+    @staticmethod
+    def parseAt(strval, pos, mode):
+        return (_mongoDecoder if mode == mson.MONGO else _pureDecoder).raw_decode(strval, pos)
+
 
 
     @staticmethod
     def write(ostream, m, fmt):
-        #  ostream,m,fmt will remain in scope for all the functions we
-        #  define here, sort of like class instance level vars
-        
-        def emit(spcs, strval):
-            #ostream.write(strval)
-            ostream.write(strval.encode('utf-8'))
-
-        #  A JSON String that prints like this:
-        #
-        #    {"server": "julia", "bob \"and\" danA"}
-        #
-        #  needs to look like this when captured a string
-        #
-        #    {\"server\": \"julia\", \"bob \\\"and\\\" danA\"}
-        #
-        #  TBD:  This groom could use completeness and performance...
-        def groomJSONStr(instr):
-            return instr.replace('\\','\\\\').replace('"', '\\\"').replace("\n","\\n").replace("\t","\\t")
-
-
-        def emitItem(lvl, ith, v):
-            spcs = ""
-            spcs2 = " " * ith
-
-            if v == None:
-                emit(spcs, "null")
-
-            elif isinstance(v, Binary):
-                q = base64.b64encode(v);
-                emit(spcs,  "{\"$binary\":\"%s\", \"$type\":\"00\"}" % q )
-
-            elif isinstance(v, Decimal):
-                if fmt == mson.MONGO:
-                    emit(spcs,  "{\"$numberDecimal\":\"%s\"}" % v )
-                else:
-                    emit(spcs, "%s" % v)
+        ostream.write(mson.encode(m, fmt))
 
-            elif isinstance(v, bson.decimal128.Decimal128):
-                if fmt == mson.MONGO:
-                    emit(spcs,  "{\"$numberDecimal\":\"%s\"}" % v )
-                else:
-                    emit(spcs, "%s" % v)
-
-# no more unicode in python3; strings ARE unicode         
-#            elif isinstance(v, unicode):
-#                q = v.encode('ascii', 'replace')
-#                s2 = groomJSONStr(q)
-#                emit(spcs, "\"%s\"" % s2)
-
-            elif isinstance(v, str):
-                s2 = groomJSONStr(v)
-                emit(spcs, "\"%s\"" % s2)
-
-            # Test for isinstance bool MUST precede test for int
-            # because it will satisfy that condition too!
-            elif isinstance(v, bool):
-                # toString of bool works just fine...
-                emit(spcs, "%s" % v)
-
-            elif isinstance(v, int):
-                if fmt == mson.MONGO:
-                    # TBD:  Need to affirm these!
-                    if v > 2147483647 or v < -2147483647:
-                        emit(spcs,  "{\"$numberLong\":\"%s\"}" % v )
-                    else:
-                        emit(spcs, "%s" % v )
-                else:
-                    emit(spcs, "%s" % v )
 
+    #  Return the bytes of one doc (followed by a newline, as write()
+    #  always has) in the given mode.
+    @staticmethod
+    def encode(m, fmt):
+        if fmt == mson.PURE and _accel is not None:
+            bytes = _accelEncode(m)
+            if bytes is not None:
+                return bytes
+
+        out = []
+        _encoders.get(fmt, _encoders[mson.PURE])(m, out)
+        out.append("\n")
+        return "".join(out).encode('utf-8')
 
-            elif isinstance(v, float):
-                # Fortunately, the string formatter for
-                # doubles will add .0 upon output so you KNOW
-                # it's a double.
-                emit(spcs,  "%s" % v )
 
-# no long in python3
-#            elif isinstance(v, long):
-#                if fmt == mson.MONGO:
-#                    emit(spcs,  "{\"$numberLong\":\"%s\"}" % v )
-#                else:
-#                    emit(spcs, v)
+    #  Same as encode() but for an iterable of docs, in one call.  The
+    #  result is the concatenation of the encode() of each doc.
+    @staticmethod
+    def encodeMany(docs, fmt):
+        if fmt == mson.PURE and _accel is not None:
+            return b"".join([mson.encode(m, fmt) for m in docs])
 
+        out = []
+        enc = _encoders.get(fmt, _encoders[mson.PURE])
+        for m in docs:
+            enc(m, out)
+            out.append("\n")
+        return "".join(out).encode('utf-8')
 
-            elif isinstance(v, datetime.datetime) or isinstance(v, datetime.date):
-                #  Mongo supports pass epoch as well but
-                #  this is probably the safer route.
-                #  Just convert to ISO8601 for both...
-                # q = v.strftime('%s')  # epoach
 
-                q = v.strftime("%Y-%m-%dT%H:%M:%S")                
 
-                #  Sigh.  Must get millis from micros!
-                if isinstance(v, datetime.date):
-                    ms = 0
+#
+#  Decoder hook for MONGO mode.  Called by json.loads with every dict it
+#  decodes; returns the converted value for a recognized EJSON wrapper
+#  and the dict itself otherwise.
+#
+def _cvtLongMillisToDatetime(v):
+    millis  = v / 1000.0; # Ha!  micros are float FRACTION!
+    dv = datetime.datetime.utcfromtimestamp(millis)
+    return dv
+
+def _ejsonHook(thing):
+    n = len(thing)
+    if n > 2:
+        return thing
+
+    #  Sigh.... special case for $binary...
+    if n == 2:
+        if "$binary" in thing and "$type" in thing:
+            return Binary(base64.b64decode(thing["$binary"]))
+        return thing
+
+    for ck in thing:   # the one and only key
+        if ck[:1] != "$":
+            return thing
+
+        v = thing[ck]
+
+        if ck == "$numberInt":  # future?
+            return int(v)
+
+        elif ck == "$date":
+            #  jsonp will turn ANY numberish thing into 
+            #  an int, even 8888123123123123123 .  Yep.
+            #  is __class__ int.
+            if isinstance(v, int):
+                return _cvtLongMillisToDatetime(v)
+            else:
+                # It's a string.  If T is there go for parse:
+                if "T" in v:
+                    return parser.parse(v)
                 else:
-                    ms = v.microsecond/1000
+                    return _cvtLongMillisToDatetime(int(v))
 
-                iso8601 ="%s.%sZ" % (q,ms)
+        elif ck == "$numberLong":
+            return int(v)
 
-                #  Dates are simply too often used to force people
-                #  not in MongoDB mode to deal with the extra $date.
-                #  It's the caller's choice so... if they really want
-                #  the fidelity, ask for ejson or better yet:  bson!
-                if fmt == mson.MONGO:
-                    emit(spcs,  "{\"$date\":\"%s\"}" % iso8601)
-                else:
-                    emit(spcs, "\"%s\"" % iso8601)
+        elif ck == "$numberFloat" or ck == "$numberDouble":  # future?
+            return float(v)
+
+        elif ck == "$numberDecimal":
+            return Decimal(v)
 
+        elif ck == "$binary":
+            return Binary(base64.b64decode(v))
 
-            elif isinstance(v, ObjectId):
-                # toString of ObjectId mercifully does the right thing....
-                emit(spcs,  "{\"$oid\":\"%s\"}" % v )
+        elif ck == "$oid":
+            return ObjectId(v)
 
-            elif isinstance(v, list):
-                emit (spcs2,  "[" )
-                i = 0
-                for item in v:
-                    if i > 0:
-                        emit( spcs2, "," )
-               
-                    emitItem(lvl + 1, i, item)
-                    i = i + 1
+    return thing
 
-                emit( spcs2, "]" ) 
+_pureDecoder = json.JSONDecoder()
+_mongoDecoder = json.JSONDecoder(object_hook=_ejsonHook)
 
-            elif isinstance(v, dict):
-                emitDoc(lvl + 1, v)
 
+
+#
+#  The encoder.  Each mode has a table from exact type to a function
+#  that appends the JSON text of a value of that type onto a list of
+#  strings; the list for a doc is joined once at the end.  A type not
+#  in the table (e.g. a subclass of dict) is resolved once via the
+#  isinstance() rules below and then added to the table.
+#
+#  Strings (and keys) are escaped in one pass by the json module's
+#  (C accelerated where available) basestring encoder.
+#
+from json.encoder import encode_basestring as _quote
+
+
+def _makeEncoder(fmt):
+
+    table = {}
+
+    def resolve(v):
+        #  Order matters:  bool before int, Binary before anything else
+        #  bytes-like, and datetime is a date.
+        if isinstance(v, Binary):
+            f = encBinary
+        elif isinstance(v, Decimal) or isinstance(v, bson.decimal128.Decimal128):
+            f = encDecimal
+        elif isinstance(v, str):
+            f = encStr
+        elif isinstance(v, bool):
+            f = encBool
+        elif isinstance(v, int):
+            f = encInt
+        elif isinstance(v, float):
+            f = encFloat
+        elif isinstance(v, datetime.datetime) or isinstance(v, datetime.date):
+            f = encDate
+        elif isinstance(v, ObjectId):
+            f = encOid
+        elif isinstance(v, list) or isinstance(v, tuple):
+            f = encList
+        elif isinstance(v, dict):
+            f = encDict
+        elif isinstance(v, enum.Enum):
+            f = encEnum
+        else:
+            f = encUnknown
+
+        table[v.__class__] = f
+        return f
+
+    def encItem(v, out):
+        f = table.get(v.__class__)
+        if f is None:
+            f = resolve(v)
+        f(v, out)
+
+    def encNone(v, out):
+        out.append("null")
+
+    def encBinary(v, out):
+        q = base64.b64encode(v).decode('ascii')
+        out.append("{\"$binary\":\"%s\",\"$type\":\"00\"}" % q)
+
+    def encDecimal(v, out):
+        if fmt == mson.MONGO:
+            out.append("{\"$numberDecimal\":\"%s\"}" % v)
+        else:
+            out.append(str(v))
+
+    def encStr(v, out):
+        out.append(_quote(v))
+
+    def encBool(v, out):
+        out.append("true" if v else "false")
+
+    def encInt(v, out):
+        # TBD:  Need to affirm these!
+        if fmt == mson.MONGO and (v > 2147483647 or v < -2147483647):
+            out.append("{\"$numberLong\":\"%s\"}" % int.__repr__(v))
+        else:
+            out.append(int.__repr__(v))
+
+    def encFloat(v, out):
+        # Fortunately, the string formatter for doubles will add .0
+        # upon output so you KNOW it's a double.  Exponents are written
+        # 1e16 / 1e-7 (not 1e+16 / 1e-07) and nan and inf, which JSON
+        # cannot express, as null.
+        r = float.__repr__(v)
+        if 'e' in r:
+            (mant, exp) = r.split('e')
+            r = mant + 'e' + str(int(exp))
+        elif r[-1] in 'nf':
+            r = "null"
+        out.append(r)
+
+    def encDate(v, out):
+        #  ISO8601 with millis in both modes.  Dates are simply too often
+        #  used to force people not in MongoDB mode to deal with the
+        #  extra $date.  It's the caller's choice so... if they really
+        #  want the fidelity, ask for ejson or better yet:  bson!
+        if isinstance(v, datetime.datetime):
+            iso8601 = "%04d-%02d-%02dT%02d:%02d:%02d.%03dZ" % (
+                v.year, v.month, v.day, v.hour, v.minute, v.second, v.microsecond // 1000)
+        else:
+            iso8601 = "%04d-%02d-%02dT00:00:00.000Z" % (v.year, v.month, v.day)
+
+        if fmt == mson.MONGO:
+            out.append("{\"$date\":\"%s\"}" % iso8601)
+        else:
+            out.append("\"%s\"" % iso8601)
+
+    def encOid(v, out):
+        # toString of ObjectId mercifully does the right thing....
+        out.append("{\"$oid\":\"%s\"}" % v)
+
+    def encList(v, out):
+        out.append("[")
+        first = True
+        for item in v:
+            if first:
+                first = False
             else:
-                #  UNKNOWN type?
-                t = type(v)
-                emit(spcs,  "\"%s::%s\"" % (t,v) )
+                out.append(",")
+            f = table.get(item.__class__)
+            if f is None:
+                f = resolve(item)
+            f(item, out)
+        out.append("]")
+
+    def encDict(m, out):
+        out.append("{")
+        sep = ""
+        for k,item in m.items():
+            out.append(sep + _quote(k if k.__class__ is str else str(k)) + ":")
+            sep = ","
+            cls = item.__class__
+            if cls is str:   # by far the most common; skip the call
+                out.append(_quote(item))
+                continue
+            f = table.get(cls)
+            if f is None:
+                f = resolve(item)
+            f(item, out)
+        out.append("}")
+
+    def encUUID(v, out):
+        out.append("\"%s\"" % v)
+
+    def encEnum(v, out):
+        encItem(v.value, out)
+
+    def encUnknown(v, out):
+        out.append(_quote("%s::%s" % (type(v), v)))
+
+    table[type(None)] = encNone
+    table[Binary] = encBinary
+    table[Decimal] = encDecimal
+    table[bson.decimal128.Decimal128] = encDecimal
+    table[str] = encStr
+    table[bool] = encBool
+    table[int] = encInt
+    table[float] = encFloat
+    table[datetime.datetime] = encDate
+    table[datetime.date] = encDate
+    table[ObjectId] = encOid
+    table[uuid.UUID] = encUUID
+    table[list] = encList
+    table[tuple] = encList
+    table[dict] = encDict
+
+    return encItem
+
+
+_encoders = {
+    mson.PURE: _makeEncoder(mson.PURE),
+    mson.MONGO: _makeEncoder(mson.MONGO)
+}
 
 
-        def emitDoc(lvl, m):
-            i = 0
 
-            spcs = ""
+#
+#  Accelerated backend glue.
+#
+#  PURE mode encoding only:  the MONGO rule that ints outside 32 bits
+#  become $numberLong cannot be expressed through orjson (ints never
+#  reach the default hook) so MONGO mode always uses the encoder above.
+#
+#  orjson handles str, int, float, bool, None, dict, list, and tuple
+#  (and subclasses of str, int, dict, and list) itself, and UUID and
+#  Enum the way the pure encoder does; the rest comes to _pureDefault,
+#  which returns what the pure encoder would have written.  There is no
+#  way to have orjson hand UUID or Enum to _pureDefault, so the pure
+#  encoder follows orjson for those.  Anything orjson refuses
+#  (ints beyond 64 bits, non-str keys, too deep, ...) raises and the
+#  doc is redone by the pure encoder.
+#
+class _NotExact(Exception):
+    pass
 
-            emit( spcs, "{")
+def _pureDefault(v):
+    if isinstance(v, Binary):
+        return {"$binary": base64.b64encode(v).decode('ascii'), "$type": "00"}
 
-            for k in m:
-                item = m[k]
-                if i > 0:
-                    emit(spcs,  ",\"%s\":" % (k) )
-                else:
-                    emit(spcs,  "\"%s\":" % (k) )
+    elif isinstance(v, Decimal) or isinstance(v, bson.decimal128.Decimal128):
+        # A bare number with all its digits:  needs raw JSON
+        if hasattr(_accel, "Fragment"):
+            return _accel.Fragment(str(v))
+        raise _NotExact()
+
+    elif isinstance(v, datetime.datetime):
+        return "%04d-%02d-%02dT%02d:%02d:%02d.%03dZ" % (
+            v.year, v.month, v.day, v.hour, v.minute, v.second, v.microsecond // 1000)
+
+    elif isinstance(v, datetime.date):
+        return "%04d-%02d-%02dT00:00:00.000Z" % (v.year, v.month, v.day)
+
+    elif isinstance(v, ObjectId):
+        return {"$oid": str(v)}
+
+    #  Subclasses orjson leaves alone (numpy.float64, namedtuples)
+    elif isinstance(v, float):
+        return float(v)
 
-                emitItem(lvl + 1, i, item)
-                i = i + 1
+    elif isinstance(v, tuple):
+        return list(v)
 
-            emit(spcs,  "}")
+    return "%s::%s" % (type(v), v)
 
 
-            if lvl == 0:
-                #ostream.write("\n")
-                emit("", "\n")
+def _accelEncode(m):
+    try:
+        return _accel.dumps(m, default=_pureDefault,
+                            option=_accel.OPT_PASSTHROUGH_DATETIME |
+                                   _accel.OPT_PASSTHROUGH_DATACLASS |
+                                   _accel.OPT_APPEND_NEWLINE)
+    except TypeError:   # orjson.JSONEncodeError is a TypeError
+        return None
 
-         #print ""   # force the CR
 
-        emitDoc(0, m)
+#  orjson.loads turns integers beyond 64 bits into floats where
+#  json.loads keeps them exact, so text with long digit runs is left to
+#  json.loads, as is anything orjson rejects (NaN, lone surrogates, ...)
+_longDigits = re.compile(r'[0-9]{19}')
 
+def _loads(strval):
+    if _accel is not None and _longDigits.search(strval) is None:
+        try:
+            return _accel.loads(strval)
+        except ValueError:   # orjson.JSONDecodeError is a ValueError
+            pass
+    return json.loads(strval)
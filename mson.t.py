@@ -105,3 +105,47 @@ for s in [
 
 
 
+
+
+#  Not just shown but checked:  what MONGO mode makes of $numberLong and
+#  of $date in the canonical {"$date":{"$numberLong":...}} form, and that
+#  the top-level value itself is never converted (its contents are),
+#  with each backend there is.
+import datetime
+
+bad = 0
+
+def check(what, got, expect):
+    global bad
+    if repr(got) != repr(expect):
+        bad += 1
+        print("FAIL", what, repr(got), "expected", repr(expect))
+
+when = datetime.datetime(2017, 1, 28, 21, 47, 46, 333000)
+
+for backend in ("pure", "orjson"):
+    try:
+        mson.setBackend(backend)
+    except ImportError:
+        continue
+
+    for (s, mode, expect) in [
+        ('{"n":{"$numberLong":"8888123123123123123"}}', mson.MONGO, {"n": 8888123123123123123}),
+        ('{"n":{"$numberLong":"-22"}}', mson.MONGO, {"n": -22}),
+        ('{"n":[{"$numberLong":"1"}, {"x":{"$numberLong":"2"}}]}', mson.MONGO, {"n": [1, {"x": 2}]}),
+        ('{"n":{"$numberLong":"22"}}', mson.PURE, {"n": {"$numberLong": "22"}}),
+        ('{"d":{"$date":{"$numberLong":"1485640066333"}}}', mson.MONGO, {"d": when}),
+        ('{"d":{"$date":{"$numberLong":"-1000"}}}', mson.MONGO, {"d": datetime.datetime(1969, 12, 31, 23, 59, 59)}),
+        ('{"d":{"$date":{"$numberLong":"1485640066333"}}}', mson.PURE, {"d": {"$date": {"$numberLong": "1485640066333"}}}),
+        ('{"$numberLong":"22"}', mson.MONGO, {"$numberLong": "22"}),
+        ('{"$date":1485640066333}', mson.MONGO, {"$date": 1485640066333}),
+        ('{"$date":{"$numberLong":"1485640066333"}}', mson.MONGO, {"$date": {"$numberLong": "1485640066333"}}),
+        ('[{"$numberLong":"22"}, {"$date":{"$numberLong":"1485640066333"}}]', mson.MONGO, [22, when]),
+        ]:
+        check("%s: parse %s mode %d" % (backend, s, mode), mson.parse(s, mode), expect)
+
+    doc = {"n": 8888123123123123123, "m": -2**40, "small": 22}
+    check("%s: MONGO round trip" % backend, mson.parse(mson.encode(doc, mson.MONGO).decode(), mson.MONGO), doc)
+
+print("%d failures" % bad)
+sys.exit(1 if bad > 0 else 0)
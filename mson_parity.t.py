@@ -0,0 +1,208 @@
+#
+#  Backend parity:  every input below is parsed (PURE and MONGO) and the
+#  results encoded (PURE and MONGO) with the pure python backend and
+#  with the accelerated backend; the docs and the bytes must be
+#  identical.  Exits non-zero on any difference.
+#
+#  python3 mson_parity.t.py
+#
+import sys
+import datetime
+import collections
+import dataclasses
+import enum
+import uuid
+from decimal import Decimal
+
+import bson
+from bson.objectid import ObjectId
+from bson.binary import Binary
+
+from mson import mson
+
+
+if mson.backend == "pure":
+    try:
+        mson.setBackend("orjson")
+        mson.setBackend("pure")
+    except ImportError:
+        print("no accelerated backend installed; nothing to compare")
+        sys.exit(0)
+
+
+texts = [
+
+"""
+{"a":"\\"quoted\\" and 'quoted'"}
+"""
+,
+"""
+{"a":"foo", "K_int":3, "K_dbl":3.0, "z":{"z1":{"z2":22}}}
+"""
+,
+"""
+{
+"typeLong1":8888123123123123123,
+"typeStr2":"8888123123123123123",
+"typeLong3":{"$numberLong":"8888123123123123123"},
+"K_int":3, "K_dbl":3.0, "z":{"z1":{"z2":{"$numberLong":"22"}}}
+}
+"""
+,
+"""
+{
+        "d_iso": {"$date":"2017-01-28T21:47:46.333"},
+     "d_iso_wZ": {"$date":"2017-01-28T21:47:46.333Z"},
+    "d_str_int": {"$date": "1485640066333"},
+  "d_plain_int": {"$date": 1485640066333}
+}
+"""
+,
+"""
+{"type_list":[  {"$date":"2015-09-27T22:31:58.542Z"}, 34, "A" ] }
+"""
+,
+"""
+{"type_binary": {"$binary":"c29tZXRoaW5n","$type":"00"}}
+"""
+,
+"""
+{"dbl": 13.0, "int": 13, "exp": 1e16, "tiny": 1e-7, "neg": -0.0}
+"""
+,
+"""
+{
+"type_long": 44444444444444444
+,"type_2_31": 2147483648
+,"type_2_31_min1": 2147483647
+,"type_neg_2_31": -2147483648
+,"type_huge": 123456789012345678901234567890
+,"type_date": "2017-01-28T21:47:46.333"
+,"type_date_M": {"$date":"2017-01-28T21:47:46.333"}
+,"type_decimal": 99999999999.99
+,"type_numdec": {"$numberDecimal":"99999999999999999999.99"}
+,"type_oid": {"$oid":"5a0000000000000000000000"}
+}
+"""
+,
+"""
+{"ctl": "a\\u0001b\\tc\\nd", "uni": "héllo   \\ud83d\\ude00", "t": true, "f": false, "n": null}
+"""
+,
+"""
+{"nan": NaN, "list": [[[[{"deep": [1, 2.5, "x"]}]]]]}
+"""
+,
+"""
+{"nl": {"$numberLong":"9223372036854775807"}, "nlNeg": {"$numberLong":"-9223372036854775808"},
+ "nlList": [{"$numberLong":"1"}, {"$numberLong":"-2"}],
+ "d_canon": {"$date":{"$numberLong":"1485640066333"}}, "d_canonNeg": {"$date":{"$numberLong":"-1000"}}}
+"""
+,
+"""
+{"$date":{"$numberLong":"1485640066333"}}
+"""
+,
+"""
+{"$numberLong":"22"}
+"""
+,
+"""
+[{"$numberLong":"22"}, {"$date":{"$numberLong":"1485640066333"}}]
+"""
+]
+
+
+dd = datetime.datetime(2018,1,1,12,30,45,123456)
+
+
+class Color(enum.Enum):
+    RED = 1
+    BLUE = "blue"
+
+class Level(enum.IntEnum):
+    HIGH = 3
+
+class Name(str, enum.Enum):
+    BOB = "bob"
+
+class Meters(float):   # e.g. numpy.float64
+    pass
+
+Point = collections.namedtuple("Point", "x y")
+
+@dataclasses.dataclass
+class Item:
+    sku: str = "a1"
+    qty: int = 2
+
+docs = [
+    {   # minisvc.Func1.makeDoc
+        "name":"buzz",
+        "addr":{"city":"NY","state":"NY","zip":"07078","loc":{"n":"139","s":"W82 St."}},
+        "num":3,
+        "CR": "hello\nand\n\tgoodbye\nforever",
+        "quotes": [ '"yow"' , "hawai'i" ],
+        "whatevs": { "fpets": [ "dog","cat", 3, dd] },
+        "someDouble":11.11,
+        "date":dd,
+        "bson128_amt":bson.decimal128.Decimal128("23.7")
+    },
+    {"dec": Decimal("1.10"), "bin": Binary(b"\x00\x01xyz"), "oid": ObjectId("5a0000000000000000000000"),
+     "day": datetime.date(2020,2,29), "tup": (1, "two", 3.0), "od": collections.OrderedDict([("z",1),("a",2)])},
+    {"floats": [float('nan'), float('inf'), -float('inf'), 1.5e300, 5e-324, 123456789012345678.0]},
+    {"ints": [2**31, -2**31, 2**63, 2**64, -2**70], "b": [True, False, None]},
+    {1: "int key", "ok": "str key"},
+    {"t": datetime.time(12, 0), "s": set([1])},
+    {"uuid": uuid.UUID("12345678-1234-5678-1234-567812345678"), "uuids": [uuid.UUID(int=0)]},
+    {"enum": Color.RED, "enumStr": Color.BLUE, "intEnum": Level.HIGH, "strEnum": Name.BOB, "keys": {"x": [Color.RED]}},
+    {"floatSub": Meters(2.5), "nanSub": Meters("nan"), "point": Point(1, "two"), "points": [Point(Meters(1.5), None)]},
+    {"dataclass": Item(), "items": [Item("b2", 5)]}
+]
+
+
+bad = 0
+
+def same(what, f):
+    global bad
+    mson.setBackend("pure")
+    try:
+        r1 = f()
+    except Exception as e:
+        r1 = "raised %s" % type(e).__name__
+    mson.setBackend("orjson")
+    try:
+        r2 = f()
+    except Exception as e:
+        r2 = "raised %s" % type(e).__name__
+    mson.setBackend("pure")
+
+    # nan != nan; compare the repr of parsed docs
+    if repr(r1) != repr(r2):
+        bad += 1
+        print("DIFF", what)
+        print("  pure:  ", r1)
+        print("  orjson:", r2)
+    return r1
+
+
+n = 0
+for s in texts:
+    for pmode in (mson.PURE, mson.MONGO):
+        doc = same("parse #%d mode %d" % (n, pmode), lambda: mson.parse(s, pmode))
+        if isinstance(doc, dict):
+            docs.append(doc)
+    n += 1
+
+n = 0
+for doc in docs:
+    for fmt in (mson.PURE, mson.MONGO):
+        same("encode #%d fmt %d" % (n, fmt), lambda: mson.encode(doc, fmt))
+    n += 1
+
+for fmt in (mson.PURE, mson.MONGO):
+    same("encodeMany fmt %d" % fmt, lambda: mson.encodeMany(docs[0:6], fmt))
+
+
+print("%d differences" % bad)
+sys.exit(1 if bad > 0 else 0)